@@ -0,0 +1,87 @@
+
+# app/catalog_cache.py
+# Cache em processo das respostas do catálogo (JSON já serializado) com ETag.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional
+
+
+class CacheEntry(NamedTuple):
+    version: int
+    etag: str
+    body: bytes
+    expires_at: float
+
+
+class CatalogCache:
+    """
+    - Chave = endpoint + parâmetros da consulta; valor = corpo JSON pronto + ETag.
+    - bump() (após create/update de produto ou categoria) invalida tudo de uma vez.
+    - O ETag é o hash do corpo: com vários workers, cada processo tem seu próprio cache,
+      e após `ttl` segundos a entrada é recarregada — se nada mudou, o ETag é o mesmo.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self) -> int:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            return self.version
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != self.version or entry.expires_at < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], bytes]) -> CacheEntry:
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        version = self.version  # lido antes da carga: se houver bump no meio, não guarda
+        body = loader()
+        entry = CacheEntry(
+            version=version,
+            etag='"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"',
+            body=body,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
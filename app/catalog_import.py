@@ -0,0 +1,363 @@
+
+# app/catalog_import.py
+# Importação do cardápio a partir de planilha (XLSX/CSV), linha a linha e em lotes:
+# - XLSX em modo read-only (openpyxl), CSV lido em streaming (csv.reader).
+# - Cada lote faz upsert por SKU de Category, Product e StockItem com poucos comandos.
+# - Erros de validação são devolvidos por linha; as linhas válidas seguem sendo gravadas.
+# - Arquivo que quebra no meio (encoding): os lotes já lidos ficam gravados e o resultado
+#   parcial volta com `format_error`.
+import csv
+import io
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.db_utils import upsert_insert
+from app.models import Category, Product, StockItem
+from app.search import normalize_text
+from app.stock_ops import insert_movements, opening_movement
+
+# cabeçalho da planilha (sem acento, minúsculo) -> campo interno
+HEADER_ALIASES: Dict[str, str] = {
+    "sku": "sku", "codigo": "sku", "code": "sku",
+    "name": "name", "nome": "name", "produto": "name",
+    "description": "description", "descricao": "description",
+    "category": "category", "categoria": "category",
+    "price": "price", "preco": "price", "preco_venda": "price",
+    "cost": "cost", "custo": "cost",
+    "active": "active", "ativo": "active",
+    "unit": "unit", "unidade": "unit",
+    "initial_qty": "initial_qty", "quantity": "initial_qty", "quantidade": "initial_qty", "estoque": "initial_qty",
+    "min_quantity": "min_quantity", "estoque_minimo": "min_quantity",
+}
+REQUIRED_COLUMNS = ("sku", "name", "price")
+PRODUCT_FIELDS = ("name", "description", "price", "cost", "active")
+
+_TRUE = {"1", "true", "sim", "s", "yes", "y", "x", "ativo"}
+_FALSE = {"0", "false", "nao", "n", "no", "inativo"}
+
+
+class ImportFormatError(ValueError):
+    """Arquivo ilegível ou sem as colunas obrigatórias (erro do arquivo inteiro, não de uma linha)."""
+
+
+class RowError(ValueError):
+    pass
+
+
+# -------------------------------------------------------------------------
+# Leitura
+# -------------------------------------------------------------------------
+def _map_header(raw: Tuple) -> List[Optional[str]]:
+    header = []
+    for cell in raw:
+        key = normalize_text(str(cell or "")).strip().replace(" ", "_")
+        header.append(HEADER_ALIASES.get(key))
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ImportFormatError(f"Colunas obrigatórias ausentes: {', '.join(missing)}")
+    return header
+
+
+def _rows(values: Iterator[Tuple], first_line: int) -> Iterator[Tuple[int, Dict[str, object]]]:
+    header: Optional[List[Optional[str]]] = None
+    for line, raw in enumerate(values, start=first_line):
+        if header is None:
+            header = _map_header(raw)
+            continue
+        if not any(v not in (None, "") for v in raw):
+            continue  # linha em branco
+        yield line, {key: value for key, value in zip(header, raw) if key}
+
+
+def iter_xlsx(fileobj: IO[bytes]) -> Iterator[Tuple[int, Dict[str, object]]]:
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as exc:  # zip/xml inválido
+        raise ImportFormatError(f"Planilha XLSX inválida: {exc}") from exc
+    try:
+        yield from _rows(wb.active.iter_rows(values_only=True), first_line=1)
+    finally:
+        wb.close()
+
+
+def iter_csv(fileobj: IO[bytes], encoding: str = "utf-8-sig") -> Iterator[Tuple[int, Dict[str, object]]]:
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline="")
+    try:
+        # a amostra do sniffer também decodifica: fica dentro do mesmo tratamento de encoding
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from _rows(csv.reader(text, dialect), first_line=1)
+    except UnicodeDecodeError as exc:
+        raise ImportFormatError(
+            f"Arquivo CSV não está em {encoding} (exportação do Excel: tente encoding=latin-1)"
+        ) from exc
+    finally:
+        text.detach()  # não fecha o arquivo do upload
+
+
+def iter_spreadsheet(filename: str, fileobj: IO[bytes], encoding: str = "utf-8-sig"):
+    name = (filename or "").lower()
+    if name.endswith(".xlsx") or name.endswith(".xlsm"):
+        return iter_xlsx(fileobj)
+    if name.endswith(".csv") or name.endswith(".txt"):
+        return iter_csv(fileobj, encoding)
+    raise ImportFormatError("Formato não suportado (use .csv ou .xlsx)")
+
+
+# -------------------------------------------------------------------------
+# Conversão de uma linha
+# -------------------------------------------------------------------------
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # SKU numérico vindo do Excel (123.0)
+    value = str(value).strip()
+    return value or None
+
+
+def _number(value, field: str) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    s = str(value).strip().replace("R$", "").replace(" ", "")
+    if "," in s:  # formato brasileiro: 1.234,56
+        s = s.replace(".", "").replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        raise RowError(f"{field} inválido: {value!r}")
+
+
+def _bool(value) -> Optional[bool]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    s = normalize_text(str(value)).strip()
+    if s in _TRUE:
+        return True
+    if s in _FALSE:
+        return False
+    raise RowError(f"active inválido: {value!r}")
+
+
+def parse_row(raw: Dict[str, object]) -> dict:
+    sku = _text(raw.get("sku"))
+    name = _text(raw.get("name"))
+    if not sku:
+        raise RowError("sku obrigatório")
+    if len(sku) > 64:
+        raise RowError("sku com mais de 64 caracteres")
+    if not name:
+        raise RowError("name obrigatório")
+    if len(name) > 160:
+        raise RowError("name com mais de 160 caracteres")
+    price = _number(raw.get("price"), "price")
+    if price is None or price < 0:
+        raise RowError("price obrigatório e >= 0")
+    active = _bool(raw.get("active"))
+    category = _text(raw.get("category"))
+    if category and len(category) > 120:
+        raise RowError("category com mais de 120 caracteres")
+    unit = (_text(raw.get("unit")) or "UN").upper()
+    if len(unit) > 10:
+        raise RowError("unit com mais de 10 caracteres")
+    return {
+        "sku": sku,
+        "name": name,
+        "description": _text(raw.get("description")),
+        "category": category,
+        "price": price,
+        "cost": _number(raw.get("cost"), "cost"),
+        "active": True if active is None else active,
+        "unit": unit,
+        "initial_qty": _number(raw.get("initial_qty"), "initial_qty") or 0.0,
+        "min_quantity": _number(raw.get("min_quantity"), "min_quantity") or 0.0,
+    }
+
+
+# -------------------------------------------------------------------------
+# Gravação em lotes
+# -------------------------------------------------------------------------
+class CatalogImporter:
+    """
+    Consome as linhas em lotes de `chunk_size`; cada lote é uma transação com:
+    1 upsert de categorias + 1 SELECT de ids, 1 SELECT de SKUs existentes,
+    1 upsert de produtos (RETURNING id), 1 SELECT de itens de estoque existentes
+    e 1 upsert de itens de estoque.
+    Colunas ausentes no arquivo não sobrescrevem o valor já gravado;
+    a quantidade só é usada para itens de estoque novos (como no POST /products),
+    com o movimento de saldo inicial correspondente.
+    SKU repetido no arquivo (no mesmo lote ou em lotes diferentes): a última linha vence
+    e a anterior volta como erro.
+    """
+
+    def __init__(self, db: Session, chunk_size: int = 1000, max_errors: int = 1000):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.insert = upsert_insert(db)
+        self.category_ids: Dict[str, int] = {}
+        self.columns: set = set()
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self.format_error: Optional[str] = None
+        # SKU -> (linha, criado por esta importação) dos lotes já gravados
+        self.seen: Dict[str, Tuple[int, bool]] = {}
+
+    def run(self, rows: Iterator[Tuple[int, Dict[str, object]]]) -> dict:
+        """
+        Grava as linhas lidas; ImportFormatError antes da primeira linha é propagado (nada foi gravado).
+        Se o arquivo quebrar depois, grava o que já foi lido e devolve o resultado com `format_error`.
+        """
+        chunk: Dict[str, Tuple[int, dict]] = {}
+        last_line = 0
+        try:
+            for line, raw in rows:
+                last_line = line
+                self.columns.update(raw)
+                self.processed += 1
+                try:
+                    row = parse_row(raw)
+                except RowError as exc:
+                    self._error(line, _text(raw.get("sku")), str(exc))
+                    continue
+                previous = chunk.get(row["sku"])
+                if previous is not None:
+                    # SKU repetido no lote: a última linha vence e a anterior volta como erro
+                    self._error(previous[0], row["sku"], f"SKU repetido no arquivo (substituído pela linha {line})")
+                chunk[row["sku"]] = (line, row)
+                if len(chunk) >= self.chunk_size:
+                    self._flush(chunk)
+                    chunk = {}
+        except ImportFormatError as exc:
+            if not self.processed:
+                raise
+            self.format_error = f"{exc}; importação interrompida após a linha {last_line}"
+        if chunk:
+            self._flush(chunk)
+        return self.result()
+
+    def result(self) -> dict:
+        return {
+            "processed": self.processed,
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "format_error": self.format_error,
+        }
+
+    def _error(self, line: int, sku: Optional[str], message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": line, "sku": sku, "error": message})
+
+    def _flush(self, chunk: Dict[str, Tuple[int, dict]]) -> None:
+        try:
+            created = self._write(chunk)
+            self.db.commit()
+        except SQLAlchemyError as exc:
+            self.db.rollback()
+            self.category_ids.clear()  # ids inseridos no lote desfeito não existem mais
+            message = f"Erro ao gravar o lote: {exc.__class__.__name__}"
+            for line, row in chunk.values():
+                self._error(line, row["sku"], message)
+            return
+
+        for line, row in chunk.values():
+            sku = row["sku"]
+            previous = self.seen.get(sku)
+            if previous is not None:
+                # repetido de um lote anterior: é o mesmo produto, contado uma vez só
+                previous_line, is_new = previous
+                if is_new:
+                    self.created -= 1
+                else:
+                    self.updated -= 1
+                self._error(previous_line, sku, f"SKU repetido no arquivo (substituído pela linha {line})")
+            else:
+                is_new = sku in created
+            if is_new:
+                self.created += 1
+            else:
+                self.updated += 1
+            self.seen[sku] = (line, is_new)
+
+    def _write(self, chunk: Dict[str, Tuple[int, dict]]) -> set:
+        """Grava o lote (sem commit) e devolve os SKUs de produtos novos."""
+        db, insert = self.db, self.insert
+        rows = [row for _, row in chunk.values()]
+
+        # categorias por nome
+        if "category" in self.columns:
+            new_names = {r["category"] for r in rows if r["category"]} - self.category_ids.keys()
+            if new_names:
+                db.execute(
+                    insert(Category).on_conflict_do_nothing(index_elements=["name"]),
+                    [{"name": n, "active": True} for n in new_names],
+                )
+                found = db.execute(select(Category.name, Category.id).where(Category.name.in_(new_names)))
+                self.category_ids.update(found.all())
+
+        existing = set(db.scalars(select(Product.sku).where(Product.sku.in_(list(chunk)))))
+
+        product_rows = []
+        for r in rows:
+            values = {field: r[field] for field in PRODUCT_FIELDS}
+            values["sku"] = r["sku"]
+            values["category_id"] = self.category_ids.get(r["category"]) if r["category"] else None
+            product_rows.append(values)
+        update_cols = [c for c in PRODUCT_FIELDS if c in self.columns or c in REQUIRED_COLUMNS]
+        if "category" in self.columns:
+            update_cols.append("category_id")
+        stmt = insert(Product)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["sku"],
+            set_={c: stmt.excluded[c] for c in update_cols},
+        ).returning(Product.id, Product.sku)
+        product_ids = {sku: pid for pid, sku in db.execute(stmt, product_rows)}
+
+        stock_rows = [
+            {
+                "product_id": product_ids[r["sku"]],
+                "unit": r["unit"],
+                "quantity": r["initial_qty"],
+                "min_quantity": r["min_quantity"],
+            }
+            for r in rows
+        ]
+        stmt = insert(StockItem)
+        stock_update = {c: stmt.excluded[c] for c in ("unit", "min_quantity") if c in self.columns}
+        if stock_update:
+            stock_update["version"] = StockItem.version + 1
+            stmt = stmt.on_conflict_do_update(index_elements=["product_id"], set_=stock_update)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["product_id"])
+        # produto já existente pode não ter item de estoque: o insert abaixo também o cria
+        with_stock = set(db.scalars(
+            select(StockItem.product_id).where(StockItem.product_id.in_(list(product_ids.values())))
+        ))
+        db.execute(stmt, stock_rows)
+        # saldo inicial para cada item de estoque novo, como no POST /products
+        openings = [
+            opening_movement(product_ids[r["sku"]], r["initial_qty"], "IMPORT")
+            for r in rows if product_ids[r["sku"]] not in with_stock
+        ]
+        insert_movements(db, [m for m in openings if m])
+        return set(chunk) - existing
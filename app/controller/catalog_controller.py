@@ -1,9 +1,18 @@
 
-from fastapi import APIRouter, HTTPException, Query, status
-from pydantic import BaseModel, Field, conlist
-from typing import Optional, List
+import asyncio
+import os
+from fastapi import APIRouter, File, HTTPException, Query, Request, Response, UploadFile, status
+from pydantic import BaseModel, Field, TypeAdapter, conlist
+from typing import Callable, Hashable, Optional, List
+from sqlalchemy import case, select, update
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from app.catalog_cache import CatalogCache, etag_matches
+from app.catalog_import import CatalogImporter, ImportFormatError, iter_spreadsheet
+from app.menu import MenuDocument
 from app.models import SessionLocal, Category, Product, StockItem
+from app.search import apply_search
+from app.stock_ops import insert_movements, opening_movement
 
 router = APIRouter(tags=["Catalog"])
 
@@ -42,9 +51,61 @@ class ProductOut(BaseModel):
     class Config:
         from_attributes = True
 
+class ImportRowError(BaseModel):
+    row: int
+    sku: Optional[str]
+    error: str
+
+class ImportResultOut(BaseModel):
+    processed: int
+    created: int
+    updated: int
+    failed: int
+    errors: List[ImportRowError]
+    errors_truncated: bool
+    format_error: Optional[str] = None  # arquivo quebrou no meio: só as linhas anteriores foram gravadas
+
+class ProductBulkPatchItem(BaseModel):
+    sku: str = Field(..., min_length=1, max_length=64)
+    price: Optional[float] = Field(None, ge=0)
+    cost: Optional[float] = None  # enviar null explicitamente limpa o custo
+    active: Optional[bool] = None
+
+class ProductBulkPatchOut(BaseModel):
+    updated: int
+    not_found: List[str]
+
+BULK_PATCH_CHUNK = 500  # SKUs por UPDATE (limite de parâmetros do SQLite)
+
 def _db() -> Session:
     return SessionLocal()
 
+# Cache das leituras do catálogo (invalidado em create/update de produto e categoria)
+catalog_cache = CatalogCache(
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+)
+# Cardápio completo pré-serializado (reconstruído em background quando o catálogo/estoque muda)
+menu_document = MenuDocument(
+    SessionLocal,
+    debounce=float(os.getenv("MENU_REBUILD_DEBOUNCE", "0.3")),
+    refresh=float(os.getenv("MENU_REFRESH_SECONDS", "60")),
+)
+_categories_json = TypeAdapter(List[CategoryOut])
+_products_json = TypeAdapter(List[ProductOut])
+_product_json = TypeAdapter(ProductOut)
+
+def _to_json(adapter: TypeAdapter, obj) -> bytes:
+    return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+
+def _cached_response(request: Request, key: Hashable, loader: Callable[[], bytes]) -> Response:
+    """Serve do cache; If-None-Match igual ao ETag -> 304 sem consultar o banco."""
+    entry = catalog_cache.get_or_load(key, loader)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
 # Category endpoints
 @router.post("/categories", response_model=CategoryOut, status_code=status.HTTP_201_CREATED)
 def create_category(payload: CategoryIn):
@@ -54,20 +115,23 @@ def create_category(payload: CategoryIn):
             raise HTTPException(409, "Categoria já existe")
         c = Category(**payload.model_dump())
         db.add(c); db.commit(); db.refresh(c)
+        catalog_cache.bump()
         return c
     finally:
         db.close()
 
 @router.get("/categories", response_model=List[CategoryOut])
-def list_categories(active: Optional[bool] = None):
-    db = _db()
-    try:
-        q = db.query(Category)
-        if active is not None:
-            q = q.filter(Category.active == active)
-        return q.order_by(Category.name.asc()).all()
-    finally:
-        db.close()
+def list_categories(request: Request, active: Optional[bool] = None):
+    def load() -> bytes:
+        db = _db()
+        try:
+            q = db.query(Category)
+            if active is not None:
+                q = q.filter(Category.active == active)
+            return _to_json(_categories_json, q.order_by(Category.name.asc()).all())
+        finally:
+            db.close()
+    return _cached_response(request, ("categories", active), load)
 
 # Product endpoints
 @router.post("/products", response_model=ProductOut, status_code=status.HTTP_201_CREATED)
@@ -96,44 +160,119 @@ def create_product(payload: ProductIn):
                 min_quantity=float(payload.min_quantity)
             )
             db.add(si)
+            opening = opening_movement(p.id, payload.initial_qty)
+            if opening:
+                insert_movements(db, [opening])
 
         db.commit(); db.refresh(p)
+        catalog_cache.bump()
         return p
     finally:
         db.close()
 
+@router.post("/products/import", response_model=ImportResultOut)
+def import_products(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(1000, ge=50, le=5000),
+    encoding: str = Query("utf-8-sig"),
+):
+    """
+    Importa/atualiza produtos por SKU a partir de .xlsx ou .csv (colunas: sku, name, price e,
+    opcionalmente, description, category, cost, active, unit, initial_qty, min_quantity).
+    O arquivo é lido em streaming e gravado em lotes; linhas inválidas voltam em `errors`.
+    Arquivo ilegível desde o início: 400. Se quebrar no meio, o que já foi lido fica gravado
+    e a resposta traz `format_error`.
+    """
+    db = _db()
+    try:
+        importer = CatalogImporter(db, chunk_size=chunk_size)
+        try:
+            result = importer.run(iter_spreadsheet(file.filename, file.file, encoding))
+        except (ImportFormatError, LookupError) as exc:  # LookupError: encoding desconhecido
+            raise HTTPException(400, str(exc))
+        finally:
+            if importer.created or importer.updated:
+                catalog_cache.bump()
+        return result
+    finally:
+        db.close()
+
 @router.get("/products", response_model=List[ProductOut])
 def list_products(
+    request: Request,
     search: Optional[str] = Query(None),
     active: Optional[bool] = None,
     category_id: Optional[int] = None,
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
 ):
+    def load() -> bytes:
+        db = _db()
+        try:
+            q = db.query(Product)
+            if search:
+                q = apply_search(q, "products", search)  # ordena por relevância
+            if active is not None:
+                q = q.filter(Product.active == active)
+            if category_id:
+                q = q.filter(Product.category_id == category_id)
+            return _to_json(_products_json, q.order_by(Product.name.asc()).offset(offset).limit(limit).all())
+        finally:
+            db.close()
+    return _cached_response(request, ("products", search, active, category_id, limit, offset), load)
+
+@router.patch("/products/bulk", response_model=ProductBulkPatchOut)
+def bulk_patch_products(items: conlist(ProductBulkPatchItem, min_length=1, max_length=20000)):
+    """
+    Atualiza preço/custo/ativo de vários produtos por SKU numa única transação.
+    Cada lote vira um UPDATE ... SET col = CASE sku WHEN ... END WHERE sku IN (...);
+    SKU repetido na lista: vale a última ocorrência.
+    """
+    patches = {}
+    for item in items:
+        fields = {f: getattr(item, f) for f in ("price", "cost", "active") if f in item.model_fields_set}
+        if any(f in fields and fields[f] is None for f in ("price", "active")):
+            raise HTTPException(422, f"SKU {item.sku}: price e active não podem ser nulos")
+        patches[item.sku] = fields
+
     db = _db()
     try:
-        q = db.query(Product)
-        if search:
-            like = f"%{search}%"
-            q = q.filter((Product.name.ilike(like)) | (Product.sku.ilike(like)))
-        if active is not None:
-            q = q.filter(Product.active == active)
-        if category_id:
-            q = q.filter(Product.category_id == category_id)
-        return q.order_by(Product.name.asc()).offset(offset).limit(limit).all()
+        skus = list(patches)
+        found = set()
+        for i in range(0, len(skus), BULK_PATCH_CHUNK):
+            chunk = skus[i:i + BULK_PATCH_CHUNK]
+            found.update(db.scalars(select(Product.sku).where(Product.sku.in_(chunk))))
+            values = {}
+            for field in ("price", "cost", "active"):
+                whens = {sku: patches[sku][field] for sku in chunk if field in patches[sku]}
+                if whens:
+                    column = getattr(Product, field)
+                    values[field] = case(whens, value=Product.sku, else_=column)
+            if values:
+                db.execute(
+                    update(Product).where(Product.sku.in_(chunk)).values(**values),
+                    execution_options={"synchronize_session": False},
+                )
+        db.commit()
+        updated = sum(1 for sku in found if patches[sku])
+        if updated:
+            catalog_cache.bump()
+        return ProductBulkPatchOut(updated=updated, not_found=[sku for sku in skus if sku not in found])
     finally:
         db.close()
 
 @router.get("/products/{product_id}", response_model=ProductOut)
-def get_product(product_id: int):
-    db = _db()
-    try:
-        p = db.query(Product).filter(Product.id == product_id).first()
-        if not p:
-            raise HTTPException(404, "Produto não encontrado")
-        return p
-    finally:
-        db.close()
+def get_product(request: Request, product_id: int):
+    def load() -> bytes:
+        db = _db()
+        try:
+            p = db.query(Product).filter(Product.id == product_id).first()
+            if not p:
+                raise HTTPException(404, "Produto não encontrado")
+            return _to_json(_product_json, p)
+        finally:
+            db.close()
+    return _cached_response(request, ("product", product_id), load)
 
 @router.patch("/products/{product_id}", response_model=ProductOut)
 def update_product(product_id: int, patch: ProductIn):
@@ -161,7 +300,36 @@ def update_product(product_id: int, patch: ProductIn):
         if si:
             si.unit = data.get("unit", si.unit)
             si.min_quantity = float(data.get("min_quantity", si.min_quantity))
-        db.commit(); db.refresh(p)
+        try:
+            db.commit()
+        except StaleDataError:
+            # StockItem.version mudou desde a leitura (reserva, baixa ou ajuste de estoque)
+            db.rollback()
+            raise HTTPException(409, "Estoque alterado por outra requisição, tente novamente")
+        db.refresh(p)
+        catalog_cache.bump()
         return p
     finally:
         db.close()
+
+@router.get("/menu")
+async def get_menu(request: Request):
+    """
+    Cardápio para a vitrine: categorias ativas -> produtos ativos -> in_stock, num único documento.
+    Servido da memória; só a primeira chamada após o start (antes do build inicial) consulta o banco.
+    """
+    if menu_document.body is None:
+        await asyncio.to_thread(menu_document.ensure_built)
+    body, etag = menu_document.body, menu_document.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/menu/metrics")
+def menu_metrics():
+    return menu_document.metrics()
+
+@router.get("/catalog/cache/metrics")
+def catalog_cache_metrics():
+    return catalog_cache.metrics()
@@ -1,9 +1,14 @@
 
-from fastapi import APIRouter, HTTPException, Query, status
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+import os
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from pydantic import BaseModel, Field, EmailStr, TypeAdapter
+from typing import Dict, Optional, List
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
+from app.catalog_cache import CatalogCache, etag_matches
 from app.models import SessionLocal, Customer
+from app.search import apply_search
+from app import customer_identity
 
 router = APIRouter(tags=["Customers"])
 
@@ -28,22 +33,144 @@ class CustomerOut(CustomerIn):
 class CustomerUpdate(CustomerIn):
     name: Optional[str] = None
 
+class DuplicateGroupOut(BaseModel):
+    customer_ids: List[int]
+    keys: Dict[str, List[str]]  # chave normalizada compartilhada, por tipo (document/phone/email)
+    customers: List[CustomerOut]
+
+class DuplicatesOut(BaseModel):
+    groups: int
+    customers: int
+    results: List[DuplicateGroupOut]
+
 def _db() -> Session:
     return SessionLocal()
 
+# Busca exata por telefone/documento/e-mail (entrada de pedidos): LRU em processo, invalidado em
+# qualquer escrita de cliente; com vários workers, o TTL limita a defasagem entre processos.
+lookup_cache = CatalogCache(
+    maxsize=int(os.getenv("CUSTOMER_LOOKUP_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("CUSTOMER_LOOKUP_CACHE_TTL", "30")),
+)
+_customers_json = TypeAdapter(List[CustomerOut])
+
+def _identity_filter(term: str):
+    """Termo que é e-mail, CPF/CNPJ ou telefone: igualdade na chave indexada (None = busca textual)."""
+    if "@" in term:
+        return customer_identity.key_column("email") == customer_identity.email_key(term)
+    if any(ch.isalpha() for ch in term):
+        return None
+    document = customer_identity.document_key(term)
+    phone = customer_identity.phone_key(term)
+    conditions = []
+    if document:
+        conditions.append(customer_identity.key_column("document") == document)
+    if phone:
+        conditions.append(customer_identity.key_column("phone") == phone)
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else conditions[0] | conditions[1]
+
+def _partial_identity_filter(term: str):
+    """Começo de CPF/CNPJ/telefone ("123.456", "(11) 9876"): faixa indexada nas chaves (None = busca textual)."""
+    if "@" in term or any(ch.isalpha() for ch in term):
+        return None
+    digits = "".join(ch for ch in term if ch.isdigit())
+    if len(digits) < 3:
+        return None
+    return customer_identity.key_prefix("document", digits) | customer_identity.key_prefix("phone", digits)
+
 # Endpoints
 @router.post("/customers", response_model=CustomerOut, status_code=status.HTTP_201_CREATED)
 def create_customer(payload: CustomerIn):
     db = _db()
     try:
         c = Customer(**payload.model_dump())
+        customer_identity.stamp(c)
         db.add(c)
         db.commit()
         db.refresh(c)
+        lookup_cache.bump()
         return c
     finally:
         db.close()
 
+@router.get("/customers/lookup", response_model=List[CustomerOut])
+def lookup_customers(
+    request: Request,
+    phone: Optional[str] = None,
+    document: Optional[str] = None,
+    email: Optional[str] = None,
+):
+    """
+    Busca exata (entrada de pedidos) por UM de: telefone, CPF/CNPJ ou e-mail, em qualquer formatação.
+    Igualdade na chave normalizada indexada; respostas em cache LRU (ETag / 304).
+    """
+    given = [(kind, value) for kind, value in (("phone", phone), ("document", document), ("email", email)) if value]
+    if len(given) != 1:
+        raise HTTPException(422, "Informe exatamente um de: phone, document, email")
+    kind, value = given[0]
+    key = customer_identity.normalizer(kind)(value)
+    if key is None:
+        raise HTTPException(422, f"{kind} inválido: {value!r}")
+
+    def load() -> bytes:
+        db = _db()
+        try:
+            found = (
+                db.query(Customer)
+                .filter(customer_identity.key_column(kind) == key)
+                .order_by(Customer.id)
+                .all()
+            )
+            return _customers_json.dump_json(_customers_json.validate_python(found, from_attributes=True))
+        finally:
+            db.close()
+
+    entry = lookup_cache.get_or_load((kind, key), load)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@router.get("/customers/lookup/metrics")
+def lookup_cache_metrics():
+    return lookup_cache.metrics()
+
+@router.get("/customers/duplicates", response_model=DuplicatesOut)
+def customer_duplicates(
+    by: List[str] = Query(["document", "phone", "email"], description="Chaves comparadas"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Relatório de possíveis duplicados: clientes agrupados por chave normalizada (GROUP BY, sem
+    comparar pares). Grupos ligados por clientes em comum viram um só; maiores primeiro.
+    """
+    unknown = sorted(set(by) - set(customer_identity.KEYS))
+    if unknown:
+        raise HTTPException(422, f"Chaves desconhecidas: {unknown}")
+    db = _db()
+    try:
+        groups = customer_identity.duplicate_groups(db, list(dict.fromkeys(by)))
+        page = groups[offset:offset + limit]
+        ids = [cid for g in page for cid in g["customer_ids"]]
+        customers = {c.id: c for c in db.query(Customer).filter(Customer.id.in_(ids)).all()} if ids else {}
+        return DuplicatesOut(
+            groups=len(groups),
+            customers=sum(len(g["customer_ids"]) for g in groups),
+            results=[
+                DuplicateGroupOut(
+                    customer_ids=g["customer_ids"],
+                    keys=g["keys"],
+                    customers=[customers[cid] for cid in g["customer_ids"]],
+                )
+                for g in page
+            ],
+        )
+    finally:
+        db.close()
+
 @router.get("/customers/{customer_id}", response_model=CustomerOut)
 def get_customer(customer_id: int):
     db = _db()
@@ -57,7 +184,7 @@ def get_customer(customer_id: int):
 
 @router.get("/customers", response_model=List[CustomerOut])
 def list_customers(
-    search: Optional[str] = Query(None, description="Filtra por nome/email/documento"),
+    search: Optional[str] = Query(None, description="Filtra por nome/email/documento/telefone"),
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
 ):
@@ -65,12 +192,14 @@ def list_customers(
     try:
         q = db.query(Customer)
         if search:
-            like = f"%{search}%"
-            q = q.filter(
-                (Customer.name.ilike(like)) |
-                (Customer.email.ilike(like)) |
-                (Customer.document.ilike(like))
-            )
+            term = search.strip()
+            # e-mail/CPF/CNPJ/telefone completo (igualdade) ou começo de documento/telefone (faixa):
+            # só condições nas chaves indexadas, numa consulta; o resto vai para a busca textual
+            conditions = [c for c in (_identity_filter(term), _partial_identity_filter(term)) if c is not None]
+            if conditions:
+                q = q.filter(or_(*conditions))
+            else:
+                q = apply_search(q, "customers", search)
         return q.order_by(Customer.id.desc()).offset(offset).limit(limit).all()
     finally:
         db.close()
@@ -84,8 +213,10 @@ def update_customer(customer_id: int, patch: CustomerUpdate):
             raise HTTPException(404, "Cliente não encontrado")
         for k, v in patch.model_dump(exclude_unset=True).items():
             setattr(c, k, v)
+        customer_identity.stamp(c)
         db.commit()
         db.refresh(c)
+        lookup_cache.bump()
         return c
     finally:
         db.close()
@@ -99,6 +230,7 @@ def delete_customer(customer_id: int):
             raise HTTPException(404, "Cliente não encontrado")
         db.delete(c)
         db.commit()
+        lookup_cache.bump()
         return
     finally:
         db.close()
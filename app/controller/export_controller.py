@@ -0,0 +1,116 @@
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+from sqlalchemy.orm import Session
+from app.db_utils import db_timestamp
+from app.exports import FORMATS, render, stream_query
+from app.models import (
+    SessionLocal, Category, MovementType, Order, OrderItem, Product, StockItem, StockMovement
+)
+from app.sales_rollup import to_utc_naive
+
+router = APIRouter(tags=["Export"])
+
+ORDER_COLUMNS = ("id", "external_code", "created_at", "status", "customer_name", "total_amount", "note")
+ORDER_ITEM_COLUMNS = ("item_sku", "item_name", "item_qty", "item_unit_price", "item_total")
+PRODUCT_COLUMNS = ("id", "sku", "name", "category", "price", "cost", "active", "unit", "quantity", "min_quantity")
+MOVEMENT_COLUMNS = (
+    "id", "created_at", "product_id", "sku", "product_name", "movement_type",
+    "quantity", "unit_price", "reason", "reference",
+)
+
+def _check_period(start: Optional[datetime], end: Optional[datetime]) -> None:
+    # com e sem fuso podem vir misturados na query string; datas sem fuso são UTC
+    if start and end and to_utc_naive(start) >= to_utc_naive(end):
+        raise HTTPException(400, "start deve ser anterior a end")
+
+def _export(name: str, fmt: str, header, build) -> StreamingResponse:
+    rows = stream_query(SessionLocal, build)
+    filename = f"{name}-{datetime.now():%Y%m%d-%H%M}.{fmt}"
+    return StreamingResponse(
+        render(fmt, name, header, rows),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/export/orders")
+def export_orders(
+    format: Literal["csv", "xlsx"] = "csv",
+    start: Optional[datetime] = Query(None, description="Criados a partir de (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Criados antes de (exclusivo)"),
+    status: Optional[str] = None,
+    include_items: bool = Query(False, description="Uma linha por item do pedido"),
+):
+    """Pedidos do período em ordem de id, lidos do banco em blocos e enviados enquanto são gerados."""
+    _check_period(start, end)
+
+    def build(db: Session):
+        cols = [getattr(Order, c) for c in ORDER_COLUMNS]
+        if include_items:
+            cols += [OrderItem.sku, OrderItem.name, OrderItem.qty, OrderItem.unit_price, OrderItem.total]
+        q = db.query(*cols)
+        if include_items:
+            q = q.outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        if start:
+            q = q.filter(Order.created_at >= db_timestamp(db, start))
+        if end:
+            q = q.filter(Order.created_at < db_timestamp(db, end))
+        if status:
+            q = q.filter(Order.status == status)
+        order = [Order.id.asc()] + ([OrderItem.id.asc()] if include_items else [])
+        return q.order_by(*order)
+
+    header = ORDER_COLUMNS + (ORDER_ITEM_COLUMNS if include_items else ())
+    return _export("orders", format, header, build)
+
+@router.get("/export/products")
+def export_products(
+    format: Literal["csv", "xlsx"] = "csv",
+    active: Optional[bool] = None,
+):
+    def build(db: Session):
+        q = (
+            db.query(
+                Product.id, Product.sku, Product.name, Category.name, Product.price, Product.cost,
+                Product.active, StockItem.unit, StockItem.quantity, StockItem.min_quantity,
+            )
+            .outerjoin(Category, Category.id == Product.category_id)
+            .outerjoin(StockItem, StockItem.product_id == Product.id)
+        )
+        if active is not None:
+            q = q.filter(Product.active == active)
+        return q.order_by(Product.id.asc())
+
+    return _export("products", format, PRODUCT_COLUMNS, build)
+
+@router.get("/export/stock-movements")
+def export_stock_movements(
+    format: Literal["csv", "xlsx"] = "csv",
+    start: Optional[datetime] = Query(None, description="A partir de (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Antes de (exclusivo)"),
+    product_id: Optional[int] = None,
+    movement_type: Optional[Literal["IN", "OUT", "ADJUST"]] = None,
+):
+    _check_period(start, end)
+
+    def build(db: Session):
+        q = (
+            db.query(
+                StockMovement.id, StockMovement.created_at, StockMovement.product_id, Product.sku,
+                Product.name, StockMovement.movement_type, StockMovement.quantity,
+                StockMovement.unit_price, StockMovement.reason, StockMovement.reference,
+            )
+            .outerjoin(Product, Product.id == StockMovement.product_id)
+        )
+        if start:
+            q = q.filter(StockMovement.created_at >= db_timestamp(db, start))
+        if end:
+            q = q.filter(StockMovement.created_at < db_timestamp(db, end))
+        if product_id:
+            q = q.filter(StockMovement.product_id == product_id)
+        if movement_type:
+            q = q.filter(StockMovement.movement_type == MovementType(movement_type))
+        return q.order_by(StockMovement.id.asc())
+
+    return _export("stock-movements", format, MOVEMENT_COLUMNS, build)
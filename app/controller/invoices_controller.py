@@ -1,46 +1,281 @@
+import asyncio
+import os
+from datetime import datetime
+from fastapi import APIRouter, File, Header, HTTPException, Query, Response, UploadFile, status
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session, selectinload
+from app.models import SessionLocal, MovementType, Product, PurchaseInvoice, PurchaseInvoiceItem, StockItem
+from app.pdf_render import pdf_renderer, pdf_response
+from app.nfe import PURCHASE_REASON, NFeImporter, NFeParseError, iter_nfe
+from app.product_matcher import ProductMatcher, supplier_key
+from app.stock_ops import apply_stock_deltas, insert_movements
 
-# ... (demais imports e endpoints iguais aos que você já tem)
-from sqlalchemy.orm import Session
-from app.models import SessionLocal, Order, OrderItem, Product, StockItem, StockMovement, MovementType
+router = APIRouter(tags=["Invoices"])
 
-# Substitua a função update_order_status pela abaixo:
-@router.patch("/orders/{order_id}/status", response_model=OrderOut, tags=["Orders"])
-def update_order_status(order_id: int, patch: StatusPatchIn):
-    db: Session = SessionLocal()
+# =========================
+# Schemas
+# =========================
+class InvoiceItemOut(BaseModel):
+    id: int
+    product_id: Optional[int]
+    sku: str
+    name: str
+    qty: float
+    unit: str
+    unit_price: float
+    total: float
+    class Config:
+        from_attributes = True
+
+class InvoiceOut(BaseModel):
+    id: int
+    supplier_name: str
+    supplier_document: Optional[str]
+    number: str
+    series: Optional[str]
+    issue_date: Optional[datetime]
+    total_amount: float
+    items: List[InvoiceItemOut]
+    class Config:
+        from_attributes = True
+
+class NFeImportOut(BaseModel):
+    invoice_id: int
+    duplicate: bool  # nota já lançada: nada foi gravado
+    number: str
+    series: Optional[str]
+    supplier_name: str
+    supplier_document: Optional[str]
+    items: int
+    matched: int  # itens ligados a um produto do catálogo (cProd ou EAN = SKU)
+    unmatched: List[str]  # cProd dos itens sem produto (sem movimento de estoque)
+    total_amount: Optional[float]
+
+class MatchLineIn(BaseModel):
+    code: str = Field(..., min_length=1, max_length=64)  # código do produto no fornecedor (cProd)
+    name: str = Field(..., max_length=160)
+    ean: Optional[str] = None
+
+class MatchIn(BaseModel):
+    supplier_document: Optional[str] = None
+    supplier_name: Optional[str] = None
+    lines: List[MatchLineIn] = Field(..., min_length=1, max_length=5000)
+
+class MatchCandidateOut(BaseModel):
+    product_id: int
+    sku: str
+    name: str
+    score: float
+
+class MatchLineOut(BaseModel):
+    item_id: Optional[int] = None
+    code: str
+    name: str
+    product_id: Optional[int]
+    method: Optional[str]  # sku | ean | alias (produto certo) | name (só candidatos) | None
+    score: Optional[float]
+    candidates: List[MatchCandidateOut]
+
+class MatchConfirmIn(BaseModel):
+    item_id: int
+    product_id: int
+
+class MatchConfirmOut(BaseModel):
+    confirmed: int
+    movements: int
+
+def _db() -> Session:
+    return SessionLocal()
+
+# Índice em memória para ligar itens de nota a produtos (SKU/EAN, apelidos por fornecedor, nome)
+product_matcher = ProductMatcher(SessionLocal, refresh=float(os.getenv("PRODUCT_MATCHER_REFRESH_SECONDS", "300")))
+
+def _reference(inv: PurchaseInvoice) -> str:
+    return f"NF {inv.number}" + (f"/{inv.series}" if inv.series else "")
+
+# =========================
+# Endpoints
+# =========================
+@router.post("/invoices/nfe", response_model=NFeImportOut, status_code=status.HTTP_201_CREATED)
+def import_nfe(
+    response: Response,
+    file: UploadFile = File(..., description="XML da NF-e (nfeProc ou NFe)"),
+    chunk_size: int = Query(500, ge=50, le=5000),
+):
+    """
+    Lança uma NF-e de compra: nota, itens e movimentos IN (com unit_price) numa transação.
+    - XML lido em streaming (iterparse); itens gravados em lotes.
+    - Nota já lançada (emitente + número + série): 200 com o id existente, sem gravar nada.
+    """
+    db = _db()
+    try:
+        importer = NFeImporter(db, chunk_size=chunk_size, matcher=product_matcher)
+        try:
+            result = importer.run(iter_nfe(file.file))
+        except NFeParseError as exc:
+            db.rollback()
+            raise HTTPException(400, str(exc))
+        db.commit()
+        if result["duplicate"]:
+            response.status_code = status.HTTP_200_OK
+        return result
+    finally:
+        db.close()
+
+@router.post("/invoices/match", response_model=List[MatchLineOut])
+def match_lines(payload: MatchIn):
+    """Prévia do casamento de linhas de um fornecedor com o catálogo (não grava nada)."""
+    supplier = supplier_key(payload.supplier_document, payload.supplier_name)
+    results = product_matcher.match(supplier, [(ln.code, ln.name, ln.ean) for ln in payload.lines])
+    return [MatchLineOut(code=ln.code, name=ln.name, **r) for ln, r in zip(payload.lines, results)]
+
+@router.get("/invoices/matcher/metrics")
+def matcher_metrics():
+    return product_matcher.metrics()
+
+@router.get("/invoices/pdf/metrics")
+def pdf_metrics():
+    return pdf_renderer.metrics()
+
+@router.get("/invoices/{invoice_id}", response_model=InvoiceOut)
+def get_invoice(invoice_id: int):
+    db = _db()
     try:
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if not order:
-            raise HTTPException(status_code=404, detail="Pedido não encontrado")
-
-        previous = order.status
-        order.status = patch.status
-        db.commit(); db.refresh(order)
-
-        # Quando confirmar, baixa estoque (apenas 1x)
-        if previous != "CONFIRMED" and patch.status == "CONFIRMED":
-            for oi in order.items:
-                # encontra produto pelo SKU
-                p = db.query(Product).filter(Product.sku == oi.sku).first()
-                if not p:
-                    # se o item não estiver no catálogo, não baixa
-                    continue
-                si = db.query(StockItem).filter(StockItem.product_id == p.id).first()
-                if not si:
-                    continue
-                qty = float(oi.qty)
-                si.quantity -= qty
-                mv = StockMovement(
-                    product_id=p.id,
-                    movement_type=MovementType.OUT,
-                    quantity=qty,
-                    unit_price=None,
-                    reason="Order confirmed",
-                    reference=f"ORDER {order.id}"
-                )
-                db.add(mv)
-            db.commit()
-
-        return order
+        inv = (
+            db.query(PurchaseInvoice)
+            .options(selectinload(PurchaseInvoice.items))
+            .filter(PurchaseInvoice.id == invoice_id)
+            .first()
+        )
+        if not inv:
+            raise HTTPException(404, "Nota fiscal não encontrada")
+        return inv
+    finally:
+        db.close()
+
+def _invoice_doc(invoice_id: int) -> Optional[dict]:
+    db = _db()
+    try:
+        inv = (
+            db.query(PurchaseInvoice)
+            .options(selectinload(PurchaseInvoice.items))
+            .filter(PurchaseInvoice.id == invoice_id)
+            .first()
+        )
+        if not inv:
+            return None
+        return {
+            "number": inv.number,
+            "series": inv.series,
+            "supplier_name": inv.supplier_name,
+            "supplier_document": inv.supplier_document,
+            "issue_date": inv.issue_date.strftime("%d/%m/%Y") if inv.issue_date else None,
+            "total_amount": inv.total_amount,
+            "items": [
+                {"sku": it.sku, "name": it.name, "qty": it.qty, "unit": it.unit,
+                 "unit_price": it.unit_price, "total": it.total}
+                for it in sorted(inv.items, key=lambda it: it.id)
+            ],
+        }
+    finally:
+        db.close()
+
+@router.get("/invoices/{invoice_id}/pdf")
+async def get_invoice_pdf(invoice_id: int, if_none_match: Optional[str] = Header(None)):
+    """Nota de compra em PDF (A4). Renderizada no pool de processos; reimpressão sai do cache."""
+    doc = await asyncio.to_thread(_invoice_doc, invoice_id)
+    if doc is None:
+        raise HTTPException(404, "Nota fiscal não encontrada")
+    return await pdf_response(pdf_renderer, "purchase-invoice", doc, f"nota-{invoice_id}.pdf", if_none_match)
+
+@router.get("/invoices/{invoice_id}/match", response_model=List[MatchLineOut])
+def suggest_invoice_matches(invoice_id: int):
+    """Itens da nota ainda sem produto, com os candidatos do índice."""
+    db = _db()
+    try:
+        inv = db.query(PurchaseInvoice).filter(PurchaseInvoice.id == invoice_id).first()
+        if not inv:
+            raise HTTPException(404, "Nota fiscal não encontrada")
+        items = (
+            db.query(PurchaseInvoiceItem.id, PurchaseInvoiceItem.sku, PurchaseInvoiceItem.name)
+            .filter(PurchaseInvoiceItem.invoice_id == invoice_id, PurchaseInvoiceItem.product_id.is_(None))
+            .order_by(PurchaseInvoiceItem.id)
+            .all()
+        )
+        supplier = supplier_key(inv.supplier_document, inv.supplier_name)
+    finally:
+        db.close()
+    results = product_matcher.match(supplier, [(it.sku, it.name, None) for it in items])
+    return [MatchLineOut(item_id=it.id, code=it.sku, name=it.name, **r) for it, r in zip(items, results)]
+
+@router.post("/invoices/{invoice_id}/match", response_model=MatchConfirmOut)
+def confirm_invoice_matches(invoice_id: int, payload: List[MatchConfirmIn]):
+    """
+    Liga itens da nota a produtos (tudo ou nada) e lança a entrada de estoque que ficou pendente.
+    Cada confirmação vira apelido do fornecedor: as próximas notas já chegam ligadas.
+    """
+    db = _db()
+    try:
+        inv = db.query(PurchaseInvoice).filter(PurchaseInvoice.id == invoice_id).first()
+        if not inv:
+            raise HTTPException(404, "Nota fiscal não encontrada")
+        chosen = {c.item_id: c.product_id for c in payload}
+        items = (
+            db.query(PurchaseInvoiceItem)
+            .filter(PurchaseInvoiceItem.invoice_id == invoice_id, PurchaseInvoiceItem.id.in_(chosen))
+            .order_by(PurchaseInvoiceItem.id)  # CAS dos itens em ordem fixa (confirmações simultâneas)
+            .all()
+        )
+        pending = {it.id for it in items if it.product_id is None}
+        invalid = sorted(set(chosen) - pending)
+        if invalid:
+            raise HTTPException(422, f"Itens inexistentes nesta nota ou já ligados a produto: {invalid}")
+        products = dict(
+            db.query(Product.id, StockItem.id)
+            .outerjoin(StockItem, StockItem.product_id == Product.id)
+            .filter(Product.id.in_(set(chosen.values())))
+            .all()
+        )
+        unknown = sorted(set(chosen.values()) - set(products))
+        if unknown:
+            raise HTTPException(422, f"Produtos não encontrados: {unknown}")
+
+        deltas: Dict[int, float] = {}
+        movements = []
+        for it in items:
+            product_id = chosen[it.id]
+            # compare-and-set: duas confirmações simultâneas do mesmo item não dão entrada 2x
+            linked = db.execute(
+                update(PurchaseInvoiceItem)
+                .where(PurchaseInvoiceItem.id == it.id, PurchaseInvoiceItem.product_id.is_(None))
+                .values(product_id=product_id)
+                .execution_options(synchronize_session=False)
+            )
+            if linked.rowcount != 1:
+                db.rollback()
+                raise HTTPException(409, f"Item {it.id} ligado por outra requisição, recarregue e tente novamente")
+            stock_item_id = products[product_id]
+            if stock_item_id is None:
+                continue
+            deltas[stock_item_id] = deltas.get(stock_item_id, 0.0) + it.qty
+            movements.append({
+                "product_id": product_id,
+                "movement_type": MovementType.IN_,
+                "quantity": it.qty,
+                "unit_price": it.unit_price,
+                "reason": PURCHASE_REASON,
+                "reference": _reference(inv),
+            })
+        apply_stock_deltas(db, deltas)
+        insert_movements(db, movements)
+        supplier = supplier_key(inv.supplier_document, inv.supplier_name)
+        learned = [(it.sku, chosen[it.id]) for it in items]
+        db.commit()
+
+        for code, product_id in learned:
+            product_matcher.learn(supplier, code, product_id)
+        return MatchConfirmOut(confirmed=len(items), movements=len(movements))
     finally:
         db.close()
-``
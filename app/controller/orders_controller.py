@@ -1,18 +1,32 @@
 
-from fastapi import APIRouter, Request, status, HTTPException, Query
-from pydantic import BaseModel, Field, PositiveInt, NonNegativeFloat
-from typing import List, Optional, Literal
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Header, Request, Response, status, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, PositiveInt, NonNegativeFloat, ValidationError
+from typing import Any, Dict, List, Optional, Literal, Tuple, Union
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from datetime import timedelta
+import asyncio
+import json
 import logging
+import os
 
 from app.models import (
     SessionLocal,
     Order,
     OrderItem,
-    Product,
-    StockItem,
-    StockMovement,
-    MovementType,
+)
+from app.normalizers import NormalizationError, get_normalizer
+from app.order_dedup import ExternalCodeIndex
+from app.order_events import OrderEventBus
+from app.order_queue import OrderIngestQueue, QueueNotRunning
+from app.pdf_render import pdf_renderer, pdf_response
+from app import sales_rollup
+from app.stock_ops import deduct_order_items
+from app import stock_reservations
+from app.stock_reservations import (
+    InsufficientStock, ReservationConflict, consume_order, release_order, reserve_items
 )
 
 router = APIRouter()
@@ -44,24 +58,129 @@ class OrderItemOut(BaseModel):
     class Config:
         from_attributes = True  # pydantic v2
 
-class OrderOut(BaseModel):
+class OrderHeaderOut(BaseModel):
     id: int
     external_code: Optional[str]
     customer_name: str
     status: str
     note: Optional[str]
     total_amount: float
-    items: List[OrderItemOut]
 
     class Config:
         from_attributes = True  # pydantic v2
 
+class OrderOut(OrderHeaderOut):
+    items: List[OrderItemOut]
+
+# Máquina de estados do pedido: status atual -> status permitidos
+ORDER_TRANSITIONS = {
+    "CREATED": ("CONFIRMED", "CANCELLED"),
+    "CONFIRMED": ("IN_PREPARATION", "CANCELLED"),
+    "IN_PREPARATION": ("READY", "CANCELLED"),
+    "READY": ("FULFILLED",),
+    "FULFILLED": (),
+    "CANCELLED": (),
+}
+
 class StatusPatchIn(BaseModel):
     status: Literal["CREATED", "CONFIRMED", "IN_PREPARATION", "READY", "FULFILLED", "CANCELLED"]
 
+class StatusPatchOut(OrderOut):
+    missing_skus: List[str] = []  # SKUs do pedido que não existem no catálogo (sem baixa)
+
+class OrderCostOut(BaseModel):
+    order_id: int
+    status: str
+    revenue: float
+    cost_avg: Optional[float]     # CMV pelo custo médio (None = sem baixa de estoque ainda)
+    cost_fifo: Optional[float]    # CMV pelo FIFO
+    margin_avg: Optional[float]
+    margin_fifo: Optional[float]
+
+class BulkOrderResult(BaseModel):
+    index: int  # posição do pedido no payload
+    status: Literal["created", "duplicate", "invalid"]
+    order_id: Optional[int] = None
+    external_code: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkOrdersOut(BaseModel):
+    created: int
+    duplicate: int
+    invalid: int
+    results: List[BulkOrderResult]
+
 def _db_session() -> Session:
     return SessionLocal()
 
+# Reserva de estoque na criação (webhook e manual); vence se o pedido não for confirmado a tempo
+RESERVATION_TTL = timedelta(minutes=float(os.getenv("STOCK_RESERVATION_TTL_MINUTES", "30")))
+
+# Pedidos da fila já foram aceitos (202): mais tentativas antes de desistir da reserva
+QUEUED_RESERVE_ATTEMPTS = int(os.getenv("STOCK_RESERVATION_QUEUE_ATTEMPTS", "32"))
+
+def _reserve(db: Session, order_id: int, items, max_attempts: int = stock_reservations.MAX_ATTEMPTS) -> None:
+    missing = reserve_items(db, order_id, items, ttl=RESERVATION_TTL, max_attempts=max_attempts)
+    if missing:
+        logger.warning("Pedido %s com SKUs fora do catálogo (sem reserva): %s", order_id, missing)
+
+def _stock_error(e: Exception) -> HTTPException:
+    if isinstance(e, InsufficientStock):
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Estoque insuficiente", "items": e.shortages},
+        )
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Estoque disputado por outros pedidos, tente novamente",
+        headers={"Retry-After": "1"},
+    )
+
+# Eventos de pedidos para telas de cozinha/dashboard (stream SSE)
+order_events = OrderEventBus(
+    history=int(os.getenv("ORDER_EVENTS_HISTORY", "1000")),
+    client_buffer=int(os.getenv("ORDER_EVENTS_CLIENT_BUFFER", "100")),
+)
+EVENTS_HEARTBEAT_SECONDS = 15.0
+
+def _publish_created(order_id: int, external_code: Optional[str], customer_name: str,
+                     total_amount: float, items_count: int) -> None:
+    order_events.publish("order.created", {
+        "order_id": order_id,
+        "external_code": external_code,
+        "customer_name": customer_name,
+        "status": "CREATED",
+        "total_amount": total_amount,
+        "items_count": items_count,
+    })
+
+def _publish_status_changed(order_id: int, previous: str, current: str) -> None:
+    order_events.publish("order.status_changed", {"order_id": order_id, "from": previous, "to": current})
+
+def _sse_format(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+async def _sse_stream(request: Request, sub):
+    try:
+        yield "retry: 3000\n\n"
+        for event in sub.backlog:
+            yield _sse_format(event)
+        sub.backlog = []
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                # cliente lento descartado: ele reconecta com Last-Event-ID
+                break
+            yield _sse_format(event)
+    finally:
+        order_events.unsubscribe(sub)
+
 # =========================
 # Endpoints
 # =========================
@@ -92,11 +211,17 @@ def create_order_manual(payload: OrderIn):
                     total=it.qty * float(it.unit_price),
                 )
             )
+        _reserve(db, order.id, [(it.sku, it.qty) for it in payload.items])
 
         db.commit()
         db.refresh(order)
-        return order
+        out = OrderOut.model_validate(order)
+        _publish_created(out.id, out.external_code, out.customer_name, out.total_amount, len(out.items))
+        return out
 
+    except (InsufficientStock, ReservationConflict) as e:
+        db.rollback()
+        raise _stock_error(e)
     except Exception as e:
         db.rollback()
         logger.exception("Erro ao criar pedido manual: %s", e)
@@ -104,145 +229,630 @@ def create_order_manual(payload: OrderIn):
     finally:
         db.close()
 
+_orders_table = Order.__table__
+_order_items_table = OrderItem.__table__
+
+def _insert_orders_rows(db: Session, orders: List[OrderIn]) -> List[int]:
+    """INSERT multi-linha de pedidos (RETURNING id) + INSERT multi-linha dos itens. Sem commit."""
+    ids = db.execute(
+        insert(_orders_table).returning(_orders_table.c.id, sort_by_parameter_order=True),
+        [
+            {
+                "external_code": o.external_code,
+                "customer_name": o.customer_name,
+                "note": o.note,
+                "total_amount": sum(it.qty * float(it.unit_price) for it in o.items),
+                "status": "CREATED",
+            }
+            for o in orders
+        ],
+    ).scalars().all()
+    db.execute(
+        insert(_order_items_table),
+        [
+            {
+                "order_id": order_id,
+                "sku": it.sku,
+                "name": it.name,
+                "qty": it.qty,
+                "unit_price": float(it.unit_price),
+                "total": it.qty * float(it.unit_price),
+            }
+            for order_id, o in zip(ids, orders)
+            for it in o.items
+        ],
+    )
+    return ids
+
+def _save_bulk_chunk(db: Session, start: int, raw_chunk: List[Any]) -> List[BulkOrderResult]:
+    results: List[Optional[BulkOrderResult]] = [None] * len(raw_chunk)
+    valid: List[Tuple[int, OrderIn]] = []
+    for pos, raw in enumerate(raw_chunk):
+        try:
+            valid.append((pos, OrderIn.model_validate(raw)))
+        except ValidationError as e:
+            err = e.errors()[0]
+            loc = ".".join(str(x) for x in err["loc"])
+            results[pos] = BulkOrderResult(
+                index=start + pos,
+                status="invalid",
+                external_code=raw.get("external_code") if isinstance(raw, dict) else None,
+                error=f"{loc}: {err['msg']}" if loc else err["msg"],
+            )
+
+    # duplicados: já gravados (1 SELECT por bloco) ou repetidos dentro do próprio payload
+    codes = [o.external_code for _, o in valid if o.external_code]
+    known = order_index.existing(db, codes) if codes else {}
+    to_insert: List[Tuple[int, OrderIn]] = []
+    first_in_chunk: Dict[str, int] = {}
+    repeated: List[Tuple[int, str]] = []
+    for pos, o in valid:
+        code = o.external_code
+        if code and code in known:
+            results[pos] = BulkOrderResult(index=start + pos, status="duplicate", order_id=known[code], external_code=code)
+        elif code and code in first_in_chunk:
+            repeated.append((pos, code))
+        else:
+            if code:
+                first_in_chunk[code] = pos
+            to_insert.append((pos, o))
+
+    def _created(pos: int, o: OrderIn, order_id: int) -> None:
+        results[pos] = BulkOrderResult(index=start + pos, status="created", order_id=order_id, external_code=o.external_code)
+        if o.external_code:
+            order_index.remember(o.external_code, order_id)
+        _publish_created(
+            order_id, o.external_code, o.customer_name,
+            sum(it.qty * float(it.unit_price) for it in o.items), len(o.items),
+        )
+
+    try:
+        ids = _insert_orders_rows(db, [o for _, o in to_insert]) if to_insert else []
+        db.commit()
+        for (pos, o), order_id in zip(to_insert, ids):
+            _created(pos, o, order_id)
+    except IntegrityError:
+        # corrida com outra gravação do mesmo external_code: isola pedido a pedido
+        db.rollback()
+        for pos, o in to_insert:
+            try:
+                order_id = _insert_orders_rows(db, [o])[0]
+                db.commit()
+                _created(pos, o, order_id)
+            except IntegrityError:
+                db.rollback()
+                existing = order_index.lookup(db, o.external_code) if o.external_code else None
+                results[pos] = BulkOrderResult(
+                    index=start + pos,
+                    status="duplicate" if existing is not None else "invalid",
+                    order_id=existing,
+                    external_code=o.external_code,
+                    error=None if existing is not None else "Violação de integridade",
+                )
+
+    for pos, code in repeated:
+        first = results[first_in_chunk[code]]
+        if first.order_id is None:
+            # a primeira ocorrência não foi gravada: não há pedido para apontar como duplicado
+            results[pos] = BulkOrderResult(
+                index=start + pos, status="invalid", external_code=code,
+                error=f"external_code repetido do pedido {first.index}, que não foi gravado",
+            )
+        else:
+            results[pos] = BulkOrderResult(index=start + pos, status="duplicate", order_id=first.order_id, external_code=code)
+    return results
+
+# Limites do POST /orders/bulk: o corpo é lido inteiro e há um resultado por pedido
+BULK_MAX_BYTES = int(os.getenv("ORDERS_BULK_MAX_MB", "20")) * 1024 * 1024
+BULK_MAX_ORDERS = int(os.getenv("ORDERS_BULK_MAX_ORDERS", "20000"))
+
+async def _read_bulk_payload(request: Request) -> List[Any]:
+    """Lê o corpo com teto de bytes (413 sem esperar o fim do upload) e de pedidos."""
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Lote grande demais: máximo de {BULK_MAX_BYTES // (1024 * 1024)} MB "
+               f"e {BULK_MAX_ORDERS} pedidos por requisição",
+    )
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > BULK_MAX_BYTES:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > BULK_MAX_BYTES:
+            raise too_large
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Payload inválido")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=422, detail="O corpo deve ser uma lista de pedidos")
+    if len(payload) > BULK_MAX_ORDERS:
+        raise too_large
+    return payload
+
+def _save_bulk(payload: List[Any], chunk_size: int) -> BulkOrdersOut:
+    db = _db_session()
+    try:
+        results: List[BulkOrderResult] = []
+        for start in range(0, len(payload), chunk_size):
+            # repetidos entre blocos aparecem como duplicate via order_index
+            results.extend(_save_bulk_chunk(db, start, payload[start:start + chunk_size]))
+        return BulkOrdersOut(
+            created=sum(1 for r in results if r.status == "created"),
+            duplicate=sum(1 for r in results if r.status == "duplicate"),
+            invalid=sum(1 for r in results if r.status == "invalid"),
+            results=results,
+        )
+    except Exception as e:
+        db.rollback()
+        logger.exception("Erro na ingestão em lote de pedidos: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao salvar pedidos em lote")
+    finally:
+        db.close()
+
+@router.post(
+    "/orders/bulk",
+    response_model=BulkOrdersOut,
+    tags=["Orders"],
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {"schema": {
+        "type": "array", "maxItems": BULK_MAX_ORDERS,
+        "items": {"type": "object", "description": "Pedido no formato de OrderIn"},
+    }}}}},
+)
+async def create_orders_bulk(
+    request: Request,
+    chunk_size: int = Query(200, ge=1, le=1000),
+):
+    """
+    Ingestão em lote (backfill, exportação de outro canal).
+    - Corpo: lista de pedidos no formato de OrderIn; acima de ORDERS_BULK_MAX_MB ou
+      ORDERS_BULK_MAX_ORDERS responde 413 (divida o backfill em várias requisições).
+    - Cada bloco de `chunk_size` pedidos é validado e gravado numa transação,
+      com INSERT multi-linha de pedidos e de itens.
+    - Resultado por pedido: created / duplicate (external_code já existente) / invalid.
+    - Um pedido inválido não derruba o lote.
+    """
+    payload = await _read_bulk_payload(request)
+    return await asyncio.to_thread(_save_bulk, payload, chunk_size)
+
+@router.get("/orders/events", tags=["Orders"])
+async def order_events_stream(
+    request: Request,
+    last_event_id: Optional[int] = Query(None, description="Alternativa ao header Last-Event-ID"),
+):
+    """
+    Stream SSE de eventos de pedidos (order.created, order.status_changed).
+    - Retoma a partir do header Last-Event-ID (ou ?last_event_id=).
+    - Evento "reset": o histórico não cobre o id pedido; recarregue GET /orders.
+    """
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    sub = order_events.subscribe(last_event_id)
+    return StreamingResponse(
+        _sse_stream(request, sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/orders/{order_id}", response_model=OrderOut, tags=["Orders"])
 def get_order(order_id: int):
     db = _db_session()
     try:
-        order = db.query(Order).filter(Order.id == order_id).first()
+        order = (
+            db.query(Order)
+            .options(selectinload(Order.items))
+            .filter(Order.id == order_id)
+            .first()
+        )
         if not order:
             raise HTTPException(status_code=404, detail="Pedido não encontrado")
         return order
     finally:
         db.close()
 
-@router.get("/orders", response_model=List[OrderOut], tags=["Orders"])
+@router.get("/orders/{order_id}/cost", response_model=OrderCostOut, tags=["Orders"])
+def get_order_cost(order_id: int):
+    """CMV e margem do pedido, gravados na baixa de estoque (confirmação)."""
+    db = _db_session()
+    try:
+        row = (
+            db.query(Order.status, Order.total_amount, Order.cost_avg, Order.cost_fifo)
+            .filter(Order.id == order_id)
+            .first()
+        )
+        if not row:
+            raise HTTPException(status_code=404, detail="Pedido não encontrado")
+        order_status, revenue, cost_avg, cost_fifo = row
+        return OrderCostOut(
+            order_id=order_id,
+            status=order_status,
+            revenue=revenue,
+            cost_avg=cost_avg,
+            cost_fifo=cost_fifo,
+            margin_avg=revenue - cost_avg if cost_avg is not None else None,
+            margin_fifo=revenue - cost_fifo if cost_fifo is not None else None,
+        )
+    finally:
+        db.close()
+
+def _ticket_doc(order_id: int) -> Optional[dict]:
+    """Só os campos impressos na comanda: mudar o status não invalida o PDF em cache."""
+    db = _db_session()
+    try:
+        order = (
+            db.query(Order)
+            .options(selectinload(Order.items))
+            .filter(Order.id == order_id)
+            .first()
+        )
+        if not order:
+            return None
+        return {
+            "id": order.id,
+            "external_code": order.external_code,
+            "customer_name": order.customer_name,
+            "note": order.note,
+            "total_amount": order.total_amount,
+            "created_at": order.created_at.strftime("%d/%m/%Y %H:%M") if order.created_at else None,
+            "items": [{"sku": it.sku, "name": it.name, "qty": it.qty} for it in order.items],
+        }
+    finally:
+        db.close()
+
+@router.get("/orders/{order_id}/ticket.pdf", tags=["Orders"])
+async def get_order_ticket(order_id: int, if_none_match: Optional[str] = Header(None)):
+    """Comanda da cozinha em PDF (80 mm). Renderizada no pool de processos; reimpressão sai do cache."""
+    doc = await asyncio.to_thread(_ticket_doc, order_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Pedido não encontrado")
+    return await pdf_response(pdf_renderer, "order-ticket", doc, f"pedido-{order_id}.pdf", if_none_match)
+
+@router.get("/orders", response_model=Union[List[OrderOut], List[OrderHeaderOut]], tags=["Orders"])
 def list_orders(
+    response: Response,
     status_eq: Optional[str] = Query(None),
     limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0),
+    after_id: Optional[int] = Query(None, ge=1, description="Cursor: retorna pedidos com id < after_id"),
+    include_items: bool = Query(True, description="false = apenas cabeçalhos dos pedidos"),
 ):
+    """
+    Lista pedidos do mais recente para o mais antigo, com paginação por cursor (keyset).
+    - Itens carregados em UMA consulta extra (selectinload), sem N+1.
+    - Header X-Next-After-Id traz o cursor da próxima página.
+    """
     db = _db_session()
     try:
         q = db.query(Order)
+        if include_items:
+            q = q.options(selectinload(Order.items))
         if status_eq:
             q = q.filter(Order.status == status_eq)
-        return q.order_by(Order.id.desc()).offset(offset).limit(limit).all()
+        if after_id is not None:
+            q = q.filter(Order.id < after_id)
+        orders = q.order_by(Order.id.desc()).limit(limit).all()
+
+        if len(orders) == limit:
+            response.headers["X-Next-After-Id"] = str(orders[-1].id)
+        schema = OrderOut if include_items else OrderHeaderOut
+        return [schema.model_validate(o) for o in orders]
     finally:
         db.close()
 
-@router.patch("/orders/{order_id}/status", response_model=OrderOut, tags=["Orders"])
+@router.patch("/orders/{order_id}/status", response_model=StatusPatchOut, tags=["Orders"])
 def update_order_status(order_id: int, patch: StatusPatchIn):
+    """
+    Troca de status com compare-and-set:
+    - valida a transição em ORDER_TRANSITIONS;
+    - UPDATE ... WHERE status = :esperado (dois PATCH concorrentes não confirmam 2x);
+    - baixa de estoque ao confirmar na mesma transação (a reserva do pedido é consumida);
+    - cancelar solta a reserva ainda ativa; 1 commit por transição.
+    """
     db = _db_session()
     try:
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if not order:
+        current = db.query(Order.status).filter(Order.id == order_id).scalar()
+        if current is None:
             raise HTTPException(status_code=404, detail="Pedido não encontrado")
+        if patch.status not in ORDER_TRANSITIONS.get(current, ()):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Transição inválida: {current} -> {patch.status}",
+            )
+
+        result = db.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == current)
+            .values(status=patch.status)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Status do pedido alterado por outra requisição, recarregue e tente novamente",
+            )
+
+        # baixa de estoque ao confirmar (apenas 1x: o CAS garante uma única transição para CONFIRMED)
+        missing_skus: List[str] = []
+        if patch.status == "CONFIRMED":
+            consume_order(db, order_id)
+            items = db.query(OrderItem.sku, OrderItem.qty).filter(OrderItem.order_id == order_id).all()
+            missing_skus = deduct_order_items(db, order_id, items)
+            if missing_skus:
+                logger.warning("Pedido %s confirmado com SKUs fora do catálogo: %s", order_id, missing_skus)
+            sales_rollup.apply_order(db, order_id, +1)
+        elif patch.status == "CANCELLED":
+            release_order(db, order_id)
+            if current in sales_rollup.COUNTED_STATUSES:
+                sales_rollup.apply_order(db, order_id, -1)
 
-        previous = order.status
-        order.status = patch.status
         db.commit()
-        db.refresh(order)
 
-        # baixa de estoque ao confirmar (apenas 1x)
-        if previous != "CONFIRMED" and patch.status == "CONFIRMED":
-            for oi in order.items:
-                p = db.query(Product).filter(Product.sku == oi.sku).first()
-                if not p:
-                    continue
-                si = db.query(StockItem).filter(StockItem.product_id == p.id).first()
-                if not si:
-                    continue
-                qty = float(oi.qty)
-                si.quantity -= qty
-                db.add(
-                    StockMovement(
-                        product_id=p.id,
-                        movement_type=MovementType.OUT,
-                        quantity=qty,
-                        unit_price=None,
-                        reason="Order confirmed",
-                        reference=f"ORDER {order.id}",
-                    )
-                )
+        _publish_status_changed(order_id, current, patch.status)
+
+        order = db.query(Order).options(selectinload(Order.items)).filter(Order.id == order_id).one()
+        out = StatusPatchOut.model_validate(order)
+        out.missing_skus = missing_skus
+        return out
+    finally:
+        db.close()
+
+def _add_normalized_order(db: Session, data: dict) -> Order:
+    order = Order(
+        external_code=data["external_code"],
+        customer_name=data["customer_name"],
+        note=data["note"],
+        total_amount=data["total"],
+        status="CREATED",
+        items=[
+            OrderItem(
+                sku=it["sku"],
+                name=it["name"],
+                qty=it["qty"],
+                unit_price=it["unit_price"],
+                total=it["qty"] * it["unit_price"],
+            )
+            for it in data["items"]
+        ],
+    )
+    db.add(order)
+    return order
+
+def _publish_webhook_created(order_id: int, data: dict) -> None:
+    _publish_created(order_id, data["external_code"], data["customer_name"], data["total"], len(data["items"]))
+
+def _reserve_queued(db: Session, order: Order, data: dict) -> None:
+    """
+    Reserva de pedido vindo da fila (o integrador já recebeu 202); o pedido é sempre gravado:
+    - sem estoque: CANCELLED com o motivo na nota, para a operação recusá-lo no integrador;
+    - estoque disputado mesmo após QUEUED_RESERVE_ATTEMPTS: gravado sem reserva (CREATED) com aviso
+      na nota; a baixa na confirmação continua valendo.
+    """
+    try:
+        _reserve(db, order.id, [(it["sku"], it["qty"]) for it in data["items"]], QUEUED_RESERVE_ATTEMPTS)
+    except InsufficientStock as e:
+        skus = ", ".join(s["sku"] for s in e.shortages)
+        order.status = "CANCELLED"
+        order.note = f"{order.note or ''}\n[Recusado: estoque insuficiente ({skus})]".strip()
+        logger.warning("Pedido da fila sem estoque: external_code=%s itens=%s", data["external_code"], skus)
+    except ReservationConflict:
+        order.note = f"{order.note or ''}\n[Sem reserva: estoque disputado, conferir antes de confirmar]".strip()
+        logger.warning("Pedido da fila gravado sem reserva (disputa de estoque): external_code=%s",
+                       data["external_code"])
+
+def _publish_queued(order_id: int, order_status: str, data: dict) -> None:
+    _publish_webhook_created(order_id, data)
+    if order_status != "CREATED":
+        _publish_status_changed(order_id, "CREATED", order_status)
+
+def _save_webhook_batch(batch: List[dict]) -> int:
+    """
+    Sink da fila do webhook: grava o lote inteiro num único commit.
+    - Descarta external_code já gravados (1 SELECT por lote) ou repetidos dentro do lote.
+    - Se o lote falhar, regrava um a um para isolar o pedido ruim.
+    Retorna quantos pedidos não puderam ser gravados.
+    """
+    db = _db_session()
+    try:
+        codes = [d["external_code"] for d in batch if d["external_code"]]
+        known = order_index.existing(db, codes) if codes else {}
+        fresh, seen = [], set()
+        for data in batch:
+            code = data["external_code"]
+            if code and (code in known or code in seen):
+                order_index.release_pending(code)
+                continue
+            if code:
+                seen.add(code)
+            fresh.append(data)
+
+        try:
+            orders = [_add_normalized_order(db, data) for data in fresh]
+            db.flush()
+            for order, data in zip(orders, fresh):
+                _reserve_queued(db, order, data)
+            saved = [(data["external_code"], o.id, o.status) for data, o in zip(fresh, orders)]
             db.commit()
+            for data, (code, order_id, order_status) in zip(fresh, saved):
+                if code:
+                    order_index.remember(code, order_id)
+                _publish_queued(order_id, order_status, data)
+            return 0
+        except Exception as e:
+            db.rollback()
+            logger.warning("Lote do webhook falhou (%s); gravando pedidos individualmente", e)
 
-        return order
+        lost = 0
+        for data in fresh:
+            code = data["external_code"]
+            try:
+                order = _add_normalized_order(db, data)
+                db.flush()
+                _reserve_queued(db, order, data)
+                order_id, order_status = order.id, order.status
+                db.commit()
+                if code:
+                    order_index.remember(code, order_id)
+                _publish_queued(order_id, order_status, data)
+            except Exception as e:
+                db.rollback()
+                if code:
+                    order_index.release_pending(code)
+                lost += 1
+                logger.exception("Erro ao gravar pedido da fila: external_code=%s: %s", code, e)
+        return lost
     finally:
         db.close()
 
+def _lookup_external_code(code: str) -> Optional[int]:
+    db = _db_session()
+    try:
+        return order_index.lookup(db, code)
+    finally:
+        db.close()
+
+def _duplicate_response(order_id: int) -> dict:
+    return {"ok": True, "order_id": order_id, "duplicate": True}
+
+# Índice de external_code já recebidos (entregas repetidas do iFood)
+order_index = ExternalCodeIndex(maxsize=int(os.getenv("ORDERS_DEDUP_CACHE_SIZE", "50000")))
+
+# Modo do webhook: "sync" (grava na requisição) ou "queue" (aceita, enfileira e responde 202)
+WEBHOOK_MODE = os.getenv("ORDERS_WEBHOOK_MODE", "sync").lower()
+def _release_dropped(batch: List[dict]) -> None:
+    """Lote que a fila desistiu de gravar: a reentrega do integrador volta a ser aceita."""
+    codes = [data["external_code"] for data in batch if data["external_code"]]
+    for code in codes:
+        order_index.release_pending(code)
+    logger.error("Pedidos da fila não gravados (aguardando reentrega): external_codes=%s", codes)
+
+webhook_queue = OrderIngestQueue(
+    sink=_save_webhook_batch,
+    maxsize=int(os.getenv("ORDERS_WEBHOOK_QUEUE_SIZE", "1000")),
+    batch_size=int(os.getenv("ORDERS_WEBHOOK_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("ORDERS_WEBHOOK_FLUSH_INTERVAL", "0.2")),
+    retries=int(os.getenv("ORDERS_WEBHOOK_SINK_RETRIES", "3")),
+    on_drop=_release_dropped,
+)
+
 @router.post("/orders/webhook", status_code=status.HTTP_200_OK, tags=["Orders"])
 async def orders_webhook(request: Request):
     """
     Webhook para receber pedidos do iFood (ou outro integrador).
     - Aceita JSON genérico (dict).
-    - Normaliza campos comuns para o modelo interno.
+    - Normaliza campos para o modelo interno com o normalizador do integrador
+      (header X-Integrator ou /orders/webhook/{integrator}; padrão "generic").
+    - Entrega repetida (mesmo external_code): 200 com o order_id existente, sem inserir.
+    - Reserva o estoque dos itens; sem disponível responde 409 e não grava o pedido.
+    - ORDERS_WEBHOOK_MODE=queue: enfileira e responde 202 (429 se a fila estiver cheia);
+      sem estoque, o pedido é gravado como CANCELLED.
     """
-    db = _db_session()
-    try:
-        data = await request.json()
-        if not isinstance(data, dict):
-            raise HTTPException(status_code=400, detail="Payload inválido")
-
-        external_code = data.get("external_code") or data.get("orderId") or data.get("id")
-        customer_name = data.get("customer_name") or (data.get("customer") or {}).get("name") or "Cliente"
-        note = data.get("note") or data.get("observation")
-
-        raw_items = data.get("items") or data.get("orderItems") or []
-        if not isinstance(raw_items, list) or len(raw_items) == 0:
-            raise HTTPException(status_code=400, detail="Pedido sem itens")
-
-        normalized_items = []
-        for it in raw_items:
-            sku = it.get("sku") or it.get("id") or it.get("code")
-            name = it.get("name") or it.get("description") or "Item"
-            qty = it.get("qty") or it.get("quantity") or 0
-            unit_price = it.get("unit_price") or it.get("unitPrice") or it.get("price") or 0
-            if not sku or not name or not qty:
-                raise HTTPException(status_code=422, detail="Item do pedido inválido")
-            normalized_items.append(
-                {"sku": str(sku), "name": str(name), "qty": int(qty), "unit_price": float(unit_price)}
-            )
+    return await _handle_webhook(request, request.headers.get("x-integrator"))
 
-        total = sum(i["qty"] * i["unit_price"] for i in normalized_items)
+@router.post("/orders/webhook/{integrator}", status_code=status.HTTP_200_OK, tags=["Orders"])
+async def orders_webhook_integrator(integrator: str, request: Request):
+    return await _handle_webhook(request, integrator)
 
-        order = Order(
-            external_code=external_code,
-            customer_name=customer_name,
-            note=note,
-            total_amount=total,
-            status="CREATED",
-        )
-        db.add(order)
-        db.flush()
+async def _handle_webhook(request: Request, integrator: Optional[str]):
+    normalizer = get_normalizer(integrator)
+    if normalizer is None:
+        raise HTTPException(status_code=404, detail="Integrador desconhecido")
+    try:
+        data = normalizer.normalize(await request.json())
+    except NormalizationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Payload inválido")
 
-        for it in normalized_items:
-            db.add(
-                OrderItem(
-                    order_id=order.id,
-                    sku=it["sku"],
-                    name=it["name"],
-                    qty=it["qty"],
-                    unit_price=it["unit_price"],
-                    total=it["qty"] * it["unit_price"],
-                )
+    code = data["external_code"]
+    if code:
+        existing = order_index.cached(code)
+        if existing is not None:
+            return _duplicate_response(existing)
+
+    if WEBHOOK_MODE == "queue":
+        accepted = {"ok": True, "queued": True, "external_code": code}
+        if code and not order_index.mark_pending(code):
+            # mesma entrega já está na fila
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={**accepted, "duplicate": True})
+        if code:
+            # miss no LRU (ex.: reentrega depois de um restart): SELECT indexado antes de enfileirar
+            try:
+                existing = await asyncio.to_thread(_lookup_external_code, code)
+            except Exception as e:
+                order_index.release_pending(code)
+                logger.exception("Erro no webhook de pedidos (consulta do external_code): %s", e)
+                raise HTTPException(status_code=500, detail="Erro ao processar webhook")
+            if existing is not None:
+                return _duplicate_response(existing)  # lookup() -> remember() já tirou o código de pending
+        try:
+            depth = webhook_queue.enqueue(data)
+        except asyncio.QueueFull:
+            if code:
+                order_index.release_pending(code)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Fila de pedidos cheia, tente novamente",
+                headers={"Retry-After": "1"},
             )
+        except QueueNotRunning:
+            if code:
+                order_index.release_pending(code)
+            raise HTTPException(status_code=503, detail="Fila de pedidos indisponível")
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={**accepted, "queue_depth": depth})
+
+    db = _db_session()
+    try:
+        if code:
+            existing = order_index.lookup(db, code)
+            if existing is not None:
+                return _duplicate_response(existing)
 
+        order = _add_normalized_order(db, data)
+        db.flush()
+        order_id = order.id
+        _reserve(db, order_id, [(it["sku"], it["qty"]) for it in data["items"]])
         db.commit()
+        if code:
+            order_index.remember(code, order_id)
+        _publish_webhook_created(order_id, data)
         logger.info(
             "Webhook recebido: order_id=%s external_code=%s itens=%s total=%.2f",
-            order.id,
-            external_code,
-            len(normalized_items),
-            total,
+            order_id,
+            code,
+            len(data["items"]),
+            data["total"],
         )
-        return {"ok": True, "order_id": order.id}
+        return {"ok": True, "order_id": order_id}
 
-    except HTTPException:
+    except IntegrityError:
+        # corrida: outra entrega do mesmo pedido gravou antes
+        db.rollback()
+        existing = order_index.lookup(db, code) if code else None
+        if existing is None:
+            logger.exception("Erro no webhook de pedidos (integridade): external_code=%s", code)
+            raise HTTPException(status_code=500, detail="Erro ao processar webhook")
+        return _duplicate_response(existing)
+    except (InsufficientStock, ReservationConflict) as e:
         db.rollback()
-        raise
+        raise _stock_error(e)
     except Exception as e:
         db.rollback()
         logger.exception("Erro no webhook de pedidos: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao processar webhook")
     finally:
         db.close()
+
+@router.get("/orders/webhook/metrics", tags=["Orders"])
+def webhook_queue_metrics():
+    return {
+        "mode": WEBHOOK_MODE,
+        **webhook_queue.metrics(),
+        "dedup": order_index.metrics(),
+        "reservations": stock_reservations.metrics(),
+    }
+
+@router.get("/orders/events/metrics", tags=["Orders"])
+def order_events_metrics():
+    return order_events.metrics()
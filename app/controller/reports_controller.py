@@ -0,0 +1,125 @@
+
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from typing import Optional, List, Literal
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models import SessionLocal, SalesRollup
+from app import sales_rollup
+
+router = APIRouter(tags=["Reports"])
+
+# Schemas
+class SalesRow(BaseModel):
+    period: Optional[datetime] = None  # início do período (UTC); None quando agrupado só por SKU
+    sku: Optional[str] = None          # None quando agrupado só por período
+    qty: float
+    revenue: float
+    order_count: int
+
+class SalesReportOut(BaseModel):
+    granularity: str
+    group_by: str
+    start: Optional[datetime]
+    end: Optional[datetime]
+    total_qty: float
+    total_revenue: float
+    total_orders: int
+    rows: List[SalesRow]
+
+class RollupRebuildOut(BaseModel):
+    orders: int
+
+def _db() -> Session:
+    return SessionLocal()
+
+@router.get("/reports/sales", response_model=SalesReportOut)
+def sales_report(
+    start: Optional[datetime] = Query(None, description="Início (inclusive, UTC)"),
+    end: Optional[datetime] = Query(None, description="Fim (exclusivo, UTC)"),
+    granularity: Literal["day", "hour"] = "day",
+    group_by: Literal["period", "sku", "period_sku"] = "period",
+    sku: Optional[str] = None,
+):
+    """
+    Relatório de vendas respondido só a partir de sales_rollups (nunca de order_items).
+    Períodos em UTC; start/end são arredondados para o início do período.
+    """
+    start = sales_rollup.to_utc_naive(start) if start else None
+    end = sales_rollup.to_utc_naive(end) if end else None
+    if start and end and start >= end:
+        raise HTTPException(400, "start deve ser anterior a end")
+    db = _db()
+    try:
+        # order_count 0: período/SKU cujos pedidos foram todos cancelados (o rebuild nem grava a linha)
+        q = db.query(SalesRollup).filter(SalesRollup.granularity == granularity, SalesRollup.order_count > 0)
+        if start:
+            q = q.filter(SalesRollup.bucket_start >= sales_rollup.bucket_start(start, granularity))
+        if end:
+            q = q.filter(SalesRollup.bucket_start < end)
+
+        # totais (e o agrupamento por período) vêm das linhas "*", sem dupla contagem de pedidos
+        totals = q.filter(SalesRollup.sku == sales_rollup.TOTAL_SKU)
+        if sku:
+            q = q.filter(SalesRollup.sku == sku)
+            totals = q
+        else:
+            q = q.filter(SalesRollup.sku != sales_rollup.TOTAL_SKU)
+
+        total_qty, total_revenue, total_orders = totals.with_entities(
+            func.coalesce(func.sum(SalesRollup.qty), 0),
+            func.coalesce(func.sum(SalesRollup.revenue), 0),
+            func.coalesce(func.sum(SalesRollup.order_count), 0),
+        ).one()
+
+        if group_by == "period":
+            rows = [
+                SalesRow(period=r.bucket_start, sku=sku, qty=r.qty, revenue=r.revenue, order_count=r.order_count)
+                for r in totals.order_by(SalesRollup.bucket_start.asc()).all()
+            ]
+        elif group_by == "sku":
+            grouped = (
+                q.with_entities(
+                    SalesRollup.sku,
+                    func.sum(SalesRollup.qty),
+                    func.sum(SalesRollup.revenue),
+                    func.sum(SalesRollup.order_count),
+                )
+                .group_by(SalesRollup.sku)
+                .order_by(func.sum(SalesRollup.revenue).desc())
+                .all()
+            )
+            rows = [SalesRow(sku=s, qty=qt, revenue=rv, order_count=oc) for s, qt, rv, oc in grouped]
+        else:
+            rows = [
+                SalesRow(period=r.bucket_start, sku=r.sku, qty=r.qty, revenue=r.revenue, order_count=r.order_count)
+                for r in q.order_by(SalesRollup.bucket_start.asc(), SalesRollup.sku.asc()).all()
+            ]
+
+        return SalesReportOut(
+            granularity=granularity,
+            group_by=group_by,
+            start=start,
+            end=end,
+            total_qty=total_qty,
+            total_revenue=total_revenue,
+            total_orders=total_orders,
+            rows=rows,
+        )
+    finally:
+        db.close()
+
+@router.post("/reports/sales/rebuild", response_model=RollupRebuildOut)
+def rebuild_sales_rollup():
+    """Recria os agregados do zero a partir dos pedidos (ex.: após importação ou correção manual)."""
+    db = _db()
+    try:
+        orders = sales_rollup.rebuild(db)
+        db.commit()
+        return RollupRebuildOut(orders=orders)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -1,9 +1,14 @@
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, Body, HTTPException, Query, Response, status
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from typing import Dict, Optional, List, Literal
 from sqlalchemy.orm import Session
-from app.models import SessionLocal, Product, StockItem, StockMovement, MovementType
+from sqlalchemy.orm.exc import StaleDataError
+from app.models import SessionLocal, engine, Product, ProductCost, StockItem, StockMovement, MovementType
+from app.search import apply_search
+from app import stock_cost, stock_ledger, stock_reconcile
+from app.stock_ops import apply_stock_deltas, insert_movements, resolve_skus
 
 router = APIRouter(tags=["Stock"])
 
@@ -14,13 +19,15 @@ class StockItemOut(BaseModel):
     unit: str
     quantity: float
     min_quantity: float
+    reserved: float    # reservado por pedidos ainda não confirmados
+    available: float   # quantity - reserved
     class Config:
         from_attributes = True
 
 class StockAdjustIn(BaseModel):
     sku: str = Field(..., min_length=1)
     movement_type: Literal["IN", "OUT", "ADJUST"]
-    quantity: float = Field(..., gt=0)
+    quantity: float  # IN/OUT: > 0; ADJUST: delta com sinal (negativo reduz o saldo), != 0
     unit_price: Optional[float] = None
     reason: Optional[str] = None
     reference: Optional[str] = None
@@ -33,32 +40,249 @@ class MovementOut(BaseModel):
     unit_price: Optional[float]
     reason: Optional[str]
     reference: Optional[str]
+    cost_avg: Optional[float] = None   # valor pelo custo médio (saída = CMV)
+    cost_fifo: Optional[float] = None  # valor pelo FIFO
     class Config:
         from_attributes = True
 
+class AdjustBatchError(BaseModel):
+    index: int  # posição no payload
+    sku: str
+    error: str
+
+class AdjustBatchItemOut(BaseModel):
+    product_id: int
+    sku: str
+    quantity: float  # saldo após o lote
+
+class AdjustBatchOut(BaseModel):
+    movements: int
+    items: List[AdjustBatchItemOut]
+
+class BalanceOut(BaseModel):
+    product_id: int
+    sku: str
+    name: str
+    quantity: float                   # saldo do ledger em `at`
+    snapshot_at: Optional[datetime]   # snapshot usado como base (None = desde o primeiro movimento)
+    movements: int                    # movimentos somados depois do snapshot
+
+class SnapshotRunOut(BaseModel):
+    snapshots: int
+
+class LedgerMismatchOut(BaseModel):
+    product_id: int
+    sku: str
+    counter: float     # StockItem.quantity
+    ledger: float      # saldo pelos movimentos
+    difference: float
+
+class LedgerVerifyOut(BaseModel):
+    checked_at: datetime
+    mismatches: List[LedgerMismatchOut]
+
+class DriftRowOut(BaseModel):
+    product_id: int
+    sku: Optional[str]
+    counter: float
+    ledger: float
+    drift: float  # counter - ledger
+
+class ReconcileOut(BaseModel):
+    movements: int
+    products: int
+    drifted: int
+    total_abs_drift: float
+    corrections: int
+    elapsed_ms: float
+    drift: List[DriftRowOut]
+
+class ProductCostOut(BaseModel):
+    product_id: int
+    sku: str
+    name: str
+    price: float
+    quantity: float                 # saldo visto pelo custeio
+    avg_cost: float                 # custo médio ponderado unitário
+    fifo_cost: Optional[float]      # custo unitário das camadas FIFO abertas (None sem saldo)
+    margin: float                   # price - avg_cost
+    margin_pct: Optional[float]     # margem sobre o preço, em %
+
+class CostRebuildOut(BaseModel):
+    products: int
+    movements: int
+    orders: int
+    elapsed_ms: float
+
 def _db() -> Session:
     return SessionLocal()
 
+ADJUST_BATCH_MAX = 5000
+_SIGN = {"IN": 1.0, "OUT": -1.0, "ADJUST": 1.0}  # ADJUST já vem com sinal
+
+def _quantity_error(movement_type: str, qty: float) -> Optional[str]:
+    if movement_type == "ADJUST":
+        if qty == 0:
+            return "ADJUST exige quantidade diferente de zero"
+    elif qty <= 0:
+        return "Quantidade deve ser maior que zero para IN/OUT"
+    return None
+
 @router.get("/stock", response_model=List[StockItemOut])
-def list_stock(search: Optional[str] = None):
+def list_stock(
+    response: Response,
+    search: Optional[str] = None,
+    below_min: bool = Query(False, description="Somente itens com quantity < min_quantity"),
+    limit: int = Query(100, ge=1, le=500),
+    after_id: Optional[int] = Query(None, ge=0, description="Cursor: retorna itens com product_id > after_id"),
+):
+    """
+    Estoque em uma única consulta (só as colunas necessárias, sem carregar Product por item).
+    - Sem `search`: ordem por product_id com cursor (keyset); header X-Next-After-Id traz a próxima página.
+    - Com `search`: ordem por relevância, apenas os `limit` primeiros.
+    - below_min=true usa o índice parcial ix_stock_items_below_min.
+    """
     db = _db()
     try:
-        q = db.query(StockItem).join(Product, StockItem.product_id == Product.id)
+        q = db.query(
+            StockItem.product_id, Product.sku, Product.name,
+            StockItem.unit, StockItem.quantity, StockItem.min_quantity, StockItem.reserved,
+            (StockItem.quantity - StockItem.reserved).label("available"),
+        ).join(Product, StockItem.product_id == Product.id)
+        if below_min:
+            q = q.filter(StockItem.quantity < StockItem.min_quantity)
         if search:
-            like = f"%{search}%"
-            q = q.filter((Product.name.ilike(like)) | (Product.sku.ilike(like)))
-        rows = q.all()
-        result = []
-        for si in rows:
-            result.append(StockItemOut(
-                product_id=si.product_id,
-                sku=si.product.sku,
-                name=si.product.name,
-                unit=si.unit,
-                quantity=si.quantity,
-                min_quantity=si.min_quantity
+            q = apply_search(q, "products", search)  # ordena por relevância
+        else:
+            if after_id is not None:
+                q = q.filter(StockItem.product_id > after_id)
+            q = q.order_by(StockItem.product_id.asc())
+        rows = q.limit(limit).all()
+
+        if not search and len(rows) == limit:
+            response.headers["X-Next-After-Id"] = str(rows[-1].product_id)
+        return [StockItemOut.model_validate(r) for r in rows]
+    finally:
+        db.close()
+
+@router.get("/stock/balance", response_model=List[BalanceOut])
+def stock_balance(
+    response: Response,
+    at: datetime = Query(..., description="Instante da consulta (sem fuso = UTC)"),
+    sku: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    after_id: Optional[int] = Query(None, ge=0, description="Cursor: produtos com id > after_id"),
+):
+    """
+    Saldo de estoque em um instante passado: último snapshot <= at + movimentos até `at`.
+    Paginação por cursor (X-Next-After-Id), como em GET /stock.
+    """
+    db = _db()
+    try:
+        q = db.query(Product.id, Product.sku, Product.name)
+        if sku:
+            q = q.filter(Product.sku == sku)
+        if after_id is not None:
+            q = q.filter(Product.id > after_id)
+        products = q.order_by(Product.id.asc()).limit(limit).all()
+        if sku and not products:
+            raise HTTPException(404, "Produto não encontrado pelo SKU")
+
+        balances = stock_ledger.ledger_balances(db, at, [p.id for p in products])
+        if len(products) == limit:
+            response.headers["X-Next-After-Id"] = str(products[-1].id)
+        empty = {"quantity": 0.0, "snapshot_at": None, "movements": 0}
+        return [
+            BalanceOut(product_id=p.id, sku=p.sku, name=p.name, **balances.get(p.id, empty))
+            for p in products
+        ]
+    finally:
+        db.close()
+
+@router.post("/stock/snapshots", response_model=SnapshotRunOut)
+def run_stock_snapshots():
+    """Executa agora o job de snapshots (normalmente agendado, ver STOCK_SNAPSHOT_INTERVAL_MINUTES)."""
+    db = _db()
+    try:
+        written = stock_ledger.take_snapshots(db)
+        db.commit()
+        return SnapshotRunOut(snapshots=written)
+    finally:
+        db.close()
+
+@router.get("/stock/verify", response_model=LedgerVerifyOut)
+def verify_stock_ledger(sku: Optional[str] = None):
+    """Modo de verificação: lista os produtos cujo contador difere do saldo do ledger."""
+    db = _db()
+    try:
+        product_ids = None
+        if sku:
+            p = db.query(Product.id).filter(Product.sku == sku).first()
+            if not p:
+                raise HTTPException(404, "Produto não encontrado pelo SKU")
+            product_ids = [p.id]
+        mismatches = stock_ledger.verify(db, product_ids)
+        return LedgerVerifyOut(checked_at=datetime.now(timezone.utc), mismatches=mismatches)
+    finally:
+        db.close()
+
+@router.post("/stock/reconcile", response_model=ReconcileOut)
+def reconcile_stock(
+    apply: bool = Query(False, description="Grava movimentos ADJUST que zeram a divergência"),
+    top: int = Query(200, ge=1, le=10000, description="Divergências devolvidas (maiores primeiro)"),
+):
+    """
+    Reconciliação completa do contador contra o ledger (soma por produto feita no banco).
+    Para bases muito grandes prefira o comando: python -m app.stock_reconcile [--apply]
+    """
+    result = stock_reconcile.reconcile(engine, apply=apply)
+    result["drift"] = result["drift"][:top]
+    return result
+
+@router.get("/stock/costs", response_model=List[ProductCostOut])
+def list_product_costs(
+    sku: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Custo corrente e margem por SKU, lidos de product_costs (mantido a cada movimento)."""
+    db = _db()
+    try:
+        q = (
+            db.query(Product.id, Product.sku, Product.name, Product.price,
+                     ProductCost.quantity, ProductCost.avg_cost, ProductCost.fifo_value)
+            .join(ProductCost, ProductCost.product_id == Product.id)
+        )
+        if sku:
+            q = q.filter(Product.sku == sku)
+        rows = q.order_by(Product.id).offset(offset).limit(limit).all()
+        out = []
+        for pid, p_sku, name, price, qty, avg_cost, fifo_value in rows:
+            margin = price - avg_cost
+            out.append(ProductCostOut(
+                product_id=pid, sku=p_sku, name=name, price=price, quantity=qty, avg_cost=avg_cost,
+                fifo_cost=fifo_value / qty if qty > stock_cost.EPS else None,
+                margin=margin,
+                margin_pct=round(margin / price * 100, 2) if price else None,
             ))
-        return result
+        return out
+    finally:
+        db.close()
+
+@router.post("/stock/costs/rebuild", response_model=CostRebuildOut)
+def rebuild_product_costs():
+    """
+    Recalcula custo médio, camadas FIFO, valor dos movimentos e CMV dos pedidos a partir do histórico
+    (backfill, importação de movimentos antigos). Para bases grandes: python -m app.stock_cost
+    """
+    db = _db()
+    try:
+        result = stock_cost.rebuild(db)
+        db.commit()
+        return CostRebuildOut(**result)
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
@@ -74,30 +298,97 @@ def adjust_stock(payload: StockAdjustIn):
             raise HTTPException(400, "Produto sem registro de estoque")
 
         qty = float(payload.quantity)
+        error = _quantity_error(payload.movement_type, qty)
+        if error:
+            raise HTTPException(422, error)
         if payload.movement_type == "IN":
             si.quantity += qty
         elif payload.movement_type == "OUT":
             si.quantity -= qty
         elif payload.movement_type == "ADJUST":
-            # Ajuste positivo/negativo: usa 'OUT' com sinal? Aqui vamos aplicar como delta positivo.
+            # ajuste = delta com sinal, gravado com o mesmo sinal no movimento (ledger soma ADJUST)
             si.quantity += qty
         else:
             raise HTTPException(400, "Tipo de movimento inválido")
 
-        mv = StockMovement(
-            product_id=p.id,
-            movement_type=payload.movement_type,  # type: ignore
-            quantity=qty,
-            unit_price=float(payload.unit_price) if payload.unit_price is not None else None,
-            reason=payload.reason,
-            reference=payload.reference
-        )
+        row = {
+            "product_id": p.id,
+            "movement_type": MovementType(payload.movement_type),
+            "quantity": qty,
+            "unit_price": float(payload.unit_price) if payload.unit_price is not None else None,
+            "reason": payload.reason,
+            "reference": payload.reference,
+        }
+        stock_cost.apply_movements(db, [row])  # preenche cost_avg/cost_fifo
+        mv = StockMovement(**row)
         db.add(mv)
-        db.commit(); db.refresh(mv)
+        try:
+            db.commit()
+        except StaleDataError:
+            # StockItem.version mudou desde a leitura (reserva, baixa ou outro ajuste)
+            db.rollback()
+            raise HTTPException(409, "Estoque alterado por outra requisição, tente novamente")
+        db.refresh(mv)
         return mv
     finally:
         db.close()
 
+@router.post("/stock/adjust/batch", response_model=AdjustBatchOut, status_code=status.HTTP_201_CREATED)
+def adjust_stock_batch(payload: List[StockAdjustIn] = Body(..., min_length=1, max_length=ADJUST_BATCH_MAX)):
+    """
+    Vários ajustes (ex.: contagem de inventário) numa transação, tudo ou nada:
+    - 1 SELECT resolve todos os SKUs; qualquer entrada inválida rejeita o lote (422 com a lista);
+    - deltas somados por item e aplicados num UPDATE executemany (quantity = quantity + :delta);
+    - 1 INSERT multi-linha com um StockMovement por entrada; 1 commit.
+    """
+    db = _db()
+    try:
+        resolved = resolve_skus(db, (e.sku for e in payload))
+        errors: List[AdjustBatchError] = []
+        for i, e in enumerate(payload):
+            error = _quantity_error(e.movement_type, float(e.quantity))
+            if error is None and e.sku not in resolved:
+                error = "Produto não encontrado pelo SKU"
+            elif error is None and resolved[e.sku][1] is None:
+                error = "Produto sem registro de estoque"
+            if error:
+                errors.append(AdjustBatchError(index=i, sku=e.sku, error=error))
+        if errors:
+            raise HTTPException(422, {"message": "Lote rejeitado", "errors": [x.model_dump() for x in errors]})
+
+        deltas: Dict[int, float] = {}
+        movements = []
+        for e in payload:
+            product_id, stock_item_id = resolved[e.sku]
+            qty = float(e.quantity)
+            deltas[stock_item_id] = deltas.get(stock_item_id, 0.0) + _SIGN[e.movement_type] * qty
+            movements.append({
+                "product_id": product_id,
+                "movement_type": MovementType(e.movement_type),
+                "quantity": qty,
+                "unit_price": float(e.unit_price) if e.unit_price is not None else None,
+                "reason": e.reason,
+                "reference": e.reference,
+            })
+        apply_stock_deltas(db, deltas)
+        insert_movements(db, movements)
+
+        product_ids = {resolved[e.sku][0] for e in payload}
+        items = (
+            db.query(StockItem.product_id, Product.sku, StockItem.quantity)
+            .join(Product, Product.id == StockItem.product_id)
+            .filter(StockItem.product_id.in_(product_ids))
+            .order_by(StockItem.product_id)
+            .all()
+        )
+        db.commit()
+        return AdjustBatchOut(
+            movements=len(movements),
+            items=[AdjustBatchItemOut(product_id=pid, sku=sku, quantity=qty) for pid, sku, qty in items],
+        )
+    finally:
+        db.close()
+
 @router.get("/stock/movements", response_model=List[MovementOut])
 def list_movements(limit: int = Query(100, ge=1, le=500), offset: int = Query(0, ge=0)):
     db = _db()
@@ -0,0 +1,157 @@
+
+# app/customer_identity.py
+# Identidade de clientes por chaves normalizadas, gravadas em colunas indexadas de customers:
+# - document_key: CPF/CNPJ só com dígitos (zeros à esquerda recompostos: 11 ou 14 dígitos);
+# - phone_key: só dígitos, sem DDI 55 e sem zero de tronco ("+55 (11) 98765-4321" -> "11987654321");
+# - email_key: e-mail sem espaços, em minúsculas.
+# Busca exata = igualdade no índice. Duplicados = GROUP BY por chave (sem comparar pares) e união
+# dos grupos que compartilham clientes (A e B com o mesmo telefone, B e C com o mesmo e-mail).
+import re
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.engine import Engine
+
+from app.models import Customer
+
+_DIGITS_RE = re.compile(r"\D")
+
+BACKFILL_CHUNK = 2000
+
+
+def document_key(value: Optional[str]) -> Optional[str]:
+    digits = _DIGITS_RE.sub("", value or "")
+    if 9 <= len(digits) <= 11:
+        return digits.zfill(11)  # CPF (planilhas costumam perder os zeros à esquerda)
+    if 12 <= len(digits) <= 14:
+        return digits.zfill(14)  # CNPJ
+    return None
+
+
+def phone_key(value: Optional[str]) -> Optional[str]:
+    digits = _DIGITS_RE.sub("", value or "").lstrip("0")
+    if len(digits) in (12, 13) and digits.startswith("55"):
+        digits = digits[2:]
+    return digits if 8 <= len(digits) <= 20 else None
+
+
+def email_key(value: Optional[str]) -> Optional[str]:
+    email = (value or "").strip().lower()
+    return email if "@" in email else None
+
+
+# tipo de chave -> (coluna bruta, coluna normalizada, normalizador)
+KEYS: Dict[str, tuple] = {
+    "document": ("document", "document_key", document_key),
+    "phone": ("phone", "phone_key", phone_key),
+    "email": ("email", "email_key", email_key),
+}
+
+
+def normalizer(kind: str) -> Callable[[Optional[str]], Optional[str]]:
+    return KEYS[kind][2]
+
+
+def stamp(customer: Customer) -> None:
+    """Recalcula as chaves a partir dos campos brutos (chamar antes de gravar)."""
+    for raw, key, normalize in KEYS.values():
+        setattr(customer, key, normalize(getattr(customer, raw)))
+
+
+def key_column(kind: str):
+    return getattr(Customer, KEYS[kind][1])
+
+
+def key_prefix(kind: str, digits: str):
+    """
+    Chave numérica que começa com `digits`, escrita como faixa [digits, próximo prefixo):
+    usa o índice da chave em qualquer banco (LIKE 'x%' só usa com collation/opclass específica).
+    """
+    column = key_column(kind)
+    head = digits.rstrip("9")
+    if not head:
+        return column >= digits  # "99...": não há próximo prefixo com o mesmo tamanho
+    upper = head[:-1] + str(int(head[-1]) + 1)
+    return (column >= digits) & (column < upper)
+
+
+def backfill_keys(engine: Engine, chunk_size: int = BACKFILL_CHUNK) -> int:
+    """
+    Preenche as chaves de clientes gravados antes delas existirem (idempotente; roda no startup).
+    Percorre por id em blocos; retorna quantos clientes foram atualizados.
+    """
+    t = Customer.__table__
+    pending = or_(*[
+        (t.c[raw].is_not(None)) & (t.c[key].is_(None)) for raw, key, _ in KEYS.values()
+    ])
+    stmt = (
+        update(t)
+        .where(t.c.id == bindparam("b_id"))
+        .values(**{key: bindparam(f"b_{key}") for _, key, _ in KEYS.values()})
+    )
+    updated = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(t.c.id, t.c.document, t.c.phone, t.c.email)
+                .where(pending, t.c.id > last_id)
+                .order_by(t.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                return updated
+            last_id = rows[-1].id
+            params = []
+            for row in rows:
+                keys = {f"b_{key}": normalize(getattr(row, raw)) for raw, key, normalize in KEYS.values()}
+                if any(keys.values()):
+                    params.append({"b_id": row.id, **keys})
+            if params:
+                conn.execute(stmt, params)
+                updated += len(params)
+
+
+def duplicate_groups(conn, kinds: List[str]) -> List[dict]:
+    """
+    Grupos de clientes que compartilham alguma chave normalizada.
+    Por chave: GROUP BY ... HAVING count(*) > 1; grupos com clientes em comum são unidos (union-find).
+    Retorna [{"customer_ids": [...], "keys": {"phone": [...], ...}}], maiores grupos primeiro.
+    """
+    parent: Dict[int, int] = {}
+
+    def find(x: int) -> int:
+        root = x
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    memberships = []
+    for kind in kinds:
+        col = key_column(kind)
+        dup = select(col).where(col.is_not(None)).group_by(col).having(func.count() > 1).subquery()
+        members: Dict[str, List[int]] = {}
+        for cid, key in conn.execute(
+            select(Customer.id, col).where(col.in_(select(dup.c[0]))).order_by(col, Customer.id)
+        ):
+            members.setdefault(key, []).append(cid)
+        for key, ids in members.items():
+            first = find(ids[0])
+            for cid in ids[1:]:
+                other = find(cid)
+                if other != first:
+                    parent[other] = first
+            memberships.append((ids[0], kind, key))
+
+    groups: Dict[int, dict] = {}
+    for cid in list(parent):
+        groups.setdefault(find(cid), {"customer_ids": [], "keys": {}})["customer_ids"].append(cid)
+    for cid, kind, key in memberships:
+        groups[find(cid)]["keys"].setdefault(kind, []).append(key)
+    result = list(groups.values())
+    for g in result:
+        g["customer_ids"].sort()
+    result.sort(key=lambda g: (-len(g["customer_ids"]), g["customer_ids"][0]))
+    return result
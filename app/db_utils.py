@@ -0,0 +1,39 @@
+
+# app/db_utils.py
+# Utilitários de SQL dependentes do dialeto (SQLite em dev, Postgres em produção).
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+
+
+def dialect_name(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def upsert_insert(db: Session):
+    """
+    Retorna a função `insert` do dialeto atual, que suporta
+    .on_conflict_do_update() / .on_conflict_do_nothing() (SQLite >= 3.24 e Postgres).
+    """
+    name = dialect_name(db)
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Upsert não suportado para o banco '{name}'")
+    return insert
+
+
+def db_timestamp(db: Session, ts: datetime) -> datetime:
+    """
+    Converte `ts` para comparar com colunas DateTime(timezone=True):
+    no SQLite (texto UTC sem fuso, gravado por CURRENT_TIMESTAMP) vira UTC naive;
+    nos demais, UTC com fuso. Datas sem fuso são tratadas como UTC.
+    """
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    if dialect_name(db) == "sqlite":
+        return ts.replace(tzinfo=None)
+    return ts
@@ -0,0 +1,107 @@
+
+# app/exports.py
+# Exportações grandes (pedidos, produtos, movimentações) em memória constante:
+# - as linhas vêm do banco em blocos (yield_per -> cursor do lado do servidor no Postgres);
+# - CSV é escrito e enviado aos pedaços; XLSX usa o modo write-only do openpyxl,
+#   montado num arquivo temporário em disco e enviado em blocos.
+import csv
+import enum
+import io
+import tempfile
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator, Sequence
+
+from sqlalchemy.orm import Query, Session
+
+from app.sales_rollup import to_utc_naive
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+CSV_FLUSH_ROWS = 1000
+FILE_CHUNK = 64 * 1024
+
+
+def stream_query(session_factory: Callable[[], Session], build: Callable[[Session], Query],
+                 chunk_size: int = 2000) -> Iterator[tuple]:
+    """
+    Abre a própria sessão (o gerador vive além do endpoint) e devolve as linhas em blocos.
+    A sessão é fechada no fim ou quando o cliente desconecta (GeneratorExit).
+    """
+    db = session_factory()
+    try:
+        for row in build(db).execution_options(yield_per=chunk_size):
+            yield tuple(row)
+    finally:
+        db.close()
+
+
+# texto que a planilha interpretaria como fórmula (nome de cliente "=HYPERLINK(...)" etc.)
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _safe_text(value: str) -> str:
+    """Prefixa com ' o texto que começaria uma fórmula no Excel/LibreOffice (CSV injection)."""
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def _csv_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str):
+        return _safe_text(value)
+    return value
+
+
+def _xlsx_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return to_utc_naive(value)  # Excel não aceita fuso horário
+    if isinstance(value, str):
+        return _safe_text(value)  # o openpyxl gravaria "=..." como fórmula
+    return value
+
+
+def iter_csv(header: Sequence[str], rows: Iterable[tuple]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")  # BOM: o Excel abre acentos corretamente
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_value(v) for v in row])
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    yield buf.getvalue().encode("utf-8")
+
+
+def iter_xlsx(sheet_title: str, header: Sequence[str], rows: Iterable[tuple]) -> Iterator[bytes]:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    ws.append(list(header))
+    for row in rows:
+        ws.append([_xlsx_value(v) for v in row])
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(FILE_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+
+def render(fmt: str, sheet_title: str, header: Sequence[str], rows: Iterable[tuple]) -> Iterator[bytes]:
+    if fmt == "xlsx":
+        return iter_xlsx(sheet_title, header, rows)
+    return iter_csv(header, rows)
@@ -0,0 +1,192 @@
+
+# app/menu.py
+# Documento do cardápio (categorias -> produtos -> disponibilidade) pré-serializado em memória.
+# - O GET /menu só lê os bytes prontos; nada de consulta no caminho quente.
+# - Qualquer INSERT/UPDATE/DELETE confirmado em categories/products/stock_items (ORM ou Core)
+#   agenda a reconstrução numa thread de fundo; rajadas de alterações viram um único rebuild.
+# - A marcação acontece quando a conexão volta ao pool, depois do COMMIT do driver: o rebuild
+#   nunca lê o estado anterior à gravação (o evento "commit" do engine dispara antes dele).
+# - Com vários workers cada processo só vê as próprias gravações: o rebuild periódico
+#   (`refresh`) cobre as feitas nos demais.
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models import Category, Product, StockItem
+
+logger = logging.getLogger("uvicorn.error")
+
+WATCHED_TABLES = frozenset({Category.__tablename__, Product.__tablename__, StockItem.__tablename__})
+_DIRTY_KEY = "xis_menu_dirty"
+_COMMITTED_KEY = "xis_menu_committed"
+
+
+class MenuDocument:
+    def __init__(self, session_factory: Callable[[], Session], debounce: float = 0.3, refresh: float = 60.0):
+        self.session_factory = session_factory
+        self.debounce = debounce
+        self.refresh = refresh
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.version = 0
+        self.built_at: Optional[datetime] = None
+        self.rebuilds = 0
+        self.errors = 0
+        self.last_build_ms = 0.0
+        self._build_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._watched: Optional[Engine] = None
+
+    # ---------------------------------------------------------------- montagem
+    def _load(self, db: Session) -> dict:
+        categories = (
+            db.query(Category.id, Category.name, Category.description)
+            .filter(Category.active.is_(True))
+            .order_by(Category.name.asc())
+            .all()
+        )
+        rows = (
+            db.query(
+                Product.id, Product.sku, Product.name, Product.description, Product.price,
+                Product.category_id, StockItem.unit, StockItem.quantity, StockItem.reserved,
+            )
+            .outerjoin(StockItem, StockItem.product_id == Product.id)
+            .filter(Product.active.is_(True))
+            .order_by(Product.name.asc())
+            .all()
+        )
+        by_category = {c.id: [] for c in categories}
+        uncategorized = []
+        for r in rows:
+            product = {
+                "id": r.id,
+                "sku": r.sku,
+                "name": r.name,
+                "description": r.description,
+                "price": r.price,
+                "unit": r.unit or "UN",
+                # sem StockItem: não controla estoque; reservas de pedidos abertos já não estão disponíveis
+                "in_stock": r.quantity is None or r.quantity - r.reserved > 0,
+            }
+            if r.category_id is None:
+                uncategorized.append(product)
+            elif r.category_id in by_category:
+                by_category[r.category_id].append(product)
+            # produto de categoria inativa fica fora do cardápio
+        return {
+            "categories": [
+                {"id": c.id, "name": c.name, "description": c.description, "products": by_category[c.id]}
+                for c in categories
+            ],
+            "uncategorized": uncategorized,
+        }
+
+    def build(self) -> bytes:
+        with self._build_lock:
+            t0 = time.perf_counter()
+            db = self.session_factory()
+            try:
+                doc = self._load(db)
+            finally:
+                db.close()
+            body = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+            if etag != self.etag:  # rebuild sem mudança mantém versão e ETag
+                self.body = body
+                self.etag = etag
+                self.version += 1
+                self.built_at = datetime.now(timezone.utc)
+            self.rebuilds += 1
+            self.last_build_ms = (time.perf_counter() - t0) * 1e3
+            return self.body
+
+    def ensure_built(self) -> None:
+        if self.body is None:
+            self.build()
+
+    def invalidate(self) -> None:
+        self._dirty.set()
+
+    # ---------------------------------------------------- detecção de mudanças
+    def watch(self, engine: Engine) -> None:
+        """Registra os eventos do engine (idempotente)."""
+        if self._watched is engine:
+            return
+        event.listen(engine, "after_execute", self._after_execute)
+        event.listen(engine, "commit", self._on_commit)
+        event.listen(engine, "rollback", self._after_rollback)
+        event.listen(engine, "checkin", self._after_checkin)
+        self._watched = engine
+
+    def _after_execute(self, conn, clauseelement, multiparams, params, execution_options, result):
+        if getattr(clauseelement, "is_dml", False):
+            table = getattr(clauseelement, "table", None)
+            if getattr(table, "name", None) in WATCHED_TABLES:
+                conn.info[_DIRTY_KEY] = True
+
+    def _on_commit(self, conn):
+        # disparado antes do COMMIT do driver: só registra; a invalidação fica para o checkin
+        if conn.info.pop(_DIRTY_KEY, False):
+            conn.info[_COMMITTED_KEY] = True
+
+    def _after_rollback(self, conn):
+        conn.info.pop(_DIRTY_KEY, None)
+
+    def _after_checkin(self, dbapi_connection, connection_record):
+        # conexão devolvida ao pool (fim do Session.commit()/engine.begin()): o COMMIT já terminou
+        if connection_record is not None and connection_record.info.pop(_COMMITTED_KEY, False):
+            self.invalidate()
+
+    # ------------------------------------------------------- thread de fundo
+    def start(self, engine: Optional[Engine] = None) -> None:
+        if engine is not None:
+            self.watch(engine)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._dirty.set()  # primeira montagem já na partida
+        self._thread = threading.Thread(target=self._run, name="menu-rebuild", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._dirty.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self._dirty.wait(self.refresh):
+                time.sleep(self.debounce)  # agrupa rajadas (import, bulk, vários pedidos)
+            if self._stop.is_set():
+                break
+            self._dirty.clear()
+            try:
+                self.build()
+            except Exception:
+                self.errors += 1
+                logger.exception("Falha ao reconstruir o cardápio")
+
+    def metrics(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "version": self.version,
+            "etag": self.etag,
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+            "bytes": len(self.body) if self.body else 0,
+            "rebuilds": self.rebuilds,
+            "errors": self.errors,
+            "last_build_ms": round(self.last_build_ms, 2),
+            "pending": self._dirty.is_set(),
+        }
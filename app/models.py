@@ -2,10 +2,12 @@
 import os
 from typing import Optional
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, Enum
+    create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, Enum,
+    Index, UniqueConstraint, inspect
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from sqlalchemy.sql import func
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql import func, literal_column, text
 import enum
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./db.sqlite3")
@@ -31,6 +33,10 @@ class Customer(Base):
     address_city = Column(String(80), nullable=True)
     address_state = Column(String(2), nullable=True)
     address_zip = Column(String(16), nullable=True)
+    # chaves normalizadas (app/customer_identity.py): busca exata indexada e relatório de duplicados
+    document_key = Column(String(14), nullable=True, index=True)  # CPF/CNPJ só dígitos
+    phone_key = Column(String(20), nullable=True, index=True)     # só dígitos, sem DDI 55
+    email_key = Column(String(160), nullable=True, index=True)    # minúsculas
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -73,17 +79,39 @@ class MovementType(str, enum.Enum):
 
 class StockItem(Base):
     __tablename__ = "stock_items"
+    __table_args__ = (
+        # índice parcial: só os itens abaixo do mínimo, na ordem do cursor (GET /stock?below_min=true)
+        Index(
+            "ix_stock_items_below_min", "product_id",
+            sqlite_where=text("quantity < min_quantity"),
+            postgresql_where=text("quantity < min_quantity"),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), unique=True, nullable=False)
     unit = Column(String(10), nullable=False, default="UN")  # UN, KG, L
     quantity = Column(Float, nullable=False, default=0.0)
     min_quantity = Column(Float, nullable=False, default=0.0)
+    reserved = Column(Float, nullable=False, default=0.0, server_default="0")  # reservas ativas de pedidos
+    # trava otimista: toda escrita incrementa; UPDATE ... WHERE version = :lida (ver stock_reservations)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     product = relationship("Product", back_populates="stock_item")
-    movements = relationship("StockMovement", back_populates="product", cascade="all, delete-orphan")
+    # StockMovement não tem FK para stock_items: a ligação é pelo product_id (somente leitura)
+    movements = relationship(
+        "StockMovement",
+        primaryjoin="StockItem.product_id == foreign(StockMovement.product_id)",
+        viewonly=True,
+    )
+
+    __mapper_args__ = {"version_id_col": version}
 
 
 class StockMovement(Base):
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        # saldo em uma data: snapshot + movimentos do produto depois dele (GET /stock/balance)
+        Index("ix_stock_movements_product_created", "product_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
     movement_type = Column(Enum(MovementType), nullable=False)
@@ -91,11 +119,73 @@ class StockMovement(Base):
     unit_price = Column(Float, nullable=True)  # relevante para entradas (compra)
     reason = Column(String(160), nullable=True)
     reference = Column(String(160), nullable=True)  # ex: NF number, Order id
+    # valor do movimento pelo custeio (app/stock_cost.py): entradas = custo de entrada, saídas = CMV
+    cost_avg = Column(Float, nullable=True)   # custo médio ponderado
+    cost_fifo = Column(Float, nullable=True)  # PEPS (FIFO)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     product = relationship("Product")
 
 
+class StockSnapshot(Base):
+    """Saldo de um produto consolidado do ledger (movimentos com created_at <= taken_at)."""
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (
+        UniqueConstraint("product_id", "taken_at", name="uq_stock_snapshots_product_taken"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    taken_at = Column(DateTime(timezone=True), nullable=False)
+    quantity = Column(Float, nullable=False, default=0.0)
+    movement_count = Column(Integer, nullable=False, default=0)  # movimentos somados desde o snapshot anterior
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ProductCost(Base):
+    """Custo corrente de um produto, atualizado a cada movimento gravado (app/stock_cost.py)."""
+    __tablename__ = "product_costs"
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Float, nullable=False, default=0.0)    # saldo visto pelo custeio (pode ficar negativo)
+    avg_cost = Column(Float, nullable=False, default=0.0)    # custo médio ponderado unitário
+    fifo_value = Column(Float, nullable=False, default=0.0)  # soma das camadas FIFO abertas
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class CostLayer(Base):
+    """Camada FIFO aberta: o que resta de uma entrada, ao custo dela. Consumida da mais antiga (menor id)."""
+    __tablename__ = "cost_layers"
+    __table_args__ = (
+        Index("ix_cost_layers_product_id", "product_id", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Float, nullable=False)  # restante
+    unit_cost = Column(Float, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class StockReservation(Base):
+    """Quantidade de um item de estoque reservada por um pedido ainda não confirmado."""
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        # varredura de expiração: só as reservas ativas, por vencimento
+        Index(
+            "ix_stock_reservations_active_expires", "expires_at",
+            sqlite_where=text("status = 'ACTIVE'"),
+            postgresql_where=text("status = 'ACTIVE'"),
+        ),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    stock_item_id = Column(Integer, ForeignKey("stock_items.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Float, nullable=False)
+    status = Column(String(16), nullable=False, default="ACTIVE")  # ACTIVE, CONSUMED, RELEASED, EXPIRED
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    closed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 # =========================
 # Notas Fiscais de Compra (Lançamentos)
 # =========================
@@ -103,6 +193,7 @@ class PurchaseInvoice(Base):
     __tablename__ = "purchase_invoices"
     id = Column(Integer, primary_key=True, index=True)
     supplier_name = Column(String(160), nullable=False)
+    supplier_document = Column(String(20), nullable=True)  # CNPJ/CPF do emitente, só dígitos
     number = Column(String(40), nullable=False)
     series = Column(String(20), nullable=True)
     issue_date = Column(DateTime(timezone=True), nullable=True)
@@ -112,6 +203,17 @@ class PurchaseInvoice(Base):
     items = relationship("PurchaseInvoiceItem", back_populates="invoice", cascade="all, delete-orphan")
 
 
+# Chave da nota (mesma nota enviada de novo no POST /invoices/nfe): emitente + número + série.
+# NULL não colide em índice único: sem CNPJ/CPF vale o nome do emitente, sem série vale ''.
+# O NFeImporter usa as mesmas expressões na busca e no ON CONFLICT.
+PURCHASE_INVOICE_KEY = (
+    func.coalesce(PurchaseInvoice.supplier_document, PurchaseInvoice.supplier_name),
+    PurchaseInvoice.number,
+    func.coalesce(PurchaseInvoice.series, literal_column("''")),
+)
+Index("uq_purchase_invoices_invoice_key", *PURCHASE_INVOICE_KEY, unique=True)
+
+
 class PurchaseInvoiceItem(Base):
     __tablename__ = "purchase_invoice_items"
     id = Column(Integer, primary_key=True, index=True)
@@ -139,6 +241,9 @@ class Order(Base):
     status = Column(String(32), default="CREATED", index=True)
     note = Column(Text, nullable=True)
     total_amount = Column(Float, nullable=False, default=0.0)
+    # CMV da baixa de estoque na confirmação (app/stock_cost.py); None = sem baixa
+    cost_avg = Column(Float, nullable=True)
+    cost_fifo = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
@@ -158,5 +263,57 @@ class OrderItem(Base):
     product = relationship("Product")
 
 
+# =========================
+# Relatórios (agregados de vendas)
+# =========================
+class SalesRollup(Base):
+    """Agregado incremental de vendas por período (dia/hora, UTC) x SKU."""
+    __tablename__ = "sales_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "sku", name="uq_sales_rollups_bucket_sku"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String(8), nullable=False)  # "day" | "hour"
+    bucket_start = Column(DateTime, nullable=False)
+    sku = Column(String(64), nullable=False)  # "*" = total do período (todos os SKUs)
+    qty = Column(Float, nullable=False, default=0.0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+
+def _add_missing_columns() -> None:
+    """create_all não altera tabelas existentes: acrescenta colunas novas anuláveis ou com server_default literal."""
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                default = getattr(col.server_default, "arg", None)
+                if col.name in existing or not (col.nullable or isinstance(default, str)):
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"
+                if not col.nullable:
+                    ddl += " NOT NULL"
+                if isinstance(default, str):
+                    ddl += f" DEFAULT {default}"
+                conn.execute(text(ddl))
+
+
+# índices substituídos por outro de nome diferente (checkfirst não remove o antigo)
+_DROPPED_INDEXES = ("uq_purchase_invoices_supplier_number_series",)
+
+
 def init_db() -> None:
+    _add_missing_columns()
+    with engine.begin() as conn:
+        for name in _DROPPED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
     Base.metadata.create_all(bind=engine)
+    # create_all não cria índices novos em tabelas que já existem; IF NOT EXISTS em vez de
+    # checkfirst: a reflexão do SQLite não enxerga índices de expressão
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
@@ -0,0 +1,295 @@
+
+# app/nfe.py
+# Entrada de NF-e de compra (XML do fornecedor) em streaming:
+# - iterparse: cada <det> é lido, convertido em dict e descartado (a árvore nunca fica inteira em memória);
+# - a nota é identificada por emitente (CNPJ/CPF) + número + série; reenvio devolve a nota já gravada;
+# - itens gravados em lotes: 1 SELECT de SKUs, INSERT multi-linha de itens e de movimentos IN,
+#   UPDATE executemany do saldo. Tudo na transação de quem chamou (um commit no fim).
+# - código do fornecedor que não é SKU nem EAN: apelido já confirmado (ProductMatcher), se houver.
+import re
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db_utils import upsert_insert
+from app.models import PURCHASE_INVOICE_KEY, MovementType, PurchaseInvoice, PurchaseInvoiceItem, StockItem
+from app.product_matcher import ProductMatcher, supplier_key
+from app.stock_ops import apply_stock_deltas, insert_movements, resolve_skus
+
+PURCHASE_REASON = "Compra NF-e"
+NO_GTIN = {"", "SEM GTIN"}
+
+_invoices = PurchaseInvoice.__table__
+_invoice_items = PurchaseInvoiceItem.__table__
+
+
+class NFeParseError(ValueError):
+    """XML ilegível ou sem os campos obrigatórios da NF-e."""
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(elem: Optional[ET.Element], *path: str) -> Optional[ET.Element]:
+    """Desce por nome local (o XML da NF-e vem no namespace do portal fiscal)."""
+    for name in path:
+        if elem is None:
+            return None
+        elem = next((c for c in elem if _local(c.tag) == name), None)
+    return elem
+
+
+def _text(elem: Optional[ET.Element], *path: str) -> Optional[str]:
+    node = _child(elem, *path)
+    if node is None or node.text is None:
+        return None
+    return node.text.strip()
+
+
+def _number(value: Optional[str], field: str) -> float:
+    if value is None:
+        raise NFeParseError(f"Campo {field} ausente")
+    try:
+        return float(value)
+    except ValueError:
+        raise NFeParseError(f"Campo {field} inválido: {value!r}")
+
+
+def _issue_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        if len(value) == 10:  # dEmi (layout 2.0): só a data
+            return datetime.combine(date.fromisoformat(value), datetime.min.time())
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise NFeParseError(f"Data de emissão inválida: {value!r}")
+
+
+def _header(ide: Optional[ET.Element], emit: Optional[ET.Element]) -> dict:
+    number = _text(ide, "nNF")
+    supplier_name = _text(emit, "xNome")
+    if not number or not supplier_name:
+        raise NFeParseError("NF-e sem número (ide/nNF) ou emitente (emit/xNome)")
+    document = _text(emit, "CNPJ") or _text(emit, "CPF")
+    return {
+        "number": number,
+        "series": _text(ide, "serie"),
+        "issue_date": _issue_date(_text(ide, "dhEmi") or _text(ide, "dEmi")),
+        "supplier_name": supplier_name[:160],
+        "supplier_document": re.sub(r"\D", "", document) if document else None,
+    }
+
+
+def _item(det: ET.Element) -> dict:
+    prod = _child(det, "prod")
+    code = _text(prod, "cProd")
+    name = _text(prod, "xProd")
+    if not code or not name:
+        raise NFeParseError(f"Item {det.get('nItem')} sem cProd/xProd")
+    qty = _number(_text(prod, "qCom"), "qCom")
+    unit_price = _number(_text(prod, "vUnCom"), "vUnCom")
+    total = _text(prod, "vProd")
+    ean = _text(prod, "cEAN") or ""
+    return {
+        "sku": code[:64],
+        "ean": None if ean.upper() in NO_GTIN else ean,
+        "name": name[:160],
+        "qty": qty,
+        "unit": (_text(prod, "uCom") or "UN")[:10],
+        "unit_price": unit_price,
+        "total": _number(total, "vProd") if total is not None else qty * unit_price,
+    }
+
+
+def iter_nfe(source: IO[bytes]) -> Iterator[Tuple[str, dict]]:
+    """
+    Eventos da nota na ordem do XML: ("header", {...}) uma vez, ("item", {...}) por <det>
+    e ("total", {"amount"}) se houver <total>. Aceita <nfeProc> ou <NFe> na raiz.
+    """
+    inf: Optional[ET.Element] = None
+    inside = False  # dentro de <infNFe>
+    ide = emit = None
+    header_sent = False
+    stack: List[ET.Element] = []
+    try:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if inf is None and _local(elem.tag) == "infNFe":
+                    inf, inside = elem, True
+                elif inside and stack[-1] is inf and _local(elem.tag) == "det" and not header_sent:
+                    yield "header", _header(ide, emit)
+                    header_sent = True
+                stack.append(elem)
+                continue
+
+            stack.pop()
+            if elem is inf:
+                inside = False
+                continue
+            if not inside:
+                elem.clear()  # assinatura, protocolo etc.: fora do infNFe, ignorados
+                continue
+            if stack[-1] is not inf:
+                continue  # descendente de um filho de infNFe: tratado quando o filho fechar
+            name = _local(elem.tag)
+            if name == "ide":
+                ide = elem
+            elif name == "emit":
+                emit = elem
+            elif name == "det":
+                yield "item", _item(elem)
+            elif name == "total":
+                if not header_sent:
+                    yield "header", _header(ide, emit)
+                    header_sent = True
+                amount = _text(elem, "ICMSTot", "vNF")
+                if amount is not None:
+                    yield "total", {"amount": _number(amount, "vNF")}
+            if name not in ("ide", "emit"):
+                inf.remove(elem)  # solta o filho processado
+    except ET.ParseError as exc:
+        raise NFeParseError(f"XML inválido: {exc}")
+    if inf is None:
+        raise NFeParseError("Arquivo não é uma NF-e (infNFe ausente)")
+    if not header_sent:
+        yield "header", _header(ide, emit)
+
+
+class NFeImporter:
+    """Grava uma NF-e a partir dos eventos de iter_nfe. Não faz commit."""
+
+    def __init__(self, db: Session, chunk_size: int = 500, matcher: Optional[ProductMatcher] = None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.matcher = matcher
+        self.invoice_id: Optional[int] = None
+        self.header: dict = {}
+        self.items = 0
+        self.matched = 0
+        self.items_total = 0.0
+        self.unmatched: Dict[str, None] = {}  # cProd sem produto, sem repetição, na ordem da nota
+        self._pending: List[dict] = []
+
+    def _existing(self, header: dict) -> Optional[int]:
+        # mesmas expressões do índice único: a busca usa o índice e concorda com o ON CONFLICT
+        supplier, number, series = PURCHASE_INVOICE_KEY
+        q = select(PurchaseInvoice.id).where(
+            supplier == (header["supplier_document"] or header["supplier_name"]),
+            number == header["number"],
+            series == (header["series"] or ""),
+        )
+        return self.db.execute(q.limit(1)).scalar()
+
+    def _start(self, header: dict) -> bool:
+        """Grava o cabeçalho; False se a nota já existe (self.invoice_id = a existente)."""
+        self.header = header
+        existing = self._existing(header)
+        if existing is not None:
+            self.invoice_id = existing
+            return False
+        stmt = (
+            upsert_insert(self.db)(_invoices)
+            .values(**header, total_amount=0.0)
+            .on_conflict_do_nothing(index_elements=list(PURCHASE_INVOICE_KEY))
+            .returning(_invoices.c.id)
+        )
+        self.invoice_id = self.db.execute(stmt).scalar()
+        if self.invoice_id is None:  # corrida: outra requisição gravou a mesma nota
+            self.invoice_id = self._existing(header)
+            return False
+        return True
+
+    def _flush(self) -> None:
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        resolved = resolve_skus(self.db, [r["sku"] for r in rows] + [r["ean"] for r in rows if r["ean"]])
+        resolved.update(self._aliased([r for r in rows if r["sku"] not in resolved and r["ean"] not in resolved]))
+        deltas: Dict[int, float] = {}
+        movements: List[dict] = []
+        reference = f"NF {self.header['number']}" + (f"/{self.header['series']}" if self.header["series"] else "")
+        for r in rows:
+            product_id, stock_item_id = resolved.get(r["sku"]) or resolved.get(r["ean"]) or (None, None)
+            r["product_id"] = product_id
+            if product_id is None:
+                self.unmatched[r["sku"]] = None
+                continue
+            self.matched += 1
+            if stock_item_id is None:
+                continue  # produto sem registro de estoque: não movimenta
+            deltas[stock_item_id] = deltas.get(stock_item_id, 0.0) + r["qty"]
+            movements.append({
+                "product_id": product_id,
+                "movement_type": MovementType.IN_,
+                "quantity": r["qty"],
+                "unit_price": r["unit_price"],
+                "reason": PURCHASE_REASON,
+                "reference": reference,
+            })
+        self.db.execute(insert(_invoice_items), [
+            {k: r[k] for k in ("product_id", "sku", "name", "qty", "unit", "unit_price", "total")}
+            | {"invoice_id": self.invoice_id}
+            for r in rows
+        ])
+        apply_stock_deltas(self.db, deltas)
+        insert_movements(self.db, movements)
+
+    def _aliased(self, rows: List[dict]) -> Dict[str, Tuple[int, Optional[int]]]:
+        """{código: (product_id, stock_item_id)} pelos apelidos do fornecedor."""
+        if not rows or self.matcher is None:
+            return {}
+        supplier = supplier_key(self.header["supplier_document"], self.header["supplier_name"])
+        matches = self.matcher.match(supplier, [(r["sku"], r["name"], r["ean"]) for r in rows])
+        by_code = {r["sku"]: m["product_id"] for r, m in zip(rows, matches) if m["method"] == "alias"}
+        if not by_code:
+            return {}
+        stock = dict(self.db.execute(
+            select(StockItem.product_id, StockItem.id).where(StockItem.product_id.in_(set(by_code.values())))
+        ).all())
+        return {code: (pid, stock.get(pid)) for code, pid in by_code.items()}
+
+    def run(self, events: Iterator[Tuple[str, dict]]) -> dict:
+        total: Optional[float] = None
+        created = False
+        try:
+            for kind, data in events:
+                if kind == "header":
+                    created = self._start(data)
+                    if not created:
+                        break  # reenvio: não lê o resto do arquivo
+                elif kind == "item":
+                    self.items += 1
+                    self.items_total += data["total"]
+                    self._pending.append(data)
+                    if len(self._pending) >= self.chunk_size:
+                        self._flush()
+                elif kind == "total":
+                    total = data["amount"]
+        finally:
+            close = getattr(events, "close", None)
+            if close:
+                close()
+        if created:
+            self._flush()
+            self.db.execute(
+                update(_invoices)
+                .where(_invoices.c.id == self.invoice_id)
+                .values(total_amount=total if total is not None else self.items_total)
+            )
+        return {
+            "invoice_id": self.invoice_id,
+            "duplicate": not created,
+            "number": self.header.get("number"),
+            "series": self.header.get("series"),
+            "supplier_name": self.header.get("supplier_name"),
+            "supplier_document": self.header.get("supplier_document"),
+            "items": self.items,
+            "matched": self.matched,
+            "unmatched": list(self.unmatched),
+            "total_amount": (total if total is not None else self.items_total) if created else None,
+        }
@@ -0,0 +1,226 @@
+
+# app/normalizers.py
+# Normalizadores de payload de pedidos por integrador (iFood, manual, genérico).
+# Cada mapeamento é compilado uma única vez: campos do pedido e dos itens em closures;
+# o primeiro candidato presente vence — valores 0/0.0 são válidos (não caem no próximo).
+# Diferente da cadeia `a or b` antiga, um preço 0 legítimo não é trocado pelo próximo campo.
+from typing import Any, Callable, Dict, Optional, Sequence
+
+_MISSING = object()
+
+
+class NormalizationError(ValueError):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _compile_path(path: str) -> Callable[[dict], Any]:
+    keys = tuple(path.split("."))
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda d: d.get(key)
+
+    def get(d):
+        for key in keys:
+            if not isinstance(d, dict):
+                return None
+            d = d.get(key)
+        return d
+
+    return get
+
+
+def compile_field(candidates: Sequence[str], convert: Callable[[Any], Any] = None, default: Any = None):
+    """
+    Extrator de um campo: tenta os caminhos (ex.: "customer.name") na ordem.
+    None e "" contam como ausentes; 0 é um valor legítimo.
+    """
+    getters = tuple(_compile_path(p) for p in candidates)
+
+    if len(getters) == 1:
+        getter = getters[0]
+
+        def extract(d):
+            v = getter(d)
+            if v is None or v == "":
+                return default
+            return convert(v) if convert else v
+
+        return extract
+
+    def extract(d):
+        for getter in getters:
+            v = getter(d)
+            if v is not None and v != "":
+                return convert(v) if convert else v
+        return default
+
+    return extract
+
+
+def _int_qty(v: Any) -> int:
+    """Quantidade inteira (order_items.qty): 2.0 e "2" passam; 2.7 é rejeitado em vez de virar 2."""
+    if type(v) is int:
+        return v
+    if isinstance(v, str):
+        try:
+            return int(v.strip())
+        except ValueError:
+            v = float(v)
+    if isinstance(v, float) and not v.is_integer():
+        raise ValueError(f"quantidade fracionária: {v!r}")
+    return int(v)
+
+
+def _compile_item_field(candidates: Sequence[str], convert: Callable[[Any], Any], default: Any, text: bool):
+    """
+    Extrator de um campo do item. Campos texto tratam "" como ausente; nos numéricos só None
+    é ausente ("" não converte -> 422).
+    """
+    getters = tuple(_compile_path(p) for p in candidates)
+
+    if len(getters) == 1:
+        getter = getters[0]
+
+        def extract(it):
+            v = getter(it)
+            if v is None or (text and v == ""):
+                return default
+            return convert(v)
+
+        return extract
+
+    def extract(it):
+        for getter in getters:
+            v = getter(it)
+            if v is not None and not (text and v == ""):
+                return convert(v)
+        return default
+
+    return extract
+
+
+def compile_items_extractor(sku, item_name, qty, unit_price) -> Callable[[list], tuple]:
+    """
+    Extratores dos campos do item compilados uma vez por integrador; a função retornada só
+    percorre os itens. Retorna (itens_normalizados, total).
+    """
+    get_sku = _compile_item_field(sku, str, None, text=True)
+    get_qty = _compile_item_field(qty, _int_qty, 0, text=False)
+    get_price = _compile_item_field(unit_price, float, 0.0, text=False)
+    get_name = _compile_item_field(item_name, str, "Item", text=True)
+
+    def normalize_items(raw_items):
+        items = []
+        append = items.append
+        total = 0.0
+        for it in raw_items:
+            if not isinstance(it, dict):
+                raise NormalizationError(422, "Item do pedido inválido")
+            try:
+                item_sku = get_sku(it)
+                item_qty = get_qty(it)
+                item_price = get_price(it)
+            except (TypeError, ValueError, OverflowError):
+                raise NormalizationError(422, "Item do pedido inválido")
+            if not item_sku or not item_qty:
+                raise NormalizationError(422, "Item do pedido inválido")
+            append({"sku": item_sku, "name": get_name(it), "qty": item_qty, "unit_price": item_price})
+            total += item_qty * item_price
+        return items, total
+
+    return normalize_items
+
+
+class OrderNormalizer:
+    """Mapeamento payload do integrador -> pedido interno (mesmo formato usado pelo webhook)."""
+
+    def __init__(
+        self,
+        name: str,
+        external_code: Sequence[str],
+        customer_name: Sequence[str],
+        note: Sequence[str],
+        items: Sequence[str],
+        sku: Sequence[str],
+        item_name: Sequence[str],
+        qty: Sequence[str],
+        unit_price: Sequence[str],
+    ):
+        self.name = name
+        self._external_code = compile_field(external_code, str)
+        self._customer_name = compile_field(customer_name, str, "Cliente")
+        self._note = compile_field(note, str)
+        self._items = compile_field(items)
+        self._normalize_items = compile_items_extractor(sku, item_name, qty, unit_price)
+
+    def normalize(self, data: Any) -> dict:
+        if not isinstance(data, dict):
+            raise NormalizationError(400, "Payload inválido")
+
+        raw_items = self._items(data)
+        if not isinstance(raw_items, list) or len(raw_items) == 0:
+            raise NormalizationError(400, "Pedido sem itens")
+
+        items, total = self._normalize_items(raw_items)
+        return {
+            "external_code": self._external_code(data),
+            "customer_name": self._customer_name(data),
+            "note": self._note(data),
+            "items": items,
+            "total": total,
+        }
+
+
+NORMALIZERS: Dict[str, OrderNormalizer] = {}
+
+
+def register(normalizer: OrderNormalizer) -> OrderNormalizer:
+    NORMALIZERS[normalizer.name] = normalizer
+    return normalizer
+
+
+def get_normalizer(name: Optional[str]) -> Optional[OrderNormalizer]:
+    return NORMALIZERS.get((name or "generic").lower())
+
+
+# Genérico: mesmos fallbacks que o webhook sempre aceitou
+register(OrderNormalizer(
+    name="generic",
+    external_code=("external_code", "orderId", "id"),
+    customer_name=("customer_name", "customer.name"),
+    note=("note", "observation"),
+    items=("items", "orderItems"),
+    sku=("sku", "id", "code"),
+    item_name=("name", "description"),
+    qty=("qty", "quantity"),
+    unit_price=("unit_price", "unitPrice", "price"),
+))
+
+# iFood (Order API): id/displayId, customer.name, items[].externalCode/quantity/unitPrice
+register(OrderNormalizer(
+    name="ifood",
+    external_code=("id", "orderId", "displayId"),
+    customer_name=("customer.name",),
+    note=("extraInfo", "observation"),
+    items=("items",),
+    sku=("externalCode", "id"),
+    item_name=("name",),
+    qty=("quantity",),
+    unit_price=("unitPrice", "price"),
+))
+
+# Manual: formato do próprio OrderIn
+register(OrderNormalizer(
+    name="manual",
+    external_code=("external_code",),
+    customer_name=("customer_name",),
+    note=("note",),
+    items=("items",),
+    sku=("sku",),
+    item_name=("name",),
+    qty=("qty",),
+    unit_price=("unit_price",),
+))
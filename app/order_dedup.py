@@ -0,0 +1,102 @@
+
+# app/order_dedup.py
+# Deduplicação de entregas do webhook por Order.external_code:
+# LRU em memória na frente + consulta indexada (coluna unique) no banco.
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import Order
+
+
+class ExternalCodeIndex:
+    """
+    Mapa external_code -> order_id dos pedidos vistos recentemente.
+    - lookup(): LRU primeiro; no miss, SELECT indexado por external_code.
+    - pending: códigos já aceitos na fila do webhook mas ainda não gravados.
+    Thread-safe (o gravador da fila roda em outra thread).
+    """
+
+    def __init__(self, maxsize: int = 50_000):
+        self.maxsize = maxsize
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._pending: set = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def cached(self, code: str) -> Optional[int]:
+        with self._lock:
+            order_id = self._lru.get(code)
+            if order_id is not None:
+                self._lru.move_to_end(code)
+                self.hits += 1
+            return order_id
+
+    def lookup(self, db: Session, code: str) -> Optional[int]:
+        order_id = self.cached(code)
+        if order_id is not None:
+            return order_id
+        row = db.query(Order.id).filter(Order.external_code == code).first()
+        if row is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        self.remember(code, row[0])
+        return row[0]
+
+    def existing(self, db: Session, codes: Iterable[str]) -> Dict[str, int]:
+        """Resolve vários códigos de uma vez (1 SELECT para os que não estão no LRU)."""
+        found: Dict[str, int] = {}
+        unknown = []
+        for code in set(codes):
+            order_id = self.cached(code)
+            if order_id is not None:
+                found[code] = order_id
+            else:
+                unknown.append(code)
+        if unknown:
+            rows = db.query(Order.external_code, Order.id).filter(Order.external_code.in_(unknown)).all()
+            for code, order_id in rows:
+                found[code] = order_id
+                self.remember(code, order_id)
+        return found
+
+    def remember(self, code: str, order_id: int) -> None:
+        with self._lock:
+            self._lru[code] = order_id
+            self._lru.move_to_end(code)
+            self._pending.discard(code)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def mark_pending(self, code: str) -> bool:
+        """Marca o código como aceito na fila; False se ele já estava pendente."""
+        with self._lock:
+            if code in self._pending:
+                return False
+            self._pending.add(code)
+            return True
+
+    def release_pending(self, code: str) -> None:
+        with self._lock:
+            self._pending.discard(code)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._pending.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._lru),
+                "maxsize": self.maxsize,
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+            }
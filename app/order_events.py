@@ -0,0 +1,101 @@
+
+# app/order_events.py
+# Pub/sub em processo dos eventos de pedidos (criação e troca de status) para o stream SSE.
+import asyncio
+import itertools
+import threading
+from collections import deque
+from typing import List, Optional
+
+_DROPPED = None  # sentinela colocada na fila do cliente descartado
+
+
+class Subscription:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.backlog: List[dict] = []  # eventos do histórico a reenviar antes da fila
+        self.dropped = False
+
+
+class OrderEventBus:
+    """
+    - publish(): pode ser chamado de qualquer thread (endpoints síncronos rodam no threadpool).
+    - Mantém os últimos `history` eventos para retomar a partir do Last-Event-ID.
+    - Cada cliente tem fila limitada (`client_buffer`); cliente lento é descartado
+      e reconecta com o último id recebido.
+    """
+
+    def __init__(self, history: int = 1000, client_buffer: int = 100):
+        self.client_buffer = client_buffer
+        self._history: deque = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.dropped_clients = 0
+
+    def publish(self, event_type: str, data: dict) -> int:
+        with self._lock:
+            event = {"id": next(self._ids), "event": event_type, "data": data}
+            self._history.append(event)
+            self.published += 1
+            loop = self._loop if self._subscribers else None
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                self._dispatch(event)
+            else:
+                loop.call_soon_threadsafe(self._dispatch, event)
+        return event["id"]
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """Deve ser chamado no event loop. `backlog` traz o histórico posterior a `last_event_id`."""
+        sub = Subscription(self.client_buffer)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            if last_event_id is not None:
+                oldest = self._history[0]["id"] if self._history else 1
+                newest = self._history[-1]["id"] if self._history else 0
+                if last_event_id < oldest - 1 or last_event_id > newest:
+                    # eventos fora do histórico (ou processo reiniciado): cliente deve recarregar a lista
+                    sub.backlog.append({"id": last_event_id, "event": "reset", "data": {}})
+                sub.backlog.extend(e for e in self._history if e["id"] > last_event_id)
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    def _dispatch(self, event: dict) -> None:
+        with self._lock:
+            for sub in list(self._subscribers):
+                if not self._offer(sub, event):
+                    self._subscribers.remove(sub)
+
+    def _offer(self, sub: Subscription, event: dict) -> bool:
+        try:
+            sub.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # cliente lento: esvazia a fila e sinaliza o encerramento do stream
+            sub.dropped = True
+            self.dropped_clients += 1
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(_DROPPED)
+            return False
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped_clients": self.dropped_clients,
+                "last_event_id": self._history[-1]["id"] if self._history else 0,
+            }
@@ -0,0 +1,150 @@
+
+# app/order_queue.py
+# Fila em memória (limitada) para o webhook de pedidos + gravador em lote (group commit).
+import asyncio
+import logging
+from typing import Callable, List, Optional
+
+logger = logging.getLogger("uvicorn.error")
+
+_STOP = object()
+
+
+class QueueNotRunning(RuntimeError):
+    pass
+
+
+class OrderIngestQueue:
+    """
+    - enqueue(): não bloqueia; levanta asyncio.QueueFull quando a fila está cheia (backpressure).
+    - Um único gravador drena a fila e chama `sink(batch)` numa thread,
+      agrupando até `batch_size` pedidos ou `flush_interval` segundos.
+      O sink pode retornar quantos pedidos do lote não conseguiu gravar.
+    - Se o sink levanta exceção (banco fora do ar), o lote é regravado até `retries` vezes com
+      espera crescente (`retry_backoff`, dobrando); a fila segura novas entradas (429) enquanto isso.
+      Esgotadas as tentativas, `on_drop(batch)` é chamado (ex.: liberar os códigos pendentes
+      para que a reentrega do integrador seja aceita de novo).
+    - stop() grava tudo o que ainda estiver na fila antes de encerrar.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[List[dict]], Optional[int]],
+        maxsize: int = 1000,
+        batch_size: int = 50,
+        flush_interval: float = 0.2,
+        retries: int = 3,
+        retry_backoff: float = 0.5,
+        on_drop: Optional[Callable[[List[dict]], None]] = None,
+    ):
+        self.sink = sink
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.on_drop = on_drop
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.committed = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_batch_size = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        await self._queue.put(_STOP)  # FIFO: tudo que já está na fila é gravado antes
+        await self._task
+        self._task = None
+
+    def enqueue(self, order: dict) -> int:
+        if not self.running:
+            raise QueueNotRunning("Fila de pedidos não iniciada")
+        try:
+            self._queue.put_nowait(order)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.accepted += 1
+        return self._queue.qsize()
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "committed": self.committed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                lost = await asyncio.to_thread(self.sink, batch) or 0
+            except Exception as e:
+                if attempt < self.retries:
+                    self.retried += 1
+                    delay = self.retry_backoff * 2 ** attempt
+                    logger.warning("Erro ao gravar lote de %s pedidos da fila (tentativa %s, nova em %.1fs): %s",
+                                   len(batch), attempt + 1, delay, e)
+                    await asyncio.sleep(delay)
+                    continue
+                self.failed += len(batch)
+                self.dropped += len(batch)
+                logger.exception("Lote de %s pedidos da fila descartado após %s tentativas: %s",
+                                 len(batch), attempt + 1, e)
+                if self.on_drop is not None:
+                    try:
+                        self.on_drop(batch)
+                    except Exception:
+                        logger.exception("Erro ao liberar lote descartado da fila")
+            else:
+                self.committed += len(batch) - lost
+                self.failed += lost
+            break
+        self.batches += 1
+        self.last_batch_size = len(batch)
@@ -0,0 +1,291 @@
+
+# app/pdf_render.py
+# PDFs (comanda da cozinha, nota de compra) gerados fora do event loop:
+# - o reportlab roda num pool de processos (spawn); o worker do uvicorn só espera o resultado;
+# - cache em disco endereçado por conteúdo: sha256 dos campos impressos + versão do layout.
+#   Pedido/nota sem alteração = mesmo arquivo (reimpressão é só envio do arquivo);
+# - no máximo `max_concurrent` renderizações ao mesmo tempo; quem espera mais que `wait_timeout` recebe
+#   RenderBusy (503). Pedidos simultâneos do mesmo documento compartilham uma única renderização.
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.responses import FileResponse
+
+from app.catalog_cache import etag_matches
+
+TEMPLATE_VERSION = 1  # mude ao alterar o layout: invalida o cache inteiro
+
+
+class RenderBusy(Exception):
+    """Todas as vagas de renderização ocupadas por mais que wait_timeout."""
+
+
+# -------------------------------------------------------------------------
+# Layouts (rodam no processo do pool: só recebem dicts simples)
+# -------------------------------------------------------------------------
+def _money(value: float) -> str:
+    return f"R$ {value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _qty(value: float) -> str:
+    return f"{value:g}".replace(".", ",")
+
+
+def render_order_ticket(doc: dict) -> bytes:
+    """Comanda de cozinha para impressora térmica de 80 mm (altura conforme o número de itens)."""
+    import io
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+
+    width = 80 * mm
+    line = 5 * mm
+    height = 45 * mm + line * (len(doc["items"]) + (2 if doc["note"] else 0))
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=(width, height))
+    y = height - 8 * mm
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(width / 2, y, f"PEDIDO #{doc['id']}")
+    y -= line
+    c.setFont("Helvetica", 8)
+    if doc["external_code"]:
+        c.drawCentredString(width / 2, y, doc["external_code"])
+        y -= line
+    c.drawString(4 * mm, y, doc["created_at"] or "")
+    y -= line
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(4 * mm, y, doc["customer_name"][:40])
+    y -= line * 1.5
+    c.setFont("Helvetica", 10)
+    for it in doc["items"]:
+        c.drawString(4 * mm, y, f"{it['qty']}x")
+        c.drawString(14 * mm, y, it["name"][:34])
+        y -= line
+    if doc["note"]:
+        y -= line / 2
+        c.setFont("Helvetica-Oblique", 9)
+        c.drawString(4 * mm, y, f"Obs: {doc['note'][:60]}")
+        y -= line
+    c.setFont("Helvetica-Bold", 10)
+    c.drawRightString(width - 4 * mm, 6 * mm, _money(doc["total_amount"]))
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def render_purchase_invoice(doc: dict) -> bytes:
+    """Nota de compra em A4, com quebra de página a cada bloco de itens."""
+    import io
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+
+    width, height = A4
+    line = 5 * mm
+    columns = ((12 * mm, "Código"), (42 * mm, "Descrição"), (125 * mm, "Qtd"), (142 * mm, "Un"),
+               (155 * mm, "Unitário"), (178 * mm, "Total"))
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+
+    def header(page: int) -> float:
+        y = height - 15 * mm
+        c.setFont("Helvetica-Bold", 13)
+        number = doc["number"] + (f" / série {doc['series']}" if doc["series"] else "")
+        c.drawString(12 * mm, y, f"Nota de compra {number}")
+        c.setFont("Helvetica", 8)
+        c.drawRightString(width - 12 * mm, y, f"página {page}")
+        y -= line
+        c.setFont("Helvetica", 9)
+        supplier = doc["supplier_name"] + (f" - {doc['supplier_document']}" if doc["supplier_document"] else "")
+        c.drawString(12 * mm, y, supplier)
+        y -= line
+        c.drawString(12 * mm, y, f"Emissão: {doc['issue_date'] or '-'}")
+        y -= line * 1.5
+        c.setFont("Helvetica-Bold", 8)
+        for x, title in columns:
+            c.drawString(x, y, title)
+        c.line(12 * mm, y - 1.5 * mm, width - 12 * mm, y - 1.5 * mm)
+        c.setFont("Helvetica", 8)
+        return y - line
+
+    page = 1
+    y = header(page)
+    for it in doc["items"]:
+        if y < 20 * mm:
+            c.showPage()
+            page += 1
+            y = header(page)
+        values = (it["sku"][:18], it["name"][:48], _qty(it["qty"]), it["unit"], _money(it["unit_price"]),
+                  _money(it["total"]))
+        for (x, _), value in zip(columns, values):
+            c.drawString(x, y, value)
+        y -= line
+    c.setFont("Helvetica-Bold", 10)
+    c.drawRightString(width - 12 * mm, max(y - line, 10 * mm), f"Total da nota: {_money(doc['total_amount'])}")
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _warm_up() -> None:
+    import reportlab.pdfgen.canvas  # noqa: F401  (importar o reportlab é a maior parte da 1ª renderização)
+
+
+LAYOUTS = {
+    "order-ticket": render_order_ticket,
+    "purchase-invoice": render_purchase_invoice,
+}
+
+
+# -------------------------------------------------------------------------
+# Pool + cache
+# -------------------------------------------------------------------------
+class PdfRenderer:
+    def __init__(self, cache_dir: str, workers: int = 2, max_concurrent: int = 4,
+                 wait_timeout: float = 10.0, max_cache_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.workers = workers
+        self.wait_timeout = wait_timeout
+        self.max_cache_bytes = max_cache_bytes
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._written_since_prune = 0
+        self.hits = 0
+        self.renders = 0
+        self.busy = 0
+        self.errors = 0
+        self.waiting = 0
+        self.render_ms_total = 0.0
+
+    def start(self) -> None:
+        if self._pool is None:
+            # spawn: o processo pai tem threads (cardápio, agendador, fila); fork com threads não é seguro
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            for _ in range(self.workers):
+                self._pool.submit(_warm_up)
+
+    def stop(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @staticmethod
+    def key(kind: str, doc: dict) -> str:
+        payload = json.dumps({"kind": kind, "template": TEMPLATE_VERSION, "doc": doc},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, kind: str, key: str) -> Path:
+        return self.cache_dir / kind / key[:2] / f"{key}.pdf"
+
+    async def get(self, kind: str, doc: dict) -> Tuple[Path, str]:
+        """Caminho do PDF em cache (renderiza se preciso) e a chave (serve de ETag)."""
+        key = self.key(kind, doc)
+        path = self.path_for(kind, key)
+        if path.exists():
+            self.hits += 1
+            return path, key
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(kind, doc, path))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        await asyncio.shield(task)  # cliente que desconecta não cancela a renderização dos demais
+        return path, key
+
+    async def _render(self, kind: str, doc: dict, path: Path) -> None:
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.busy += 1
+            raise RenderBusy()
+        finally:
+            self.waiting -= 1
+        try:
+            self.start()
+            t0 = time.perf_counter()
+            data = await asyncio.get_running_loop().run_in_executor(self._pool, LAYOUTS[kind], doc)
+            self.render_ms_total += (time.perf_counter() - t0) * 1e3
+            self.renders += 1
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._slots.release()
+        await asyncio.to_thread(self._store, path, data)
+
+    def _store(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # atômico: leitores nunca veem arquivo pela metade
+        self._written_since_prune += len(data)
+        if self._written_since_prune > self.max_cache_bytes // 10:
+            self._written_since_prune = 0
+            self.prune()
+
+    def prune(self) -> int:
+        """Apaga os PDFs mais antigos até o cache ficar em 80% de max_cache_bytes."""
+        files = []
+        for p in self.cache_dir.glob("*/*/*.pdf"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, p in sorted(files):
+            if total <= self.max_cache_bytes * 0.8:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def metrics(self) -> dict:
+        return {
+            "running": self._pool is not None,
+            "workers": self.workers,
+            "hits": self.hits,
+            "renders": self.renders,
+            "in_flight": len(self._inflight),
+            "waiting": self.waiting,
+            "busy": self.busy,
+            "errors": self.errors,
+            "avg_render_ms": round(self.render_ms_total / self.renders, 2) if self.renders else 0.0,
+        }
+
+
+async def pdf_response(renderer: PdfRenderer, kind: str, doc: dict, filename: str,
+                       if_none_match: Optional[str] = None) -> Response:
+    """PDF do cache (304 se o cliente já tem essa versão); 503 com Retry-After se o pool está lotado."""
+    try:
+        path, key = await renderer.get(kind, doc)
+    except RenderBusy:
+        raise HTTPException(503, "Geração de PDF ocupada, tente novamente", headers={"Retry-After": "5"})
+    etag = f'"{key[:32]}"'
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return FileResponse(path, media_type="application/pdf", filename=filename, content_disposition_type="inline",
+                        headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+pdf_renderer = PdfRenderer(
+    cache_dir=os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "xis-pdf-cache")),
+    workers=int(os.getenv("PDF_RENDER_WORKERS", "2")),
+    max_concurrent=int(os.getenv("PDF_RENDER_MAX_CONCURRENT", "4")),
+    wait_timeout=float(os.getenv("PDF_RENDER_WAIT_SECONDS", "10")),
+    max_cache_bytes=int(os.getenv("PDF_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
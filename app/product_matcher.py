@@ -0,0 +1,257 @@
+
+# app/product_matcher.py
+# Casamento de linhas de nota de fornecedor com produtos do catálogo, em memória:
+# - SKU/EAN normalizados (só letras e dígitos, maiúsculas) -> produto;
+# - apelidos por fornecedor: (fornecedor, código do fornecedor) -> produto, aprendidos dos itens
+#   de nota já ligados a um produto (cada confirmação vira apelido);
+# - nome: postings de trigramas (por palavra normalizada, sem acento); os trigramas da linha são
+#   contados por produto com np.bincount e só os mais frequentes são pontuados (Dice nos trigramas
+#   + peso IDF das palavras em comum).
+# Alterações em products marcam o índice como sujo (eventos do engine); o próximo match reindexa
+# só os produtos cujo sku/nome mudou. Apelidos confirmados neste processo entram na hora (learn);
+# a recarga periódica (`refresh`) traz os confirmados em outros workers.
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models import Product, PurchaseInvoice, PurchaseInvoiceItem
+from app.search import tokens
+
+WATCHED_TABLES = frozenset({Product.__tablename__})
+_DIRTY_KEY = "xis_matcher_dirty"
+_CODE_RE = re.compile(r"[^0-9A-Z]")
+
+MIN_SCORE = 0.35          # abaixo disso não vira candidato
+COMMON_GRAM_RATIO = 0.2   # trigramas em mais de 20% dos produtos (e de COMMON_GRAM_MIN) não geram candidatos
+COMMON_GRAM_MIN = 100
+PREFILTER = 20            # produtos com mais trigramas em comum que seguem para a pontuação
+CANDIDATES = 3
+
+
+def normalize_code(code: Optional[str]) -> str:
+    return _CODE_RE.sub("", (code or "").upper())
+
+
+def supplier_key(document: Optional[str], name: Optional[str]) -> str:
+    """Fornecedor pelo CNPJ/CPF; sem documento, pelo nome normalizado."""
+    return document or " ".join(tokens(name or ""))
+
+
+def _grams(words: Iterable[str]) -> FrozenSet[str]:
+    grams: Set[str] = set()
+    for w in words:
+        padded = f"^{w}$"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class ProductMatcher:
+    def __init__(self, session_factory: Callable[[], Session], refresh: float = 300.0):
+        self.session_factory = session_factory
+        self.refresh = refresh  # reindexação periódica: alterações feitas por outros workers
+        self._lock = threading.RLock()
+        self._products: Dict[int, Tuple[str, str]] = {}      # id -> (sku, name)
+        self._product_grams: Dict[int, FrozenSet[str]] = {}
+        self._product_words: Dict[int, FrozenSet[str]] = {}
+        self._postings: Dict[str, Set[int]] = {}              # trigrama -> ids
+        self._arrays: Dict[str, np.ndarray] = {}              # cache dos postings como array
+        self._word_df: Counter = Counter()                   # palavra -> nº de produtos
+        self._codes: Dict[str, int] = {}                      # SKU normalizado -> id
+        self._aliases: Dict[Tuple[str, str], int] = {}        # (fornecedor, código) -> id
+        self._dirty = True
+        self._synced_at = 0.0
+        self._watched: Optional[Engine] = None
+        self.rebuilds = 0
+        self.reindexed = 0
+        self.last_sync_ms = 0.0
+
+    # ------------------------------------------------------------ índice
+    def _unindex(self, pid: int) -> None:
+        sku, _ = self._products.pop(pid)
+        if self._codes.get(normalize_code(sku)) == pid:
+            del self._codes[normalize_code(sku)]
+        for g in self._product_grams.pop(pid):
+            self._arrays.pop(g, None)
+            ids = self._postings.get(g)
+            if ids is not None:
+                ids.discard(pid)
+                if not ids:
+                    del self._postings[g]
+        for w in self._product_words.pop(pid):
+            self._word_df[w] -= 1
+            if self._word_df[w] <= 0:
+                del self._word_df[w]
+
+    def _index(self, pid: int, sku: str, name: str) -> None:
+        words = frozenset(tokens(name))
+        grams = _grams(words)
+        self._products[pid] = (sku, name)
+        self._product_words[pid] = words
+        self._product_grams[pid] = grams
+        self._codes[normalize_code(sku)] = pid
+        for g in grams:
+            self._postings.setdefault(g, set()).add(pid)
+            self._arrays.pop(g, None)
+        self._word_df.update(words)
+
+    def sync(self, aliases: bool = True) -> None:
+        """Reindexa os produtos novos/alterados/removidos; com `aliases`, recarrega também os apelidos."""
+        with self._lock:
+            t0 = time.perf_counter()
+            db = self.session_factory()
+            try:
+                current = {pid: (sku, name) for pid, sku, name in db.execute(
+                    select(Product.id, Product.sku, Product.name)
+                )}
+                if aliases:
+                    self._aliases = self._load_aliases(db)
+                    self._synced_at = time.monotonic()
+            finally:
+                db.close()
+            changed = 0
+            for pid in [p for p in self._products if current.get(p) != self._products[p]]:
+                self._unindex(pid)
+                changed += 1
+            for pid, (sku, name) in current.items():
+                if pid not in self._products:
+                    self._index(pid, sku, name)
+                    changed += 1
+            self._dirty = False
+            self.rebuilds += 1
+            self.reindexed += changed
+            self.last_sync_ms = (time.perf_counter() - t0) * 1e3
+
+    def _load_aliases(self, db: Session) -> Dict[Tuple[str, str], int]:
+        # item mais recente de cada (fornecedor, código) que já está ligado a um produto
+        last = (
+            select(func.max(PurchaseInvoiceItem.id))
+            .join(PurchaseInvoice, PurchaseInvoice.id == PurchaseInvoiceItem.invoice_id)
+            .where(PurchaseInvoiceItem.product_id.is_not(None))
+            .group_by(PurchaseInvoice.supplier_document, PurchaseInvoice.supplier_name, PurchaseInvoiceItem.sku)
+        )
+        rows = db.execute(
+            select(PurchaseInvoice.supplier_document, PurchaseInvoice.supplier_name,
+                   PurchaseInvoiceItem.sku, PurchaseInvoiceItem.product_id)
+            .join(PurchaseInvoice, PurchaseInvoice.id == PurchaseInvoiceItem.invoice_id)
+            .where(PurchaseInvoiceItem.id.in_(last))
+            .order_by(PurchaseInvoiceItem.id)
+        )
+        return {(supplier_key(doc, name), normalize_code(code)): pid for doc, name, code, pid in rows}
+
+    def _ensure_fresh(self) -> None:
+        stale = time.monotonic() - self._synced_at > self.refresh
+        if self._dirty or stale:
+            self.sync(aliases=stale)
+
+    def learn(self, supplier: str, code: str, product_id: int) -> None:
+        """Confirmação manual: o código do fornecedor passa a apontar para o produto."""
+        with self._lock:
+            self._aliases[(supplier, normalize_code(code))] = product_id
+
+    # ---------------------------------------------------------- consulta
+    def _by_name(self, name: str) -> List[Tuple[int, float]]:
+        words = frozenset(tokens(name))
+        grams = _grams(words)
+        if not grams:
+            return []
+        limit = max(COMMON_GRAM_MIN, int(len(self._products) * COMMON_GRAM_RATIO))
+        arrays = []
+        for g in grams:
+            ids = self._postings.get(g)
+            if ids and len(ids) <= limit:
+                arr = self._arrays.get(g)
+                if arr is None:
+                    arr = self._arrays[g] = np.fromiter(ids, dtype=np.int64, count=len(ids))
+                arrays.append(arr)
+        if not arrays:
+            return []
+        shared = np.bincount(np.concatenate(arrays))  # trigramas em comum, indexado por product_id
+        # só quem tem ao menos metade dos trigramas em comum do melhor; desses, os PREFILTER maiores
+        top = np.flatnonzero(shared >= max(1, int(shared.max()) // 2))
+        if len(top) > PREFILTER:
+            top = top[np.argpartition(shared[top], -PREFILTER)[-PREFILTER:]]
+        n = len(self._products) or 1
+        idf = {w: math.log(1 + n / self._word_df.get(w, 1)) for w in words}
+        query_weight = sum(idf.values()) or 1.0
+        scored = []
+        for pid in top.tolist():
+            # Dice sobre todos os trigramas (inclusive os comuns) + palavras inteiras em comum
+            pgrams = self._product_grams[pid]
+            dice = 2 * len(grams & pgrams) / (len(grams) + len(pgrams))
+            overlap = sum(idf[w] for w in words & self._product_words[pid]) / query_weight
+            score = 0.7 * dice + 0.3 * overlap
+            if score >= MIN_SCORE:
+                scored.append((pid, round(score, 4)))
+        scored.sort(key=lambda x: -x[1])
+        return scored[:CANDIDATES]
+
+    def _candidate(self, pid: int, score: float) -> dict:
+        sku, name = self._products[pid]
+        return {"product_id": pid, "sku": sku, "name": name, "score": score}
+
+    def match(self, supplier: str, lines: Iterable[Tuple[str, str, Optional[str]]]) -> List[dict]:
+        """
+        (código, descrição, EAN) de cada linha -> produto.
+        method: "sku" | "ean" | "alias" (produto certo) ou "name"/None (só candidatos, a confirmar).
+        """
+        with self._lock:
+            self._ensure_fresh()
+            results = []
+            for code, name, ean in lines:
+                result = {"product_id": None, "method": None, "score": None, "candidates": []}
+                ncode = normalize_code(code)
+                pid, method = self._aliases.get((supplier, ncode)), "alias"
+                if pid is None or pid not in self._products:
+                    pid, method = self._codes.get(ncode), "sku"
+                if pid is None and ean:
+                    pid, method = self._codes.get(normalize_code(ean)), "ean"
+                if pid is not None:
+                    result.update(product_id=pid, method=method, score=1.0)
+                else:
+                    result["candidates"] = [self._candidate(p, s) for p, s in self._by_name(name)]
+                    if result["candidates"]:
+                        result.update(method="name", score=result["candidates"][0]["score"])
+                results.append(result)
+            return results
+
+    # ------------------------------------------------- detecção de mudanças
+    def watch(self, engine: Engine) -> None:
+        """Registra os eventos do engine (idempotente)."""
+        if self._watched is engine:
+            return
+        event.listen(engine, "after_execute", self._after_execute)
+        event.listen(engine, "commit", self._after_commit)
+        event.listen(engine, "rollback", self._after_rollback)
+        self._watched = engine
+
+    def _after_execute(self, conn, clauseelement, multiparams, params, execution_options, result):
+        if getattr(clauseelement, "is_dml", False):
+            table = getattr(clauseelement, "table", None)
+            if getattr(table, "name", None) in WATCHED_TABLES:
+                conn.info[_DIRTY_KEY] = True
+
+    def _after_commit(self, conn):
+        if conn.info.pop(_DIRTY_KEY, False):
+            self._dirty = True
+
+    def _after_rollback(self, conn):
+        conn.info.pop(_DIRTY_KEY, None)
+
+    def metrics(self) -> dict:
+        return {
+            "products": len(self._products),
+            "trigrams": len(self._postings),
+            "aliases": len(self._aliases),
+            "rebuilds": self.rebuilds,
+            "reindexed": self.reindexed,
+            "last_sync_ms": round(self.last_sync_ms, 2),
+            "dirty": self._dirty,
+        }
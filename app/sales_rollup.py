@@ -0,0 +1,128 @@
+
+# app/sales_rollup.py
+# Agregados de vendas (dia/hora x SKU) mantidos incrementalmente na troca de status do pedido.
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db_utils import upsert_insert
+from app.models import Order, OrderItem, SalesRollup
+
+GRANULARITIES = ("day", "hour")
+TOTAL_SKU = "*"  # linha com o total do período (order_count sem dupla contagem)
+
+# Pedidos que contam como venda (entram no agregado ao confirmar, saem ao cancelar)
+COUNTED_STATUSES = ("CONFIRMED", "IN_PREPARATION", "READY", "FULFILLED")
+
+_rollups = SalesRollup.__table__
+_Key = Tuple[str, datetime, str]
+
+
+def to_utc_naive(ts: datetime) -> datetime:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Início do período em UTC (naive), base das linhas do agregado."""
+    ts = to_utc_naive(ts)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _accumulate(acc: Dict[_Key, list], created_at: Optional[datetime], items: Iterable, sign: int) -> None:
+    if created_at is None:
+        return
+    per_sku: Dict[str, list] = {}
+    for sku, qty, total in items:
+        agg = per_sku.setdefault(sku, [0.0, 0.0])
+        agg[0] += float(qty)
+        agg[1] += float(total)
+    if not per_sku:
+        return
+    order_qty = sum(a[0] for a in per_sku.values())
+    order_revenue = sum(a[1] for a in per_sku.values())
+    for granularity in GRANULARITIES:
+        start = bucket_start(created_at, granularity)
+        for sku, (qty, revenue) in per_sku.items():
+            row = acc.setdefault((granularity, start, sku), [0.0, 0.0, 0])
+            row[0] += sign * qty
+            row[1] += sign * revenue
+            row[2] += sign
+        row = acc.setdefault((granularity, start, TOTAL_SKU), [0.0, 0.0, 0])
+        row[0] += sign * order_qty
+        row[1] += sign * order_revenue
+        row[2] += sign
+
+
+def _upsert(db: Session, acc: Dict[_Key, list]) -> None:
+    if not acc:
+        return
+    insert = upsert_insert(db)
+    stmt = insert(_rollups)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["granularity", "bucket_start", "sku"],
+        set_={
+            "qty": _rollups.c.qty + stmt.excluded.qty,
+            "revenue": _rollups.c.revenue + stmt.excluded.revenue,
+            "order_count": _rollups.c.order_count + stmt.excluded.order_count,
+        },
+    )
+    db.execute(stmt, [
+        {"granularity": g, "bucket_start": b, "sku": sku, "qty": q, "revenue": r, "order_count": c}
+        for (g, b, sku), (q, r, c) in acc.items()
+    ])
+
+
+def apply_order(db: Session, order_id: int, sign: int = 1) -> None:
+    """
+    Soma (sign=+1) ou subtrai (sign=-1) um pedido dos agregados.
+    Roda na transação de quem chamou (mesma da troca de status).
+    """
+    created_at = db.query(Order.created_at).filter(Order.id == order_id).scalar()
+    if created_at is None:
+        return
+    items = (
+        db.query(OrderItem.sku, OrderItem.qty, OrderItem.total)
+        .filter(OrderItem.order_id == order_id)
+        .all()
+    )
+    acc: Dict[_Key, list] = {}
+    _accumulate(acc, created_at, items, sign)
+    _upsert(db, acc)
+
+
+def rebuild(db: Session, chunk_size: int = 5000) -> int:
+    """
+    Recria os agregados do zero a partir de orders/order_items (pedidos em COUNTED_STATUSES).
+    Lê os itens em blocos ordenados por pedido; não faz commit.
+    Retorna quantos pedidos foram agregados.
+    """
+    db.query(SalesRollup).delete(synchronize_session=False)
+    rows = (
+        db.query(Order.id, Order.created_at, OrderItem.sku, OrderItem.qty, OrderItem.total)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .filter(Order.status.in_(COUNTED_STATUSES))
+        .order_by(Order.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    acc: Dict[_Key, list] = {}
+    orders = 0
+    current: Optional[int] = None
+    created_at = None
+    items: List[tuple] = []
+    for order_id, order_created_at, sku, qty, total in rows:
+        if order_id != current:
+            if items:
+                _accumulate(acc, created_at, items, 1)
+                orders += 1
+            current, created_at, items = order_id, order_created_at, []
+        items.append((sku, qty, total))
+    if items:
+        _accumulate(acc, created_at, items, 1)
+        orders += 1
+    _upsert(db, acc)
+    return orders
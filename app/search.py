@@ -0,0 +1,184 @@
+
+# app/search.py
+# Busca textual indexada (produtos e clientes), sem ilike('%termo%') em varredura completa.
+# - SQLite: tabelas FTS5 (external content) mantidas por triggers, tokenizer sem acentos, ranking bm25.
+# - Postgres: índices GIN trigram sobre unaccent(lower(...)), ranking por similarity().
+# Os índices são atualizados pelo próprio banco em INSERT/UPDATE/DELETE.
+# Nos dois bancos cada palavra do termo casa com o início de uma palavra do documento
+# ("cafe" acha "Café Torrado", "orrado" não acha). Sem o FTS (falha no startup) ou em
+# outros bancos cai no ilike('%termo%') antigo, que casa substring.
+import logging
+import re
+import unicodedata
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import Float, Integer, and_, func, literal, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query
+
+from app.models import Customer, Product
+
+logger = logging.getLogger("uvicorn.error")
+
+# entidade -> (modelo, colunas pesquisáveis)
+SEARCH_ENTITIES: Dict[str, Tuple[type, Tuple[str, ...]]] = {
+    "products": (Product, ("name", "sku")),
+    "customers": (Customer, ("name", "email", "document")),
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_text(value: str) -> str:
+    """Minúsculas e sem acentos ("Pão de Açúcar" -> "pao de acucar")."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokens(term: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(term))
+
+
+# -------------------------------------------------------------------------
+# DDL
+# -------------------------------------------------------------------------
+def _sqlite_ddl(table: str, columns: Tuple[str, ...]) -> List[str]:
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+    ]
+
+
+def _pg_document_sql(columns: Tuple[str, ...]) -> str:
+    joined = " || ' ' || ".join(f"coalesce({c}, '')" for c in columns)
+    return f"xis_unaccent(lower({joined}))"
+
+
+_PG_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() não é IMMUTABLE; o wrapper permite usá-lo em índice de expressão
+    "CREATE OR REPLACE FUNCTION xis_unaccent(text) RETURNS text "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$",
+]
+
+
+# (url do banco, tabela) cujo FTS do SQLite já foi verificado: existe / não existe
+_fts_ready: Dict[Tuple[str, str], bool] = {}
+_fts_warned: Set[Tuple[str, str]] = set()
+
+
+def _fts_available(engine: Engine, table: str) -> bool:
+    key = (str(engine.url), table)
+    ready = _fts_ready.get(key)
+    if ready is None:
+        with engine.connect() as conn:
+            ready = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": f"{table}_fts"}
+            ).first() is not None
+        _fts_ready[key] = ready
+    if not ready and key not in _fts_warned:
+        _fts_warned.add(key)
+        logger.warning("Tabela %s_fts ausente; busca em %s usando ilike (rode ensure_search_indexes)", table, table)
+    return ready
+
+
+def ensure_search_indexes(engine: Engine) -> None:
+    """Cria (idempotente) as estruturas de busca do banco atual; popula o FTS na primeira vez."""
+    dialect = engine.dialect.name
+    for table in _entities_by_table():
+        _fts_ready.pop((str(engine.url), table), None)  # verifica de novo na próxima busca
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            for table, (_, columns) in _entities_by_table().items():
+                fts = f"{table}_fts"
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+                ).first()
+                for stmt in _sqlite_ddl(table, columns):
+                    conn.execute(text(stmt))
+                if not exists:
+                    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for stmt in _PG_SETUP:
+                conn.execute(text(stmt))
+            for table, (_, columns) in _entities_by_table().items():
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_search_trgm ON {table} "
+                    f"USING gin ({_pg_document_sql(columns)} gin_trgm_ops)"
+                ))
+        else:
+            logger.warning("Busca indexada indisponível para o banco '%s'; usando ilike", dialect)
+
+
+def rebuild_search_index(engine: Engine) -> None:
+    """Reconstrói o FTS do SQLite a partir das tabelas base (no Postgres o índice é de expressão)."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for table in _entities_by_table():
+            conn.execute(text(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')"))
+
+
+def _entities_by_table() -> Dict[str, Tuple[type, Tuple[str, ...]]]:
+    return {model.__tablename__: (model, columns) for model, columns in SEARCH_ENTITIES.values()}
+
+
+# -------------------------------------------------------------------------
+# Consulta
+# -------------------------------------------------------------------------
+def apply_search(q: Query, entity: str, term: str) -> Query:
+    """
+    Filtra `q` (que já seleciona/junta o modelo da entidade) pelo termo e ordena por relevância.
+    Cada palavra do termo precisa aparecer como início de palavra (igual no SQLite e no Postgres).
+    Ordenações adicionais devem ser aplicadas depois (desempate).
+    """
+    model, columns = SEARCH_ENTITIES[entity]
+    words = tokens(term)
+    if not words:
+        return q
+    bind = q.session.get_bind()
+    dialect = bind.dialect.name
+    table = model.__tablename__
+
+    if dialect == "sqlite" and _fts_available(bind.engine, table):
+        match = " ".join(f'"{w}"*' for w in words)
+        fts = (
+            text(f"SELECT rowid AS id, rank AS score FROM {table}_fts WHERE {table}_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(id=Integer, score=Float)
+            .subquery(f"{table}_search")
+        )
+        return q.join(fts, fts.c.id == model.id).order_by(fts.c.score.asc())
+
+    cols = [getattr(model, c) for c in columns]
+    if dialect == "postgresql":
+        doc = func.coalesce(cols[0], "")
+        for col in cols[1:]:
+            doc = doc.op("||")(literal(" ")).op("||")(func.coalesce(col, ""))
+        doc = func.xis_unaccent(func.lower(doc))
+        normalized = " ".join(words)
+        # \m = início de palavra; o índice trigram também atende expressão regular
+        # (os tokens só têm caracteres de palavra, nada a escapar)
+        return (
+            q.filter(and_(*[doc.op("~")(rf"\m{w}") for w in words]))
+            .order_by(func.similarity(doc, normalized).desc())
+        )
+
+    # outros bancos ou SQLite sem FTS: comportamento anterior
+    like = f"%{term}%"
+    cond = cols[0].ilike(like)
+    for col in cols[1:]:
+        cond = cond | col.ilike(like)
+    return q.filter(cond)
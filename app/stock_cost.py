@@ -0,0 +1,273 @@
+
+# app/stock_cost.py
+# Custeio de estoque (custo médio ponderado e PEPS/FIFO) mantido a cada movimento gravado:
+# - insert_movements() chama apply_movements(): carrega o estado dos produtos envolvidos
+#   (product_costs com FOR UPDATE + camadas FIFO abertas só de quem tem saída), aplica os movimentos
+#   em ordem e grava o valor de cada um (cost_avg / cost_fifo) junto com o novo estado;
+# - entrada com unit_price entra a esse custo; sem preço (saldo inicial, ajuste +) entra ao custo médio
+#   corrente (ou Product.cost enquanto não há custo apurado);
+# - saída abaixo de zero: a parte sem camada sai ao custo médio, e a próxima entrada cobre o déficit
+#   antes de abrir camada (camadas somadas = saldo positivo);
+# - CMV do pedido fica em Order.cost_avg/cost_fifo (gravado na baixa); margem por SKU = preço - custo
+#   médio de product_costs. Leitura O(1), sem refazer o histórico.
+# - rebuild(): recalcula tudo do zero a partir de stock_movements (backfill / correção manual).
+#   python -m app.stock_cost [--chunk 500]
+import argparse
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db_utils import upsert_insert
+from app.models import CostLayer, MovementType, Order, Product, ProductCost, StockMovement
+
+EPS = 1e-9
+ORDER_REFERENCE = "ORDER "  # referência das baixas de pedido (deduct_order_items)
+DEFAULT_CHUNK = 500         # produtos por bloco no rebuild
+
+_costs = ProductCost.__table__
+_layers = CostLayer.__table__
+_movements = StockMovement.__table__
+_orders = Order.__table__
+
+
+class CostBook:
+    """Estado de custeio de um produto. Camadas: deque de [id | None (nova), quantidade restante, custo]."""
+
+    __slots__ = ("product_id", "quantity", "avg_cost", "fifo_value", "fallback", "layers", "deleted", "head_changed")
+
+    def __init__(self, product_id: int, quantity: float = 0.0, avg_cost: float = 0.0, fifo_value: float = 0.0,
+                 fallback: Optional[float] = None, layers: Iterable[Tuple[int, float, float]] = ()):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.avg_cost = avg_cost
+        self.fifo_value = fifo_value
+        self.fallback = fallback or 0.0  # Product.cost: custo de entrada sem preço antes do primeiro custo apurado
+        self.layers = deque([lid, qty, cost] for lid, qty, cost in layers)
+        self.deleted: List[int] = []     # camadas gravadas que se esgotaram
+        self.head_changed = False        # a primeira camada (gravada) foi consumida em parte
+
+    def unit_cost(self) -> float:
+        return self.avg_cost or self.fallback
+
+    def entry(self, qty: float, unit_cost: float) -> float:
+        covered = min(qty, -self.quantity) if self.quantity < 0 else 0.0  # saídas a descoberto já custeadas
+        new_qty = self.quantity + qty
+        if new_qty > EPS:
+            if self.quantity <= EPS:
+                self.avg_cost = unit_cost
+            else:
+                self.avg_cost = (self.quantity * self.avg_cost + qty * unit_cost) / new_qty
+        self.quantity = new_qty
+        rest = qty - covered
+        if rest > EPS:
+            self.layers.append([None, rest, unit_cost])
+            self.fifo_value += rest * unit_cost
+        return qty * unit_cost
+
+    def exit(self, qty: float) -> Tuple[float, float]:
+        cost_avg = qty * self.unit_cost()
+        consumed = 0.0
+        remaining = qty
+        while remaining > EPS and self.layers:
+            layer = self.layers[0]
+            use = min(remaining, layer[1])
+            consumed += use * layer[2]
+            layer[1] -= use
+            remaining -= use
+            if layer[1] <= EPS:
+                self.layers.popleft()
+                if layer[0] is not None:
+                    self.deleted.append(layer[0])
+                self.head_changed = False
+            elif layer[0] is not None:
+                self.head_changed = True
+        self.fifo_value = self.fifo_value - consumed if self.layers else 0.0
+        self.quantity -= qty
+        return cost_avg, consumed + max(remaining, 0.0) * self.unit_cost()
+
+    def apply(self, movement_type, quantity: float, unit_price: Optional[float]) -> Tuple[float, float]:
+        """(cost_avg, cost_fifo) do movimento. OUT e ADJUST negativo saem; o resto entra."""
+        signed = -quantity if movement_type == MovementType.OUT else quantity
+        if signed >= 0:
+            value = self.entry(signed, unit_price if unit_price is not None else self.unit_cost())
+            return value, value
+        return self.exit(-signed)
+
+
+def _is_exit(row: dict) -> bool:
+    return row["movement_type"] == MovementType.OUT or (
+        row["movement_type"] == MovementType.ADJUST and row["quantity"] < 0
+    )
+
+
+def _load_books(db: Session, product_ids: Set[int], with_layers: Set[int]) -> Dict[int, CostBook]:
+    ids = sorted(product_ids)
+    db.execute(
+        upsert_insert(db)(_costs).on_conflict_do_nothing(index_elements=["product_id"]),
+        [{"product_id": pid} for pid in ids],
+    )
+    # linhas travadas na ordem de product_id: duas transações nos mesmos produtos não se cruzam
+    books = {
+        pid: CostBook(pid, qty, avg, fifo, fallback)
+        for pid, qty, avg, fifo, fallback in db.execute(
+            select(_costs.c.product_id, _costs.c.quantity, _costs.c.avg_cost, _costs.c.fifo_value, Product.cost)
+            .join(Product, Product.id == _costs.c.product_id)
+            .where(_costs.c.product_id.in_(ids))
+            .order_by(_costs.c.product_id)
+            .with_for_update(of=_costs)
+        )
+    }
+    if with_layers:
+        for lid, pid, qty, cost in db.execute(
+            select(_layers.c.id, _layers.c.product_id, _layers.c.quantity, _layers.c.unit_cost)
+            .where(_layers.c.product_id.in_(sorted(with_layers)))
+            .order_by(_layers.c.product_id, _layers.c.id)
+        ):
+            books[pid].layers.append([lid, qty, cost])
+    return books
+
+
+def _save(db: Session, books: Iterable[CostBook], replace: bool = False) -> None:
+    """Grava estado e camadas. replace=True (rebuild): insere as linhas em vez de atualizar."""
+    books = list(books)
+    if not books:
+        return
+    state = [{"b_pid": b.product_id, "b_qty": b.quantity, "b_avg": b.avg_cost, "b_fifo": b.fifo_value}
+             for b in books]
+    if replace:
+        db.execute(insert(_costs), [
+            {"product_id": s["b_pid"], "quantity": s["b_qty"], "avg_cost": s["b_avg"], "fifo_value": s["b_fifo"]}
+            for s in state
+        ])
+    else:
+        db.execute(
+            update(_costs)
+            .where(_costs.c.product_id == bindparam("b_pid"))
+            .values(quantity=bindparam("b_qty"), avg_cost=bindparam("b_avg"), fifo_value=bindparam("b_fifo"),
+                    updated_at=func.now()),
+            state,
+        )
+    deleted = [lid for b in books for lid in b.deleted]
+    if deleted:
+        db.execute(delete(_layers).where(_layers.c.id.in_(deleted)))
+    heads = [{"b_id": b.layers[0][0], "b_qty": b.layers[0][1]} for b in books if b.head_changed and b.layers]
+    if heads:
+        db.execute(
+            update(_layers).where(_layers.c.id == bindparam("b_id")).values(quantity=bindparam("b_qty")),
+            heads,
+        )
+    new = [{"product_id": b.product_id, "quantity": qty, "unit_cost": cost}
+           for b in books for lid, qty, cost in b.layers if lid is None]
+    if new:
+        db.execute(insert(_layers), new)
+
+
+def apply_movements(db: Session, rows: List[dict]) -> None:
+    """
+    Custeia `rows` (dicts de StockMovement, na ordem em que serão gravados) e preenche
+    cost_avg/cost_fifo de cada um. Roda na transação de quem chamou (sem commit).
+    """
+    if not rows:
+        return
+    books = _load_books(db, {r["product_id"] for r in rows}, {r["product_id"] for r in rows if _is_exit(r)})
+    for r in rows:
+        r["cost_avg"], r["cost_fifo"] = books[r["product_id"]].apply(
+            r["movement_type"], float(r["quantity"]), r.get("unit_price")
+        )
+    _save(db, books.values())
+
+
+def order_id_from_reference(reference: Optional[str]) -> Optional[int]:
+    if reference and reference.startswith(ORDER_REFERENCE):
+        tail = reference[len(ORDER_REFERENCE):]
+        if tail.isdigit():
+            return int(tail)
+    return None
+
+
+def rebuild(db: Session, chunk_size: int = DEFAULT_CHUNK) -> dict:
+    """
+    Recalcula o custeio do zero: refaz os movimentos de cada produto em ordem de id, regrava
+    cost_avg/cost_fifo de cada movimento, product_costs, as camadas abertas e o CMV dos pedidos.
+    Blocos de `chunk_size` produtos (memória limitada aos movimentos do bloco); não faz commit.
+    """
+    t0 = time.perf_counter()
+    db.execute(delete(_layers))
+    db.execute(delete(_costs))
+    fallback = dict(db.execute(select(Product.id, Product.cost)).all())
+    product_ids = [pid for (pid,) in db.execute(select(_movements.c.product_id).distinct().order_by(_movements.c.product_id))]
+
+    set_cost = (
+        update(_movements)
+        .where(_movements.c.id == bindparam("b_id"))
+        .values(cost_avg=bindparam("b_avg"), cost_fifo=bindparam("b_fifo"))
+    )
+    movements = 0
+    for start in range(0, len(product_ids), chunk_size):
+        block = product_ids[start:start + chunk_size]
+        books: Dict[int, CostBook] = {}
+        costs = []
+        for mid, pid, mtype, qty, unit_price in db.execute(
+            select(_movements.c.id, _movements.c.product_id, _movements.c.movement_type,
+                   _movements.c.quantity, _movements.c.unit_price)
+            .where(_movements.c.product_id.in_(block))
+            .order_by(_movements.c.product_id, _movements.c.id)
+        ):
+            book = books.get(pid)
+            if book is None:
+                book = books[pid] = CostBook(pid, fallback=fallback.get(pid))
+            cost_avg, cost_fifo = book.apply(mtype, qty, unit_price)
+            costs.append({"b_id": mid, "b_avg": cost_avg, "b_fifo": cost_fifo})
+        if costs:
+            db.execute(set_cost, costs)
+        _save(db, books.values(), replace=True)
+        movements += len(costs)
+
+    # CMV dos pedidos: soma das baixas (OUT com referência "ORDER <id>")
+    db.execute(update(_orders).values(cost_avg=None, cost_fifo=None))
+    order_costs = []
+    for reference, cost_avg, cost_fifo in db.execute(
+        select(_movements.c.reference, func.sum(_movements.c.cost_avg), func.sum(_movements.c.cost_fifo))
+        .where(_movements.c.movement_type == MovementType.OUT, _movements.c.reference.like(f"{ORDER_REFERENCE}%"))
+        .group_by(_movements.c.reference)
+    ):
+        order_id = order_id_from_reference(reference)
+        if order_id is not None:
+            order_costs.append({"b_id": order_id, "b_avg": cost_avg, "b_fifo": cost_fifo})
+    if order_costs:
+        db.execute(
+            update(_orders)
+            .where(_orders.c.id == bindparam("b_id"))
+            .values(cost_avg=bindparam("b_avg"), cost_fifo=bindparam("b_fifo")),
+            order_costs,
+        )
+    return {
+        "products": len(product_ids),
+        "movements": movements,
+        "orders": len(order_costs),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1e3, 1),
+    }
+
+
+def main(argv=None) -> None:
+    from app.models import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Recalcula custo médio, camadas FIFO e CMV a partir dos movimentos")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="produtos por bloco")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        result = rebuild(db, chunk_size=args.chunk)
+        db.commit()
+    finally:
+        db.close()
+    print(f"{result['movements']} movimentos, {result['products']} produtos, {result['orders']} pedidos, "
+          f"{result['elapsed_ms'] / 1000:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+
+# app/stock_ledger.py
+# Ledger de estoque: StockMovement é o histórico; StockSnapshot guarda saldos consolidados.
+# - Saldo em T = último snapshot do produto com taken_at <= T + movimentos em (taken_at, T].
+#   O delta fica limitado ao intervalo entre snapshots (índice product_id, created_at).
+# - O job de snapshot só grava produtos que tiveram movimento desde o snapshot anterior.
+# - verify() confere o contador StockItem.quantity contra o saldo do ledger.
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.db_utils import db_timestamp, upsert_insert
+from app.models import MovementType, Product, StockItem, StockMovement, StockSnapshot
+
+logger = logging.getLogger("uvicorn.error")
+
+# Movimentos gravados com atraso (transação longa: created_at = início da transação no Postgres)
+# ainda entram no snapshot: ele só consolida até `agora - SNAPSHOT_LAG`.
+SNAPSHOT_LAG = timedelta(minutes=5)
+TOLERANCE = 1e-6
+
+_snapshots = StockSnapshot.__table__
+
+
+def movement_delta():
+    """Efeito do movimento no saldo (expressão SQL): OUT subtrai; IN soma; ADJUST soma o delta com sinal."""
+    return case(
+        (StockMovement.movement_type == MovementType.OUT, -StockMovement.quantity),
+        else_=StockMovement.quantity,
+    )
+
+
+def _latest_snapshots(at: Optional[datetime], product_ids: Optional[Sequence[int]] = None):
+    """Subquery com o último snapshot de cada produto (até `at`, se informado)."""
+    last = select(StockSnapshot.product_id, func.max(StockSnapshot.taken_at).label("taken_at"))
+    if at is not None:
+        last = last.where(StockSnapshot.taken_at <= at)
+    if product_ids is not None:
+        last = last.where(StockSnapshot.product_id.in_(product_ids))
+    last = last.group_by(StockSnapshot.product_id).subquery()
+    return (
+        select(StockSnapshot.product_id, StockSnapshot.taken_at, StockSnapshot.quantity)
+        .join(last, and_(
+            StockSnapshot.product_id == last.c.product_id,
+            StockSnapshot.taken_at == last.c.taken_at,
+        ))
+        .subquery("snap")
+    )
+
+
+def ledger_balances(db: Session, at: Optional[datetime] = None,
+                    product_ids: Optional[Sequence[int]] = None) -> Dict[int, dict]:
+    """
+    Saldo do ledger por produto em `at` (None = todos os movimentos).
+    Retorna {product_id: {"quantity", "snapshot_at", "movements"}} para produtos com snapshot ou movimento.
+    """
+    at = db_timestamp(db, at) if at is not None else None
+    snap = _latest_snapshots(at, product_ids)
+
+    result: Dict[int, dict] = {}
+    for product_id, taken_at, quantity in db.execute(select(snap.c.product_id, snap.c.taken_at, snap.c.quantity)):
+        result[product_id] = {"quantity": quantity, "snapshot_at": taken_at, "movements": 0}
+
+    deltas = (
+        select(StockMovement.product_id, func.sum(movement_delta()), func.count())
+        .outerjoin(snap, snap.c.product_id == StockMovement.product_id)
+        .where(or_(snap.c.taken_at.is_(None), StockMovement.created_at > snap.c.taken_at))
+        .group_by(StockMovement.product_id)
+    )
+    if at is not None:
+        deltas = deltas.where(StockMovement.created_at <= at)
+    if product_ids is not None:
+        deltas = deltas.where(StockMovement.product_id.in_(product_ids))
+    for product_id, delta, count in db.execute(deltas):
+        entry = result.setdefault(product_id, {"quantity": 0.0, "snapshot_at": None, "movements": 0})
+        entry["quantity"] += float(delta or 0.0)
+        entry["movements"] = count
+    return result
+
+
+def take_snapshots(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    Consolida o ledger até `now - SNAPSHOT_LAG` para os produtos que tiveram movimento
+    desde o último snapshot. Um INSERT multi-linha; não faz commit. Retorna quantos snapshots gravou.
+    """
+    taken_at = db_timestamp(db, (now or datetime.now(timezone.utc)) - SNAPSHOT_LAG)
+    snap = _latest_snapshots(None)
+    rows = db.execute(
+        select(
+            StockMovement.product_id,
+            func.coalesce(func.max(snap.c.quantity), 0.0) + func.sum(movement_delta()),
+            func.count(),
+        )
+        .outerjoin(snap, snap.c.product_id == StockMovement.product_id)
+        .where(or_(snap.c.taken_at.is_(None), StockMovement.created_at > snap.c.taken_at))
+        .where(StockMovement.created_at <= taken_at)
+        .group_by(StockMovement.product_id)
+    ).all()
+    if rows:
+        # outro worker pode ter rodado o job no mesmo instante: o primeiro snapshot vale
+        stmt = upsert_insert(db)(_snapshots).on_conflict_do_nothing(index_elements=["product_id", "taken_at"])
+        db.execute(stmt, [
+            {"product_id": pid, "taken_at": taken_at, "quantity": float(qty), "movement_count": count}
+            for pid, qty, count in rows
+        ])
+    return len(rows)
+
+
+def verify(db: Session, product_ids: Optional[Sequence[int]] = None) -> List[dict]:
+    """Compara StockItem.quantity com o saldo do ledger; devolve só as divergências."""
+    balances = ledger_balances(db, None, product_ids)
+    q = (
+        db.query(StockItem.product_id, Product.sku, StockItem.quantity)
+        .join(Product, Product.id == StockItem.product_id)
+    )
+    if product_ids is not None:
+        q = q.filter(StockItem.product_id.in_(product_ids))
+    mismatches = []
+    for product_id, sku, counter in q.order_by(StockItem.product_id):
+        ledger = balances.get(product_id, {}).get("quantity", 0.0)
+        if abs(counter - ledger) > TOLERANCE:
+            mismatches.append({
+                "product_id": product_id,
+                "sku": sku,
+                "counter": counter,
+                "ledger": ledger,
+                "difference": counter - ledger,
+            })
+    return mismatches
+
+
+def run_snapshot_job(session_factory) -> None:
+    """Entrada do agendador: grava os snapshots numa transação própria."""
+    db = session_factory()
+    try:
+        written = take_snapshots(db)
+        db.commit()
+        logger.info("Snapshots de estoque gravados: %d", written)
+    except Exception:
+        db.rollback()
+        logger.exception("Falha no job de snapshot de estoque")
+    finally:
+        db.close()
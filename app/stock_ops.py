@@ -0,0 +1,120 @@
+
+# app/stock_ops.py
+# Operações de estoque em lote (set-based), reutilizadas pelos controllers.
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from app.models import Order, Product, StockItem, StockMovement, MovementType
+from app.stock_cost import ORDER_REFERENCE, apply_movements
+
+_stock = StockItem.__table__
+_movements = StockMovement.__table__
+_orders = Order.__table__
+
+
+def resolve_skus(db: Session, skus: Iterable[str]) -> Dict[str, Tuple[int, Optional[int]]]:
+    """
+    Resolve todos os SKUs em UMA consulta.
+    Retorna {sku: (product_id, stock_item_id | None)}; SKUs fora do catálogo não aparecem.
+    """
+    skus = list(set(skus))
+    if not skus:
+        return {}
+    rows = (
+        db.query(Product.sku, Product.id, StockItem.id)
+        .outerjoin(StockItem, StockItem.product_id == Product.id)
+        .filter(Product.sku.in_(skus))
+        .all()
+    )
+    return {sku: (product_id, stock_item_id) for sku, product_id, stock_item_id in rows}
+
+
+def apply_stock_deltas(db: Session, deltas: Dict[int, float]) -> None:
+    """
+    Aplica deltas atômicos por StockItem (quantity = quantity + :delta) num único executemany.
+    Incrementa `version` (invalida leituras de reservas concorrentes).
+    Linhas atualizadas em ordem de id (a mesma de reserve_items): duas transações com os mesmos
+    itens em ordens diferentes (pedido, lote de ajuste, NF-e) não se travam em deadlock.
+    Não faz commit: roda na transação corrente de quem chamou.
+    """
+    if not deltas:
+        return
+    stmt = (
+        update(_stock)
+        .where(_stock.c.id == bindparam("b_id"))
+        .values(quantity=_stock.c.quantity + bindparam("b_delta"), version=_stock.c.version + 1)
+    )
+    db.execute(stmt, [{"b_id": sid, "b_delta": float(d)} for sid, d in sorted(deltas.items())])
+
+
+def insert_movements(db: Session, rows: List[dict]) -> None:
+    """
+    Insere vários StockMovement num único INSERT multi-linha (sem commit).
+    Antes, custeia os movimentos (app/stock_cost): cada linha ganha cost_avg/cost_fifo.
+    """
+    if rows:
+        apply_movements(db, rows)
+        db.execute(insert(_movements), rows)
+
+
+def opening_movement(product_id: int, quantity: float, reference: Optional[str] = None) -> Optional[dict]:
+    """
+    Movimento do saldo inicial de um item de estoque novo (o ledger precisa explicar o contador).
+    None quando a quantidade inicial é zero.
+    """
+    if not quantity:
+        return None
+    return {
+        "product_id": product_id,
+        "movement_type": MovementType.IN_ if quantity > 0 else MovementType.OUT,
+        "quantity": abs(float(quantity)),
+        "unit_price": None,
+        "reason": "Saldo inicial",
+        "reference": reference,
+    }
+
+
+def deduct_order_items(db: Session, order_id: int, items) -> List[str]:
+    """
+    Baixa de estoque dos itens de um pedido confirmado.
+    - 1 SELECT para resolver SKUs, 1 UPDATE executemany, 1 INSERT multi-linha.
+    - CMV da baixa (custo médio e FIFO) gravado em Order.cost_avg/cost_fifo.
+    - Retorna os SKUs que não existem no catálogo.
+    """
+    qty_by_sku: Dict[str, float] = {}
+    for oi in items:
+        qty_by_sku[oi.sku] = qty_by_sku.get(oi.sku, 0.0) + float(oi.qty)
+
+    resolved = resolve_skus(db, qty_by_sku.keys())
+    missing = sorted(sku for sku in qty_by_sku if sku not in resolved)
+
+    deltas: Dict[int, float] = {}
+    movements: List[dict] = []
+    for sku, qty in qty_by_sku.items():
+        if sku not in resolved:
+            continue
+        product_id, stock_item_id = resolved[sku]
+        if stock_item_id is None:
+            # produto sem registro de estoque: não baixa
+            continue
+        deltas[stock_item_id] = deltas.get(stock_item_id, 0.0) - qty
+        movements.append({
+            "product_id": product_id,
+            "movement_type": MovementType.OUT,
+            "quantity": qty,
+            "unit_price": None,
+            "reason": "Order confirmed",
+            "reference": f"{ORDER_REFERENCE}{order_id}",
+        })
+
+    apply_stock_deltas(db, deltas)
+    insert_movements(db, movements)
+    if movements:
+        db.execute(
+            update(_orders)
+            .where(_orders.c.id == order_id)
+            .values(cost_avg=sum(m["cost_avg"] for m in movements), cost_fifo=sum(m["cost_fifo"] for m in movements))
+        )
+    return missing
@@ -0,0 +1,192 @@
+
+# app/stock_reservations.py
+# Reserva de estoque na criação do pedido, com trava otimista (StockItem.version):
+# - lê quantity/reserved/version, confere o disponível (quantity - reserved) e grava com
+#   UPDATE ... WHERE version = :lida; se outra escrita passou na frente, relê e tenta de novo.
+#   Nenhuma trava de linha fica presa entre requisições (nada de SELECT ... FOR UPDATE).
+# - Confirmação: a reserva vira CONSUMED e a baixa normal (movimento OUT) é feita por deduct_order_items.
+# - Cancelamento solta a reserva (RELEASED); o job de expiração solta as vencidas (EXPIRED).
+# - Produtos sem StockItem ou fora do catálogo não são reservados (não controlam estoque).
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db_utils import db_timestamp
+from app.models import StockItem, StockReservation
+from app.stock_ops import resolve_skus
+
+logger = logging.getLogger("uvicorn.error")
+
+DEFAULT_TTL = timedelta(minutes=30)
+MAX_ATTEMPTS = 8
+TOLERANCE = 1e-9
+
+ACTIVE, CONSUMED, RELEASED, EXPIRED = "ACTIVE", "CONSUMED", "RELEASED", "EXPIRED"
+
+_stock = StockItem.__table__
+_reservations = StockReservation.__table__
+
+_metrics_lock = threading.Lock()
+_metrics = {"reserved": 0, "retries": 0, "conflicts": 0, "insufficient": 0, "released": 0, "expired": 0}
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _metrics_lock:
+        _metrics[key] += n
+
+
+def metrics() -> dict:
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class InsufficientStock(Exception):
+    """Algum item do pedido não tem disponível suficiente; nada foi reservado."""
+
+    def __init__(self, shortages: List[dict]):
+        super().__init__(", ".join(s["sku"] for s in shortages))
+        self.shortages = shortages  # [{"sku", "requested", "available"}]
+
+
+class ReservationConflict(Exception):
+    """Escritas concorrentes no mesmo item venceram todas as tentativas."""
+
+
+def reserve_items(db: Session, order_id: int, items: Iterable[Tuple[str, float]],
+                  ttl: timedelta = DEFAULT_TTL, max_attempts: int = MAX_ATTEMPTS) -> List[str]:
+    """
+    Reserva (sku, qty) para o pedido, tudo ou nada. Não faz commit.
+    Cada tentativa roda num SAVEPOINT: um CAS perdido desfaz só os itens daquela tentativa.
+    Retorna os SKUs fora do catálogo; levanta InsufficientStock ou ReservationConflict.
+    """
+    qty_by_sku: Dict[str, float] = {}
+    for sku, qty in items:
+        qty_by_sku[sku] = qty_by_sku.get(sku, 0.0) + float(qty)
+
+    resolved = resolve_skus(db, qty_by_sku.keys())
+    missing = sorted(sku for sku in qty_by_sku if sku not in resolved)
+    wanted: Dict[int, Tuple[str, int, float]] = {}
+    for sku, qty in qty_by_sku.items():
+        product_id, stock_item_id = resolved.get(sku, (None, None))
+        if stock_item_id is not None:
+            wanted[stock_item_id] = (sku, product_id, qty)
+    if not wanted:
+        return missing
+
+    cas = (
+        update(_stock)
+        .where(_stock.c.id == bindparam("b_id"), _stock.c.version == bindparam("b_version"))
+        .values(reserved=_stock.c.reserved + bindparam("b_qty"), version=_stock.c.version + 1)
+    )
+    for attempt in range(max_attempts):
+        # ordem fixa por id: dois pedidos com os mesmos itens não se travam em ordens opostas
+        rows = db.execute(
+            select(_stock.c.id, _stock.c.quantity, _stock.c.reserved, _stock.c.version)
+            .where(_stock.c.id.in_(wanted.keys()))
+            .order_by(_stock.c.id)
+        ).all()
+        shortages = [
+            {"sku": wanted[sid][0], "requested": wanted[sid][2], "available": max(quantity - reserved, 0.0)}
+            for sid, quantity, reserved, _ in rows
+            if quantity - reserved + TOLERANCE < wanted[sid][2]
+        ]
+        if shortages:
+            _count("insufficient")
+            raise InsufficientStock(shortages)
+
+        savepoint = db.begin_nested()
+        won = all(
+            db.execute(cas, {"b_id": sid, "b_version": version, "b_qty": wanted[sid][2]}).rowcount == 1
+            for sid, _, _, version in rows
+        )
+        if won:
+            savepoint.commit()
+            break
+        savepoint.rollback()
+        _count("retries")
+        time.sleep(random.uniform(0, 0.002 * (2 ** attempt)))  # backoff com jitter
+    else:
+        _count("conflicts")
+        raise ReservationConflict(f"pedido {order_id}: {max_attempts} tentativas sem sucesso")
+
+    expires_at = db_timestamp(db, datetime.now(timezone.utc) + ttl)
+    db.execute(insert(_reservations), [
+        {
+            "order_id": order_id,
+            "product_id": product_id,
+            "stock_item_id": sid,
+            "quantity": qty,
+            "status": ACTIVE,
+            "expires_at": expires_at,
+        }
+        for sid, (_, product_id, qty) in wanted.items()
+    ])
+    _count("reserved")
+    return missing
+
+
+def _close(db: Session, status: str, *criteria) -> int:
+    """
+    Fecha reservas ativas (ACTIVE -> status) e devolve as quantidades ao disponível.
+    O UPDATE ... WHERE status = 'ACTIVE' garante que cada reserva é solta uma vez só.
+    """
+    closed = db.execute(
+        update(_reservations)
+        .where(_reservations.c.status == ACTIVE, *criteria)
+        .values(status=status, closed_at=db_timestamp(db, datetime.now(timezone.utc)))
+        .returning(_reservations.c.stock_item_id, _reservations.c.quantity)
+    ).all()
+    if not closed:
+        return 0
+    by_item: Dict[int, float] = {}
+    for sid, qty in closed:
+        by_item[sid] = by_item.get(sid, 0.0) + qty
+    # ordem fixa por id, como em reserve_items e apply_stock_deltas
+    db.execute(
+        update(_stock)
+        .where(_stock.c.id == bindparam("b_id"))
+        .values(reserved=_stock.c.reserved - bindparam("b_qty"), version=_stock.c.version + 1),
+        [{"b_id": sid, "b_qty": qty} for sid, qty in sorted(by_item.items())],
+    )
+    return len(closed)
+
+
+def consume_order(db: Session, order_id: int) -> int:
+    """Confirmação: reservas do pedido viram CONSUMED (a baixa OUT fica com deduct_order_items)."""
+    return _close(db, CONSUMED, _reservations.c.order_id == order_id)
+
+
+def release_order(db: Session, order_id: int) -> int:
+    """Cancelamento: devolve ao disponível o que o pedido ainda tinha reservado."""
+    released = _close(db, RELEASED, _reservations.c.order_id == order_id)
+    _count("released", released)
+    return released
+
+
+def expire_reservations(db: Session, now: Optional[datetime] = None) -> int:
+    """Solta as reservas vencidas (índice parcial das ativas). Não faz commit."""
+    now = db_timestamp(db, now or datetime.now(timezone.utc))
+    expired = _close(db, EXPIRED, _reservations.c.expires_at <= now)
+    _count("expired", expired)
+    return expired
+
+
+def run_expiry_job(session_factory) -> None:
+    """Entrada do agendador: expira reservas numa transação própria."""
+    db = session_factory()
+    try:
+        expired = expire_reservations(db)
+        db.commit()
+        if expired:
+            logger.info("Reservas de estoque expiradas: %d", expired)
+    except Exception:
+        db.rollback()
+        logger.exception("Falha no job de expiração de reservas")
+    finally:
+        db.close()
@@ -0,0 +1,73 @@
+
+# benchmarks/bench_catalog_import.py
+# Importação de cardápio com 200k linhas (CSV e XLSX): tempo e pico de memória do processo (RSS).
+#   python -m benchmarks.bench_catalog_import [linhas]
+import os
+import resource
+import sys
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from app.catalog_import import CatalogImporter, iter_spreadsheet  # noqa: E402
+from app.models import SessionLocal, init_db  # noqa: E402
+
+HEADER = ["sku", "nome", "categoria", "preco", "custo", "ativo", "unidade", "quantidade"]
+
+
+def _row(i: int) -> list:
+    return [f"SKU-{i:07d}", f"Produto {i}", f"Categoria {i % 40}", f"{5 + i % 50},90", "2,5", "sim", "UN", i % 30]
+
+
+def _write_csv(path: str, n: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(";".join(HEADER) + "\n")
+        for i in range(n):
+            f.write(";".join(str(v) for v in _row(i)) + "\n")
+
+
+def _write_xlsx(path: str, n: int) -> None:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(HEADER)
+    for i in range(n):
+        ws.append(_row(i))
+    wb.save(path)
+
+
+def _run(path: str) -> None:
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        with open(path, "rb") as f:
+            result = CatalogImporter(db).run(iter_spreadsheet(path, f))
+        elapsed = time.perf_counter() - t0
+    finally:
+        db.close()
+    print(f"{os.path.basename(path):12s} {elapsed:7.2f}s  {result['processed'] / elapsed:9.0f} linhas/s  "
+          f"RSS máx {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:6.1f} MiB  criados={result['created']} atualizados={result['updated']} "
+          f"falhas={result['failed']}")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    init_db()
+    tmp = tempfile.mkdtemp()
+    csv_path, xlsx_path = os.path.join(tmp, "menu.csv"), os.path.join(tmp, "menu.xlsx")
+    _write_csv(csv_path, n)
+    _write_xlsx(xlsx_path, n)
+    print(f"{n} linhas; RSS máx antes da importação "
+          f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+    _run(csv_path)    # tudo novo
+    _run(xlsx_path)   # mesmos SKUs: tudo atualização
+    _run(csv_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/bench_cost.py
+# Custeio (custo médio + FIFO): custo por baixa de pedido com o estado incremental (product_costs +
+# camadas abertas) e o rebuild completo a partir do histórico. Confere que os dois chegam no mesmo estado.
+#   python -m benchmarks.bench_cost [produtos] [movimentos]
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from sqlalchemy import insert, select  # noqa: E402
+
+from app import stock_cost  # noqa: E402
+from app.models import (  # noqa: E402
+    CostLayer, MovementType, Product, ProductCost, SessionLocal, StockMovement, engine, init_db
+)
+from app.stock_ops import insert_movements  # noqa: E402
+
+
+def _history(products: int, movements: int, rng: random.Random) -> list:
+    rows = []
+    for _ in range(movements):
+        pid = rng.randint(1, products)
+        if rng.random() < 0.4:
+            rows.append({"product_id": pid, "movement_type": MovementType.IN_, "quantity": float(rng.randint(10, 50)),
+                         "unit_price": round(rng.uniform(2, 20), 2), "reason": "Compra", "reference": None})
+        else:
+            rows.append({"product_id": pid, "movement_type": MovementType.OUT, "quantity": float(rng.randint(1, 10)),
+                         "unit_price": None, "reason": "Order confirmed", "reference": None})
+    return rows
+
+
+def _state(db) -> tuple:
+    costs = db.execute(select(ProductCost.product_id, ProductCost.quantity, ProductCost.avg_cost,
+                              ProductCost.fifo_value).order_by(ProductCost.product_id)).all()
+    layers = db.execute(select(CostLayer.product_id, CostLayer.quantity, CostLayer.unit_cost)
+                        .order_by(CostLayer.product_id, CostLayer.id)).all()
+    return [tuple(round(v, 6) for v in r) for r in costs], [tuple(round(v, 6) for v in r) for r in layers]
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    movements = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    init_db()
+    rng = random.Random(3)
+    with engine.begin() as conn:
+        conn.execute(insert(Product.__table__), [
+            {"sku": f"SKU-{i:05d}", "name": f"Produto {i}", "price": 25.0, "cost": 8.0, "active": True}
+            for i in range(products)
+        ])
+        conn.execute(insert(StockMovement.__table__), _history(products, movements, rng))
+
+    db = SessionLocal()
+    try:
+        result = stock_cost.rebuild(db)
+        db.commit()
+        print(f"rebuild            {result['movements']} movimentos / {result['products']} produtos "
+              f"em {result['elapsed_ms'] / 1000:6.2f}s")
+
+        # baixas de pedido (5 SKUs cada) pelo caminho normal: insert_movements custeia e grava
+        lat = []
+        for _ in range(500):
+            batch = _history(products, 5, rng)
+            t0 = time.perf_counter()
+            insert_movements(db, batch)
+            db.commit()
+            lat.append((time.perf_counter() - t0) * 1e3)
+        lat.sort()
+        print(f"incremental        p50={statistics.median(lat):.2f}ms p95={lat[int(len(lat) * 0.95)]:.2f}ms "
+              f"por lote de 5 movimentos (inclui o commit)")
+
+        incremental = _state(db)
+        t0 = time.perf_counter()
+        stock_cost.rebuild(db)
+        db.commit()
+        print(f"rebuild            {(time.perf_counter() - t0):6.2f}s  "
+              f"incremental == rebuild: {incremental == _state(db)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_customers.py
+# Identidade de clientes: preenchimento das chaves normalizadas, busca por telefone (índice x cache LRU)
+# e relatório de duplicados (GROUP BY por chave + união dos grupos).
+#   python -m benchmarks.bench_customers [clientes]
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app.controller.customers_controller import lookup_cache, router  # noqa: E402
+from app.customer_identity import backfill_keys  # noqa: E402
+from app.models import Customer, engine, init_db  # noqa: E402
+
+PHONE_FORMATS = ["({ddd}) {a}-{b}", "+55 {ddd} {a}{b}", "0{ddd}{a}{b}", "{ddd} {a} {b}"]
+
+
+def _customers(n: int, rng: random.Random) -> list:
+    rows = []
+    for i in range(n):
+        # ~3% repetem telefone/e-mail de um cliente anterior (cadastro em duplicidade)
+        src = rng.randrange(i) if i and rng.random() < 0.03 else i
+        ddd, a, b = 11 + src % 80, 90000 + src // 10000, src % 10000
+        rows.append({
+            "name": f"Cliente {i}",
+            "phone": rng.choice(PHONE_FORMATS).format(ddd=ddd, a=f"{a:05d}", b=f"{b:04d}"),
+            "email": f"Cliente{src}@Mail.com" if rng.random() < 0.5 else f"cliente{src}@mail.com",
+            "document": f"{src:011d}" if rng.random() < 0.3 else None,
+        })
+    return rows
+
+
+def _phone(i: int) -> str:
+    return f"{11 + i % 80}{90000 + i // 10000:05d}{i % 10000:04d}"
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    init_db()
+    rng = random.Random(5)
+    with engine.begin() as conn:
+        conn.execute(insert(Customer.__table__), _customers(n, rng))
+
+    t0 = time.perf_counter()
+    updated = backfill_keys(engine)
+    print(f"backfill           {updated} clientes em {time.perf_counter() - t0:6.2f}s")
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    targets = [_phone(rng.randrange(n)) for _ in range(2000)]
+    for label in ("índice (cache frio)", "cache LRU"):
+        if label.startswith("índice"):
+            lookup_cache.bump()
+        lat = []
+        for phone in targets:
+            t0 = time.perf_counter()
+            client.get("/customers/lookup", params={"phone": phone})
+            lat.append((time.perf_counter() - t0) * 1e3)
+        print(f"lookup {label:<20} p50={statistics.median(lat):.3f}ms (inclui o cliente HTTP de teste)")
+
+    t0 = time.perf_counter()
+    report = client.get("/customers/duplicates", params={"limit": 10}).json()
+    print(f"duplicados         {report['groups']} grupos / {report['customers']} clientes "
+          f"em {time.perf_counter() - t0:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_matcher.py
+# Casamento de uma nota de 500 linhas (descrições do fornecedor, sem nossos SKUs) contra um catálogo
+# grande, e custo da reindexação incremental depois de alterar alguns produtos.
+#   python -m benchmarks.bench_matcher [produtos] [linhas]
+import os
+import random
+import sys
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from sqlalchemy import insert, update  # noqa: E402
+
+from app.models import Product, SessionLocal, engine, init_db  # noqa: E402
+from app.product_matcher import ProductMatcher  # noqa: E402
+
+BASES = ["Queijo", "Presunto", "Bacon", "Pão", "Hambúrguer", "Frango", "Calabresa", "Catupiry", "Cheddar",
+         "Alface", "Tomate", "Cebola", "Maionese", "Ketchup", "Mostarda", "Batata", "Refrigerante", "Suco"]
+KINDS = ["Mussarela", "Prato", "Defumado", "Fatiado", "Brioche", "Artesanal", "Congelado", "Temperado",
+         "Cremoso", "Original", "Light", "Tradicional", "Premium", "Australiano", "Caseiro", "Picante"]
+SIZES = ["500g", "1kg", "2kg", "5kg", "12un", "24un", "1L", "2L", "350ml", "caixa"]
+
+
+def _catalog(n: int) -> list:
+    rng = random.Random(7)
+    return [f"{rng.choice(BASES)} {rng.choice(KINDS)} {rng.choice(SIZES)} {i}" for i in range(n)]
+
+
+def _supplier_line(name: str, rng: random.Random) -> str:
+    """Descrição do jeito que vem na nota: maiúsculas, sem acento às vezes, palavras abreviadas."""
+    words = name.upper().split()
+    words = [w[:4] if rng.random() < 0.3 and len(w) > 5 else w for w in words]
+    if rng.random() < 0.3:
+        words.insert(1, "KG")
+    return " ".join(words)
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    init_db()
+    names = _catalog(products)
+    with engine.begin() as conn:
+        conn.execute(insert(Product.__table__), [
+            {"sku": f"SKU-{i:06d}", "name": n, "price": 1.0, "active": True} for i, n in enumerate(names)
+        ])
+
+    matcher = ProductMatcher(SessionLocal)
+    matcher.watch(engine)
+    t0 = time.perf_counter()
+    matcher.sync()
+    print(f"índice inicial      {products} produtos em {(time.perf_counter() - t0) * 1e3:7.1f}ms "
+          f"({matcher.metrics()['trigrams']} trigramas)")
+
+    rng = random.Random(11)
+    picks = [rng.randrange(products) for _ in range(lines)]
+    batch = [(f"F{i}", _supplier_line(names[p], rng), None) for i, p in enumerate(picks)]
+    matcher.match("12345678000190", batch[:1])  # aquece
+    t0 = time.perf_counter()
+    results = matcher.match("12345678000190", batch)
+    elapsed = (time.perf_counter() - t0) * 1e3
+    top1 = sum(1 for r, p in zip(results, picks) if r["candidates"] and r["candidates"][0]["product_id"] == p + 1)
+    top3 = sum(1 for r, p in zip(results, picks) if any(c["product_id"] == p + 1 for c in r["candidates"]))
+    print(f"nota de {lines} linhas   {elapsed:7.1f}ms  top1={top1 / lines:.0%} top3={top3 / lines:.0%}")
+
+    with engine.begin() as conn:
+        for pid in rng.sample(range(1, products + 1), 20):
+            conn.execute(update(Product.__table__).where(Product.id == pid).values(name=f"Produto renomeado {pid}"))
+    t0 = time.perf_counter()
+    matcher.match("12345678000190", batch[:1])
+    print(f"reindexação (20 alterados) {(time.perf_counter() - t0) * 1e3:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+
+# benchmarks/bench_normalizers.py
+# Vazão da normalização de payloads grandes (muitos itens) do webhook.
+#   python -m benchmarks.bench_normalizers [itens_por_pedido] [pedidos]
+# Compara a cadeia de `data.get("a") or data.get("b")` antiga com os extratores compilados.
+import sys
+import time
+
+from app.normalizers import get_normalizer
+
+
+def legacy_normalize(data: dict) -> dict:
+    # cópia da normalização que existia no webhook (referência de comparação)
+    external_code = data.get("external_code") or data.get("orderId") or data.get("id")
+    customer_name = data.get("customer_name") or (data.get("customer") or {}).get("name") or "Cliente"
+    note = data.get("note") or data.get("observation")
+    raw_items = data.get("items") or data.get("orderItems") or []
+    if not isinstance(raw_items, list) or len(raw_items) == 0:
+        raise ValueError("Pedido sem itens")
+    normalized_items = []
+    for it in raw_items:
+        sku = it.get("sku") or it.get("id") or it.get("code")
+        name = it.get("name") or it.get("description") or "Item"
+        qty = it.get("qty") or it.get("quantity") or 0
+        unit_price = it.get("unit_price") or it.get("unitPrice") or it.get("price") or 0
+        if not sku or not name or not qty:
+            raise ValueError("Item do pedido inválido")
+        normalized_items.append(
+            {"sku": str(sku), "name": str(name), "qty": int(qty), "unit_price": float(unit_price)}
+        )
+    total = sum(i["qty"] * i["unit_price"] for i in normalized_items)
+    return {"external_code": external_code, "customer_name": customer_name, "note": note,
+            "items": normalized_items, "total": total}
+
+
+def _payload(n_items: int, i: int) -> dict:
+    # formato aceito pelos dois normalizadores (generic cai nos fallbacks id/quantity/unitPrice)
+    return {
+        "id": f"ORDER-{i}",
+        "customer": {"name": "Maria"},
+        "items": [
+            {"id": f"SKU{j}", "name": f"X-Salada {j}", "quantity": 1 + j % 3,
+             "unitPrice": 19.9 + j, "options": []}
+            for j in range(n_items)
+        ],
+    }
+
+
+def _bench(label: str, fn, payloads) -> None:
+    fn(payloads[0])  # aquecimento
+    dt = float("inf")
+    for _ in range(3):  # melhor de 3
+        t0 = time.perf_counter()
+        items = 0
+        for p in payloads:
+            items += len(fn(p)["items"])
+        dt = min(dt, time.perf_counter() - t0)
+    print(f"{label:22s} {items / dt / 1e6:7.2f} M itens/s   {dt * 1e3 / len(payloads):8.3f} ms/pedido")
+
+
+def main():
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_orders = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    payloads = [_payload(n_items, i) for i in range(n_orders)]
+    _bench("legado (or-chain)", legacy_normalize, payloads)
+    _bench("compilado generic", get_normalizer("generic").normalize, payloads)
+    _bench("compilado ifood", get_normalizer("ifood").normalize, payloads)
+
+
+if __name__ == "__main__":
+    main()
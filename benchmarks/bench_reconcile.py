@@ -0,0 +1,76 @@
+
+# benchmarks/bench_reconcile.py
+# Reconciliação estoque x ledger com milhões de movimentos: GROUP BY product_id no banco
+# x laço Python por linha somando o mesmo SELECT.
+#   python -m benchmarks.bench_reconcile [movimentos] [produtos]
+import os
+import sys
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from sqlalchemy import insert, select, text  # noqa: E402
+
+from app.models import Product, StockItem, engine, init_db  # noqa: E402
+from app.stock_ledger import movement_delta  # noqa: E402
+from app.models import StockMovement  # noqa: E402
+from app.stock_reconcile import reconcile  # noqa: E402
+
+
+def _seed(movements: int, products: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(Product.__table__), [
+            {"sku": f"SKU-{i:06d}", "name": f"Produto {i}", "price": 1.0, "active": True} for i in range(products)
+        ])
+        conn.execute(insert(StockItem.__table__), [
+            {"product_id": i + 1, "unit": "UN", "quantity": 0.0, "min_quantity": 0.0} for i in range(products)
+        ])
+        # movimentos pseudoaleatórios gerados no próprio banco (rápido para dezenas de milhões)
+        conn.execute(text(
+            "WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :n) "
+            "INSERT INTO stock_movements (product_id, movement_type, quantity, created_at) "
+            "SELECT (n * 7919) % :p + 1, CASE n % 3 WHEN 0 THEN 'OUT' WHEN 1 THEN 'IN_' ELSE 'ADJUST' END, "
+            "(n % 5) + 1, CURRENT_TIMESTAMP FROM seq"
+        ), {"n": movements, "p": products})
+        # contador coerente com o ledger, exceto 1% dos itens (drift proposital)
+        conn.execute(text(
+            "UPDATE stock_items SET quantity = (SELECT COALESCE(SUM(CASE movement_type WHEN 'OUT' "
+            "THEN -quantity ELSE quantity END), 0) FROM stock_movements m WHERE m.product_id = stock_items.product_id)"
+            " + CASE WHEN product_id % 100 = 0 THEN 3 ELSE 0 END"
+        ))
+
+
+def _python_loop() -> int:
+    sums = {}
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=500_000).execute(
+            select(StockMovement.product_id, movement_delta())
+        )
+        for product_id, delta in result:
+            sums[product_id] = sums.get(product_id, 0.0) + delta
+    return len(sums)
+
+
+def main():
+    movements = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    products = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    init_db()
+    t0 = time.perf_counter()
+    _seed(movements, products)
+    print(f"{movements} movimentos / {products} produtos gerados em {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    result = reconcile(engine)
+    print(f"GROUP BY (banco)    {time.perf_counter() - t0:7.1f}s  divergentes={result['drifted']}")
+
+    t0 = time.perf_counter()
+    _python_loop()
+    print(f"laço python         {time.perf_counter() - t0:7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/bench_reservations.py
+# Disputa de um único SKU "quente": muitos escritores concorrentes criam pedidos e reservam 1 unidade
+# cada (trava otimista em StockItem.version). Mede vazão, latência, retentativas e confere que o
+# reservado nunca passa do saldo.
+#   python -m benchmarks.bench_reservations [threads] [saldo]
+# Com DATABASE_URL apontando para um Postgres mede a disputa real entre conexões.
+import os
+import sys
+import tempfile
+import threading
+import time
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import stock_reservations  # noqa: E402
+from app.models import (  # noqa: E402
+    Order, OrderItem, Product, SessionLocal, StockItem, StockReservation, engine, init_db
+)
+from app.stock_reservations import InsufficientStock, ReservationConflict, reserve_items  # noqa: E402
+
+HOT_SKU = "HOT-001"
+
+
+def _seed(stock: float) -> None:
+    db = SessionLocal()
+    try:
+        p = Product(sku=HOT_SKU, name="X-Tudo", price=30.0, active=True)
+        db.add(p)
+        db.flush()
+        db.add(StockItem(product_id=p.id, unit="UN", quantity=stock, min_quantity=0.0))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _writer(latencies: list, outcome: dict, lock: threading.Lock, start: threading.Event) -> None:
+    start.wait()
+    while True:
+        t0 = time.perf_counter()
+        db = SessionLocal()
+        try:
+            order = Order(customer_name="bench", total_amount=30.0, status="CREATED",
+                          items=[OrderItem(sku=HOT_SKU, name="X-Tudo", qty=1, unit_price=30.0, total=30.0)])
+            db.add(order)
+            db.flush()
+            reserve_items(db, order.id, [(HOT_SKU, 1)])
+            db.commit()
+            key = "ok"
+        except InsufficientStock:
+            db.rollback()
+            key = "sold_out"
+        except ReservationConflict:
+            db.rollback()
+            key = "conflict"
+        except Exception:
+            db.rollback()
+            key = "error"
+        finally:
+            db.close()
+        with lock:
+            outcome[key] = outcome.get(key, 0) + 1
+            if key == "ok":
+                latencies.append(time.perf_counter() - t0)
+        if key == "sold_out":
+            return
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    stock = float(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    init_db()
+    _seed(stock)
+
+    latencies, outcome, lock, start = [], {}, threading.Lock(), threading.Event()
+    workers = [threading.Thread(target=_writer, args=(latencies, outcome, lock, start)) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    t0 = time.perf_counter()
+    start.set()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+
+    with engine.connect() as conn:
+        quantity, reserved = conn.execute(select(StockItem.quantity, StockItem.reserved)).one()
+        active = conn.execute(
+            select(func.coalesce(func.sum(StockReservation.quantity), 0.0)).where(StockReservation.status == "ACTIVE")
+        ).scalar()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e3 if latencies else 0.0  # noqa: E731
+    m = stock_reservations.metrics()
+    print(f"{engine.dialect.name}: {threads} escritores, saldo {stock:.0f} no SKU {HOT_SKU}")
+    print(f"reservas       {outcome.get('ok', 0)} em {elapsed:.2f}s ({outcome.get('ok', 0) / elapsed:.0f}/s)")
+    print(f"latência       p50={pct(0.50):.1f}ms p99={pct(0.99):.1f}ms")
+    print(f"retentativas   {m['retries']}  conflitos={outcome.get('conflict', 0)}  erros={outcome.get('error', 0)}")
+    print(f"consistência   reserved={reserved:.0f} ativas={active:.0f} quantity={quantity:.0f} "
+          f"{'OK' if reserved == active == outcome.get('ok', 0) and reserved <= quantity else 'DIVERGENTE'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+
+# benchmarks/bench_search.py
+# Busca de produtos/clientes com 100k linhas: ilike('%termo%') x índice (FTS5 no SQLite).
+#   python -m benchmarks.bench_search [linhas]
+# Com DATABASE_URL apontando para um Postgres vazio, mede o índice trigram.
+import os
+import random
+import sys
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    _fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(_fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.models import Customer, Product, SessionLocal, engine, init_db  # noqa: E402
+from app.search import apply_search, ensure_search_indexes  # noqa: E402
+
+WORDS = ["pão", "queijo", "coxinha", "frango", "catupiry", "pastel", "carne", "açaí", "guaraná",
+         "x-salada", "x-bacon", "calabresa", "brócolis", "maçã", "limão", "churrasco", "feijão"]
+FIRST = ["João", "Maria", "José", "Ana", "Antônio", "Conceição", "Sebastião", "Lúcia", "Márcio", "Inês"]
+LAST = ["Silva", "Conceição", "Gonçalves", "Araújo", "Simões", "Magalhães", "Brandão", "Romão"]
+
+
+def _seed(n: int) -> None:
+    rnd = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(insert(Product.__table__), [
+            {"sku": f"SKU-{i:06d}", "name": " ".join(rnd.sample(WORDS, 3)).title(), "price": 10.0, "active": True}
+            for i in range(n)
+        ])
+        conn.execute(insert(Customer.__table__), [
+            {"name": f"{rnd.choice(FIRST)} {rnd.choice(LAST)} {rnd.choice(LAST)}",
+             "email": f"cliente{i}@exemplo.com.br", "document": f"{rnd.randrange(10**11):011d}"}
+            for i in range(n)
+        ])
+
+
+def _time(fn, repeat: int = 20) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) * 1e3 / repeat
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    init_db()
+    _seed(n)
+    t0 = time.perf_counter()
+    ensure_search_indexes(engine)
+    print(f"{n} produtos + {n} clientes; índice criado em {time.perf_counter() - t0:.2f}s ({engine.dialect.name})")
+
+    db = SessionLocal()
+    try:
+        cases = [("products", Product, ("name", "sku"), t) for t in ("catupiry", "pao queijo", "SKU-04")]
+        cases += [("customers", Customer, ("name", "email", "document"), t) for t in ("conceicao", "cliente9999")]
+        for entity, model, columns, term in cases:
+            def ilike():
+                like = f"%{term}%"
+                cond = getattr(model, columns[0]).ilike(like)
+                for c in columns[1:]:
+                    cond = cond | getattr(model, c).ilike(like)
+                return db.query(model).filter(cond).order_by(model.id).limit(50).all()
+
+            def indexed():
+                return apply_search(db.query(model), entity, term).order_by(model.id).limit(50).all()
+
+            print(f"{entity:9s} {term!r:14s} ilike {_time(ilike):8.2f} ms ({len(ilike()):2d})   "
+                  f"índice {_time(indexed):8.2f} ms ({len(indexed()):2d})")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
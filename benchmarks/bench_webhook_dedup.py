@@ -0,0 +1,97 @@
+
+# benchmarks/bench_webhook_dedup.py
+# Tempestade de reentregas do webhook: custo por entrega repetida.
+#   python -m benchmarks.bench_webhook_dedup [pedidos] [reentregas]
+# Compara:
+#   - insert_and_fail: comportamento antigo (INSERT + violação da unique + rollback)
+#   - dedup_cold:      LRU vazio, 1 SELECT indexado por external_code
+#   - dedup_warm:      LRU quente, nenhum acesso ao banco
+import os
+import random
+import sys
+import tempfile
+import time
+
+_fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+os.close(_fd)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_path}")
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+
+from app.models import SessionLocal, engine, init_db  # noqa: E402
+from app.controller.orders_controller import _add_normalized_order, order_index  # noqa: E402
+
+_statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global _statements
+    _statements += 1
+
+
+def _payload(i: int) -> dict:
+    items = [{"sku": f"SKU{j}", "name": f"Item {j}", "qty": 1, "unit_price": 10.0} for j in range(3)]
+    return {"external_code": f"IFOOD-{i}", "customer_name": "Cliente", "note": None,
+            "items": items, "total": 30.0}
+
+
+def _seed(n: int) -> None:
+    db = SessionLocal()
+    try:
+        for i in range(n):
+            _add_normalized_order(db, _payload(i))
+        db.commit()
+    finally:
+        db.close()
+
+
+def insert_and_fail(codes):
+    db = SessionLocal()
+    try:
+        for i in codes:
+            try:
+                _add_normalized_order(db, _payload(i))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+    finally:
+        db.close()
+
+
+def dedup(codes):
+    db = SessionLocal()
+    try:
+        for i in codes:
+            assert order_index.lookup(db, f"IFOOD-{i}") is not None
+    finally:
+        db.close()
+
+
+def _run(label, fn, codes):
+    global _statements
+    _statements = 0
+    t0 = time.perf_counter()
+    fn(codes)
+    dt = time.perf_counter() - t0
+    print(f"{label:16s} {len(codes):7d} reentregas  {dt * 1e6 / len(codes):9.1f} us/entrega  "
+          f"{_statements / len(codes):5.2f} SQL/entrega")
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    retries = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    init_db()
+    _seed(orders)
+    rnd = random.Random(42)
+    codes = [rnd.randrange(orders) for _ in range(retries)]
+
+    _run("insert_and_fail", insert_and_fail, codes)
+    order_index.clear()
+    _run("dedup_cold", dedup, codes[: min(len(codes), order_index.maxsize)])
+    _run("dedup_warm", dedup, codes)
+
+
+if __name__ == "__main__":
+    main()
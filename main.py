@@ -2,11 +2,26 @@
 # main.py
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from apscheduler.schedulers.background import BackgroundScheduler
+import logging
+import os
 
 # IMPORTA OS ROUTERS
 # - Certifique-se de que o caminho está correto conforme sua estrutura.
 # - Este import pressupõe app/controller/orders_controller.py com "router = APIRouter()"
-from app.controller.orders_controller import router as orders_router
+from app.controller.orders_controller import router as orders_router, webhook_queue
+from app.controller.catalog_controller import router as catalog_router, menu_document
+from app.controller.customers_controller import router as customers_router
+from app.controller.stock_controller import router as stock_router
+from app.controller.reports_controller import router as reports_router
+from app.controller.export_controller import router as export_router
+from app.controller.invoices_controller import router as invoices_router, product_matcher
+from app.models import SessionLocal, engine
+from app.pdf_render import pdf_renderer
+from app.stock_ledger import run_snapshot_job
+from app.stock_reservations import run_expiry_job
+from app.search import ensure_search_indexes
+from app.customer_identity import backfill_keys
 
 # -----------------------------------------------------------------------------
 # METADADOS DA API
@@ -31,6 +46,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],             # GET, POST, PATCH, etc.
     allow_headers=["*"],
+    # cursores de paginação (/orders, /stock, /stock/balance) e ETag dos GET condicionais:
+    # sem isso o navegador não deixa o frontend (outra origem) ler esses headers
+    expose_headers=["X-Next-After-Id", "ETag"],
 )
 
 # -----------------------------------------------------------------------------
@@ -40,12 +58,79 @@ app.add_middleware(
 async def health():
     return {"status": "ok"}
 
+# -----------------------------------------------------------------------------
+# CICLO DE VIDA (fila do webhook de pedidos, cardápio, snapshots e reservas de estoque)
+# -----------------------------------------------------------------------------
+# - Inicia o gravador em lote da fila do webhook (ORDERS_WEBHOOK_MODE=queue).
+# - No desligamento, grava o que ainda estiver na fila antes de sair.
+# - Reconstrução do cardápio (/menu) em background quando catálogo/estoque mudam.
+# - Índice de casamento de itens de nota: reindexa os produtos alterados no próximo uso.
+# - Snapshots periódicos do saldo de estoque (STOCK_SNAPSHOT_INTERVAL_MINUTES; 0 desliga).
+# - Expiração de reservas de estoque vencidas (STOCK_RESERVATION_SWEEP_SECONDS; 0 desliga).
+# - Pool de processos que gera os PDFs (comanda, nota de compra); PDF_RENDER_WORKERS processos.
+scheduler = BackgroundScheduler(daemon=True)
+
+@app.on_event("startup")
+async def start_background_workers():
+    await webhook_queue.start()
+    menu_document.start(engine)
+    product_matcher.watch(engine)
+    pdf_renderer.start()
+    interval = int(os.getenv("STOCK_SNAPSHOT_INTERVAL_MINUTES", "60"))
+    if interval > 0:
+        scheduler.add_job(
+            run_snapshot_job, "interval", minutes=interval, args=[SessionLocal],
+            id="stock_snapshots", replace_existing=True, coalesce=True, max_instances=1,
+        )
+    sweep = int(os.getenv("STOCK_RESERVATION_SWEEP_SECONDS", "60"))
+    if sweep > 0:
+        scheduler.add_job(
+            run_expiry_job, "interval", seconds=sweep, args=[SessionLocal],
+            id="stock_reservation_expiry", replace_existing=True, coalesce=True, max_instances=1,
+        )
+    if scheduler.get_jobs():
+        scheduler.start()
+
+# - Índices de busca textual (FTS5 no SQLite / trigram no Postgres), idempotente.
+@app.on_event("startup")
+def prepare_search_indexes():
+    try:
+        ensure_search_indexes(engine)
+    except Exception as e:
+        logging.getLogger("uvicorn.error").warning("Índices de busca não criados: %s", e)
+
+# - Chaves normalizadas de clientes gravados antes delas (document_key/phone_key/email_key), idempotente.
+@app.on_event("startup")
+def backfill_customer_keys():
+    try:
+        updated = backfill_keys(engine)
+    except Exception as e:
+        # busca exata cai na busca textual enquanto as chaves não existem; tenta de novo no próximo start
+        logging.getLogger("uvicorn.error").warning("Chaves de identidade de clientes não preenchidas: %s", e)
+        return
+    if updated:
+        logging.getLogger("uvicorn.error").info("Chaves de identidade preenchidas para %s clientes", updated)
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await webhook_queue.stop()
+    menu_document.stop()
+    pdf_renderer.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
 # -----------------------------------------------------------------------------
 # REGISTRO DOS ROUTERS
 # -----------------------------------------------------------------------------
 # - Agrupa as rotas do módulo de pedidos (Orders) sob o caminho raiz.
 # - Se tiver outros routers (ex.: catálogo, financeiro), inclua-os aqui.
 app.include_router(orders_router)
+app.include_router(catalog_router)
+app.include_router(stock_router)
+app.include_router(customers_router)
+app.include_router(reports_router)
+app.include_router(export_router)
+app.include_router(invoices_router)
 
 # -----------------------------------------------------------------------------
 # OBS: No Render, o processo é iniciado via Start Command:
@@ -0,0 +1,61 @@
+# tests/conftest.py
+# Fixtures comuns:
+# - banco SQLite temporário para a sessão inteira (DATABASE_URL precisa existir antes de importar app.models);
+# - um TestClient com os routers da API (sem os jobs de startup de main.py);
+# - SKUs únicos por teste: o banco é compartilhado, cada teste cria os próprios produtos.
+import itertools
+import os
+import tempfile
+
+import pytest
+
+_fd, _path = tempfile.mkstemp(suffix=".sqlite3")
+os.close(_fd)
+os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.controller import (  # noqa: E402
+    catalog_controller, customers_controller, invoices_controller, orders_controller, stock_controller,
+)
+from app.models import engine, init_db  # noqa: E402
+from app.search import ensure_search_indexes  # noqa: E402
+
+_sequence = itertools.count(1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    init_db()
+    ensure_search_indexes(engine)
+    yield engine
+    engine.dispose()
+    os.unlink(_path)
+
+
+@pytest.fixture(scope="session")
+def client():
+    app = FastAPI()
+    for module in (catalog_controller, customers_controller, invoices_controller, orders_controller,
+                   stock_controller):
+        app.include_router(module.router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def sku():
+    """Gera SKUs que nenhum outro teste usa: sku() -> "T0001", sku() -> "T0002"..."""
+    return lambda: f"T{next(_sequence):05d}"
+
+
+@pytest.fixture
+def make_product(client, sku):
+    def make(qty: float = 0.0, price: float = 10.0, cost: float = 3.0, **fields) -> dict:
+        payload = {"sku": sku(), "name": "Produto de teste", "price": price, "cost": cost, "initial_qty": qty}
+        payload.update(fields)
+        r = client.post("/products", json=payload)
+        assert r.status_code == 201, r.text
+        return r.json()
+
+    return make
@@ -0,0 +1,85 @@
+import time
+
+from sqlalchemy import event, update
+
+from app.catalog_cache import CatalogCache, etag_matches
+from app.models import SessionLocal, StockItem, engine
+
+
+def test_cache_serves_until_bump_and_keeps_etag_for_same_body():
+    cache = CatalogCache()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return b'{"a":1}'
+
+    first = cache.get_or_load("k", loader)
+    assert cache.get_or_load("k", loader) is first
+    cache.bump()
+    again = cache.get_or_load("k", loader)
+    assert len(loads) == 2
+    assert again.etag == first.etag  # mesmo corpo, mesmo ETag
+    assert cache.metrics()["hits"] == 1
+
+
+def test_load_racing_a_bump_is_not_stored():
+    cache = CatalogCache()
+
+    def stale_loader():
+        cache.bump()  # produto alterado enquanto a consulta rodava
+        return b"velho"
+
+    cache.get_or_load("k", stale_loader)
+    assert cache.get("k") is None
+
+
+def test_ttl_and_lru_bounds():
+    cache = CatalogCache(maxsize=2, ttl=0.05)
+    for key in ("a", "b", "c"):
+        cache.get_or_load(key, lambda: key.encode())
+    assert cache.get("a") is None and cache.get("c") is not None
+    time.sleep(0.06)
+    assert cache.get("c") is None
+
+
+def test_etag_matches():
+    assert etag_matches('"x"', '"x"')
+    assert etag_matches('"y", "x"', '"x"')
+    assert etag_matches('W/"x"', '"x"')
+    assert etag_matches("*", '"x"')
+    assert not etag_matches('"y"', '"x"')
+    assert not etag_matches(None, '"x"')
+
+
+def test_product_etag_changes_on_update(client, make_product):
+    product = make_product(qty=1)
+    url = f"/products/{product['id']}"
+    r = client.get(url)
+    etag = r.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    patch = {"sku": product["sku"], "name": "Renomeado", "price": 11}
+    assert client.patch(url, json=patch).status_code == 200
+    r = client.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["name"] == "Renomeado"
+    assert r.headers["ETag"] != etag
+
+
+def test_update_racing_a_stock_change_is_409(client, make_product):
+    product = make_product(qty=5)
+
+    def bump_stock_version(session, flush_context, instances):
+        with engine.begin() as conn:
+            conn.execute(update(StockItem.__table__).where(StockItem.__table__.c.product_id == product["id"])
+                         .values(version=StockItem.__table__.c.version + 1))
+
+    event.listen(SessionLocal, "before_flush", bump_stock_version)
+    try:
+        r = client.patch(f"/products/{product['id']}",
+                         json={"sku": product["sku"], "name": "x", "price": 1, "min_quantity": 2})
+    finally:
+        event.remove(SessionLocal, "before_flush", bump_stock_version)
+    assert r.status_code == 409
+    assert client.get(f"/products/{product['id']}").json()["name"] == product["name"]
@@ -0,0 +1,150 @@
+import io
+
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import insert, select
+
+from app.models import Product, StockItem, StockMovement, engine
+
+
+def _import(client, filename: str, content: bytes, **params):
+    return client.post("/products/import", params=params, files={"file": (filename, content)})
+
+
+def _csv(rows, sep=",", encoding="utf-8") -> bytes:
+    return "\n".join(sep.join(str(v) for v in row) for row in rows).encode(encoding)
+
+
+def _xlsx(rows) -> bytes:
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(list(row))
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _product(client, sku: str):
+    return next((p for p in client.get("/products", params={"search": sku}).json() if p["sku"] == sku), None)
+
+
+def test_csv_creates_then_updates(client, sku):
+    a, b = sku(), sku()
+    rows = [("sku", "name", "price", "initial_qty"), (a, "Pão de queijo", "4.5", "10"), (b, "Café", "6", "")]
+    r = _import(client, "produtos.csv", _csv(rows))
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert (body["processed"], body["created"], body["updated"], body["failed"]) == (2, 2, 0, 0)
+    assert body["errors"] == []
+
+    r = _import(client, "produtos.csv", _csv([("sku", "name", "price"), (a, "Pão de queijo", "5.0")]))
+    assert (r.json()["created"], r.json()["updated"]) == (0, 1)
+    assert _product(client, a)["price"] == 5.0
+
+
+def test_semicolon_and_decimal_comma(client, sku):
+    a = sku()
+    r = _import(client, "produtos.csv", _csv([("sku", "name", "price"), (a, "Bolo", "12,50")], sep=";"))
+    assert r.json()["created"] == 1, r.text
+    assert _product(client, a)["price"] == 12.5
+
+
+def test_latin1_csv_is_400_unless_encoding_given(client, sku):
+    a = sku()
+    content = _csv([("sku", "name", "price"), (a, "Açúcar refinado", "3")], encoding="latin-1")
+
+    r = _import(client, "excel.csv", content)
+    assert r.status_code == 400
+    assert "latin-1" in r.json()["detail"]
+
+    r = _import(client, "excel.csv", content, encoding="latin-1")
+    assert r.status_code == 200
+    assert _product(client, a)["name"] == "Açúcar refinado"
+
+
+def test_unknown_encoding_is_400(client):
+    assert _import(client, "x.csv", b"sku,name,price\n", encoding="nao-existe").status_code == 400
+
+
+def test_duplicate_sku_in_file_reports_error_and_keeps_last(client, sku):
+    a = sku()
+    rows = [("sku", "name", "price"), (a, "Primeira", "1"), (a, "Segunda", "2")]
+    body = _import(client, "dup.csv", _csv(rows)).json()
+    assert body["created"] == 1
+    assert body["errors"] == [{"row": 2, "sku": a, "error": "SKU repetido no arquivo (substituído pela linha 3)"}]
+    assert _product(client, a)["name"] == "Segunda"
+
+
+def test_invalid_rows_are_reported_and_others_saved(client, sku):
+    a, b = sku(), sku()
+    rows = [("sku", "name", "price"), (a, "Válido", "1"), (b, "Sem preço", "abc"), ("", "Sem SKU", "1")]
+    body = _import(client, "x.csv", _csv(rows)).json()
+    assert (body["processed"], body["created"], body["failed"]) == (3, 1, 2)
+    assert [e["row"] for e in body["errors"]] == [3, 4]
+    assert _product(client, b) is None
+
+
+@pytest.mark.parametrize("filename, content", [
+    ("x.csv", b"sku,description\nA,B\n"),
+    ("x.xlsx", _xlsx([("sku", "price"), ("A", 1)])),
+])
+def test_missing_required_columns_is_400(client, filename, content):
+    r = _import(client, filename, content)
+    assert r.status_code == 400
+    assert "name" in r.json()["detail"]
+
+
+def test_xlsx_import(client, sku):
+    a = sku()
+    r = _import(client, "planilha.xlsx", _xlsx([("SKU", "Name", "Price", "Active"), (a, "Suco", 7.25, "não")]))
+    assert r.json()["created"] == 1, r.text
+    product = _product(client, a)
+    assert (product["price"], product["active"]) == (7.25, False)
+
+
+def test_broken_xlsx_and_unknown_extension_are_400(client):
+    assert _import(client, "planilha.xlsx", b"isto nao e um zip").status_code == 400
+    assert _import(client, "planilha.ods", b"").status_code == 400
+
+
+def test_broken_encoding_mid_file_returns_partial_result(client, sku):
+    # o erro precisa cair depois da amostra do sniffer e do primeiro bloco decodificado (8 KB)
+    good = [sku() for _ in range(120)]
+    bad = sku()
+    rows = [("sku", "name", "price")] + [(s, "Produto " + "x" * 100, "1") for s in good]
+    content = _csv(rows) + f"\n{bad},Açúcar,1".encode("latin-1")
+    r = _import(client, "x.csv", content, chunk_size=50)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert "latin-1" in body["format_error"] and "interrompida" in body["format_error"]
+    assert body["created"] == body["processed"] > 0
+    assert _product(client, good[0]) is not None
+    assert _product(client, bad) is None
+
+
+def test_duplicate_sku_across_chunks_is_counted_once(client, sku):
+    a = sku()
+    fillers = [sku() for _ in range(50)]
+    rows = [("sku", "name", "price"), (a, "Primeira", "1")] + [(s, "Produto", "1") for s in fillers[:49]]
+    rows += [(a, "Segunda", "2")] + [(s, "Produto", "1") for s in fillers[49:]]
+    body = _import(client, "dup.csv", _csv(rows), chunk_size=50).json()
+    assert (body["processed"], body["created"], body["updated"], body["failed"]) == (52, 51, 0, 1)
+    assert body["errors"] == [{"row": 2, "sku": a, "error": "SKU repetido no arquivo (substituído pela linha 52)"}]
+    assert _product(client, a)["name"] == "Segunda"
+
+
+def test_existing_product_without_stock_item_gets_opening_movement(client, sku):
+    a = sku()
+    with engine.begin() as conn:
+        product_id = conn.execute(
+            insert(Product).values(sku=a, name="Sem estoque", price=1, active=True).returning(Product.id)
+        ).scalar_one()
+
+    body = _import(client, "x.csv", _csv([("sku", "name", "price", "initial_qty"), (a, "Sem estoque", "1", "7")])).json()
+    assert (body["created"], body["updated"]) == (0, 1)
+    with engine.connect() as conn:
+        assert conn.execute(select(StockItem.quantity).where(StockItem.product_id == product_id)).scalar_one() == 7
+        movements = conn.execute(
+            select(StockMovement.quantity, StockMovement.reason).where(StockMovement.product_id == product_id)
+        ).all()
+    assert movements == [(7, "Saldo inicial")]
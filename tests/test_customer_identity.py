@@ -0,0 +1,144 @@
+import itertools
+
+import pytest
+from sqlalchemy import event
+
+from app.customer_identity import document_key, email_key, key_prefix, phone_key
+from app.models import engine
+
+_numbers = itertools.count(1000)
+
+
+@pytest.mark.parametrize("raw, key", [
+    ("123.456.789-09", "12345678909"),
+    ("12345678909", "12345678909"),
+    ("23456789", None),                       # curto demais
+    ("345678909", "00345678909"),             # CPF que perdeu os zeros na planilha
+    ("12.345.678/0001-90", "12345678000190"),
+    ("2345678000190", "02345678000190"),      # CNPJ sem o zero à esquerda
+    ("123456789012345", None),
+    ("", None),
+    (None, None),
+])
+def test_document_key(raw, key):
+    assert document_key(raw) == key
+
+
+@pytest.mark.parametrize("raw, key", [
+    ("(11) 98765-4321", "11987654321"),
+    ("+55 11 98765-4321", "11987654321"),
+    ("5511987654321", "11987654321"),
+    ("011 98765 4321", "11987654321"),        # zero de tronco
+    ("3333-4444", "33334444"),
+    ("1234567", None),
+    ("abc", None),
+    (None, None),
+])
+def test_phone_key(raw, key):
+    assert phone_key(raw) == key
+
+
+@pytest.mark.parametrize("raw, key", [
+    (" Joao@Mail.COM ", "joao@mail.com"),
+    ("sem-arroba", None),
+    (None, None),
+])
+def test_email_key(raw, key):
+    assert email_key(raw) == key
+
+
+@pytest.fixture
+def customer(client):
+    def make(**fields) -> dict:
+        r = client.post("/customers", json={"name": "Cliente", **fields})
+        assert r.status_code == 201, r.text
+        return r.json()
+
+    return make
+
+
+def _unique_phone() -> tuple:
+    n = next(_numbers)
+    return f"(21) 9{n:04d}-{n:04d}", f"219{n:04d}{n:04d}"
+
+
+def test_lookup_by_any_phone_format(client, customer):
+    formatted, digits = _unique_phone()
+    created = customer(phone=formatted)
+    for variant in (digits, f"+55 {digits}", f"0{digits}"):
+        r = client.get("/customers/lookup", params={"phone": variant})
+        assert [c["id"] for c in r.json()] == [created["id"]]
+    assert client.get("/customers/lookup", params={"phone": "12"}).status_code == 422
+    assert client.get("/customers/lookup", params={"phone": digits, "email": "a@b.c"}).status_code == 422
+
+
+def test_update_refreshes_keys_and_lookup_cache(client, customer):
+    old, old_digits = _unique_phone()
+    new, new_digits = _unique_phone()
+    created = customer(phone=old)
+    assert client.get("/customers/lookup", params={"phone": old_digits}).json()
+    assert client.patch(f"/customers/{created['id']}", json={"phone": new}).status_code == 200
+    assert client.get("/customers/lookup", params={"phone": old_digits}).json() == []
+    assert [c["id"] for c in client.get("/customers/lookup", params={"phone": new_digits}).json()] == [created["id"]]
+
+
+def test_search_exact_and_partial_identity(client, customer):
+    n = next(_numbers)
+    document = f"987.654.{n % 1000:03d}-{n % 100:02d}"
+    formatted, digits = _unique_phone()
+    created = customer(name="Fulana Identidade", document=document, phone=formatted)
+
+    def found(term):
+        return created["id"] in [c["id"] for c in client.get("/customers", params={"search": term}).json()]
+
+    assert found(document)
+    assert found(digits)
+    assert found(formatted)
+    assert found(document[:7])      # começo do CPF
+    assert found(formatted[:9])     # começo do telefone: DDD + primeiros dígitos
+    assert not found(digits[-6:])   # final do telefone: a faixa indexada só cobre o começo
+    assert found("fulana")
+    assert not found(f"{n + 500:011d}")
+
+
+def test_identity_search_is_a_single_query(client, customer):
+    formatted, digits = _unique_phone()
+    created = customer(phone=formatted)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        ids = [c["id"] for c in client.get("/customers", params={"search": digits}).json()]
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert ids == [created["id"]]
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1
+
+
+@pytest.mark.parametrize("digits, expected", [
+    ("123", ("123", "124")),
+    ("129", ("129", "13")),
+    ("199", ("199", "2")),
+    ("999", ("999", None)),
+])
+def test_key_prefix_range(digits, expected):
+    compiled = key_prefix("phone", digits).compile(compile_kwargs={"literal_binds": True})
+    lower, upper = expected
+    assert f"customers.phone_key >= '{lower}'" in str(compiled)
+    assert (f"customers.phone_key < '{upper}'" in str(compiled)) == (upper is not None)
+
+
+def test_duplicates_are_grouped_across_keys(client, customer):
+    formatted, digits = _unique_phone()
+    email = f"dup{next(_numbers)}@mail.com"
+    a = customer(phone=formatted)
+    b = customer(phone=f"+55 {digits}", email=email)
+    c = customer(email=email.upper())
+
+    report = client.get("/customers/duplicates", params={"limit": 1000}).json()
+    group = next(g for g in report["results"] if a["id"] in g["customer_ids"])
+    assert group["customer_ids"] == sorted([a["id"], b["id"], c["id"]])
+    assert group["keys"] == {"phone": [digits], "email": [email]}
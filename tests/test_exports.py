@@ -0,0 +1,80 @@
+import csv
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+
+from app.controller import export_controller
+from app.exports import _csv_value
+
+
+@pytest.fixture(scope="module")
+def exports():
+    app = FastAPI()
+    app.include_router(export_controller.router)
+    return TestClient(app)
+
+
+def _csv_rows(r) -> list:
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("text/csv")
+    return list(csv.reader(io.StringIO(r.content.decode("utf-8-sig"))))
+
+
+def _xlsx_rows(r) -> list:
+    assert r.status_code == 200, r.text
+    ws = load_workbook(io.BytesIO(r.content), read_only=True).active
+    return [list(row) for row in ws.iter_rows(values_only=True)]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("=HYPERLINK(\"http://x\")", "'=HYPERLINK(\"http://x\")"),
+    ("+55 11 9999", "'+55 11 9999"),
+    ("-2+3", "'-2+3"),
+    ("@SUM(A1)", "'@SUM(A1)"),
+    ("\tcmd", "'\tcmd"),
+    ("\rcmd", "'\rcmd"),
+    ("Pão = bom", "Pão = bom"),
+    (-5.0, -5.0),  # número negativo continua número
+])
+def test_formula_prefixes_are_neutralized(value, expected):
+    assert _csv_value(value) == expected
+
+
+def test_products_csv_and_xlsx_contents(client, exports, make_product, sku):
+    code = sku()
+    product = make_product(qty=4, price=9.5, sku=code, name="=1+1")
+
+    header, *rows = _csv_rows(exports.get("/export/products"))
+    assert tuple(header) == export_controller.PRODUCT_COLUMNS
+    row = next(r for r in rows if r[1] == code)
+    assert row[0] == str(product["id"])
+    assert (row[2], row[4], row[8]) == ("'=1+1", "9.5", "4.0")
+
+    header, *rows = _xlsx_rows(exports.get("/export/products", params={"format": "xlsx"}))
+    assert tuple(header) == export_controller.PRODUCT_COLUMNS
+    row = next(r for r in rows if r[1] == code)
+    assert (row[2], row[4], row[6], row[8]) == ("'=1+1", 9.5, True, 4)
+
+
+def test_orders_csv_with_items(client, exports):
+    r = client.post("/orders/manual", json={
+        "customer_name": "@Cliente", "note": "-sem cebola",
+        "items": [{"sku": "A", "name": "Lanche", "qty": 2, "unit_price": 10},
+                  {"sku": "B", "name": "Suco", "qty": 1, "unit_price": 5}],
+    })
+    order_id = r.json()["id"]
+
+    header, *rows = _csv_rows(exports.get("/export/orders", params={"include_items": "true", "status": "CREATED"}))
+    mine = [dict(zip(header, row)) for row in rows if row[0] == str(order_id)]
+    assert [(m["item_sku"], m["item_qty"], m["item_total"]) for m in mine] == [("A", "2", "20.0"), ("B", "1", "5.0")]
+    assert (mine[0]["customer_name"], mine[0]["note"], mine[0]["total_amount"]) == ("'@Cliente", "'-sem cebola", "25.0")
+
+
+def test_export_period_is_validated(exports):
+    r = exports.get("/export/orders", params={"start": "2024-02-01T00:00:00", "end": "2024-01-01T00:00:00Z"})
+    assert r.status_code == 400
+    r = exports.get("/export/orders", params={"start": "2099-01-01T00:00:00"})
+    assert _csv_rows(r) == [list(export_controller.ORDER_COLUMNS)]
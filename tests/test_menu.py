@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, insert, update
+from sqlalchemy.orm import sessionmaker
+
+from app.menu import MenuDocument
+from app.models import Order, Product, engine
+
+
+@pytest.fixture
+def menu():
+    """MenuDocument observando um engine próprio (os eventos não vazam para os outros testes)."""
+    own = create_engine(engine.url)
+    doc = MenuDocument(sessionmaker(bind=own), debounce=0.01, refresh=60)
+    doc.watch(own)
+    yield doc
+    doc.stop()
+    own.dispose()
+
+
+def _wait(condition, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = condition()
+        if value:
+            return value
+        time.sleep(0.01)
+    raise AssertionError("condição não atendida a tempo")
+
+
+def _dirty(doc: MenuDocument) -> bool:
+    return doc._dirty.is_set()
+
+
+def test_marked_dirty_only_after_the_driver_commit(menu, sku):
+    seen_at_commit = []
+    event.listen(menu._watched, "commit", lambda conn: seen_at_commit.append(_dirty(menu)))
+
+    db = menu.session_factory()
+    try:
+        db.add(Product(sku=sku(), name="Novo", price=1, active=True))
+        db.flush()
+        assert not _dirty(menu)
+        db.commit()
+    finally:
+        db.close()
+
+    assert seen_at_commit == [False]  # ainda não confirmado no banco
+    assert _dirty(menu)
+
+
+def test_core_writes_rollbacks_and_other_tables(menu, sku):
+    with menu._watched.begin() as conn:
+        conn.execute(insert(Order.__table__).values(customer_name="x", total_amount=0, status="CREATED"))
+    assert not _dirty(menu)  # tabela fora do cardápio
+
+    with menu._watched.connect() as conn:
+        conn.execute(insert(Product.__table__).values(sku=sku(), name="Desfeito", price=1, active=True))
+        conn.rollback()
+    assert not _dirty(menu)
+
+    with menu._watched.begin() as conn:
+        conn.execute(update(Product.__table__).where(Product.__table__.c.id == -1).values(price=2))
+    assert _dirty(menu)
+
+
+def test_background_rebuild_sees_committed_product(menu, sku):
+    code = sku()
+    menu.start()
+    version = _wait(lambda: menu.version)
+
+    db = menu.session_factory()
+    try:
+        db.add(Product(sku=code, name="Recém-criado", price=3, active=True))
+        db.commit()
+    finally:
+        db.close()
+
+    _wait(lambda: menu.version > version)
+    skus = [p["sku"] for p in json.loads(menu.body)["uncategorized"]]
+    assert code in skus
+
+
+def test_menu_endpoint_etag(client):
+    r = client.get("/menu")
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert "categories" in r.json()
+    assert client.get("/menu", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/menu", headers={"If-None-Match": '"outro"'}).status_code == 200
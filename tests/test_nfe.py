@@ -0,0 +1,113 @@
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.models import PurchaseInvoice, StockItem, StockMovement, engine
+
+
+def _nfe(number: str, lines, supplier: str = "12345678000190", series: str = "1") -> bytes:
+    dets = "".join(
+        f'<det nItem="{i}"><prod><cProd>{code}</cProd><cEAN>SEM GTIN</cEAN><xProd>Item {code}</xProd>'
+        f"<uCom>UN</uCom><qCom>{qty:.4f}</qCom><vUnCom>{price:.4f}</vUnCom><vProd>{qty * price:.2f}</vProd>"
+        f"</prod></det>"
+        for i, (code, qty, price) in enumerate(lines, start=1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe><infNFe Id="NFe35">'
+        f"<ide><nNF>{number}</nNF>{f'<serie>{series}</serie>' if series else ''}<dhEmi>2024-01-10T10:00:00-03:00</dhEmi></ide>"
+        f"<emit><CNPJ>{supplier}</CNPJ><xNome>Laticínios SA</xNome></emit>{dets}"
+        "<total><ICMSTot><vNF>1.00</vNF></ICMSTot></total></infNFe></NFe></nfeProc>"
+    ).encode()
+
+
+def _post(client, content: bytes):
+    return client.post("/invoices/nfe", files={"file": ("nota.xml", content, "application/xml")})
+
+
+def _quantity(product_id: int) -> float:
+    with engine.connect() as conn:
+        return conn.execute(select(StockItem.quantity).where(StockItem.product_id == product_id)).scalar_one()
+
+
+def _purchases(product_id: int) -> int:
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.count()).select_from(StockMovement).where(StockMovement.product_id == product_id)
+        ).scalar_one()
+
+
+def test_import_creates_invoice_and_stock_entries(client, make_product, sku):
+    product = make_product(qty=1)
+    unknown = sku()
+    r = _post(client, _nfe(sku(), [(product["sku"], 2, 10.5), (unknown, 1, 3)]))
+    assert r.status_code == 201, r.text
+    body = r.json()
+    assert body["duplicate"] is False
+    assert (body["items"], body["matched"], body["unmatched"]) == (2, 1, [unknown])
+    assert _quantity(product["id"]) == 3
+
+
+def test_resend_is_200_duplicate_and_writes_nothing(client, make_product, sku):
+    product = make_product(qty=0)
+    content = _nfe(sku(), [(product["sku"], 5, 2)])
+    first = _post(client, content)
+    assert first.status_code == 201
+    movements = _purchases(product["id"])
+
+    again = _post(client, content)
+    assert again.status_code == 200
+    assert again.json()["duplicate"] is True
+    assert again.json()["invoice_id"] == first.json()["invoice_id"]
+    assert _quantity(product["id"]) == 5
+    assert _purchases(product["id"]) == movements
+
+
+def test_same_number_from_other_series_or_supplier_is_new(client, make_product, sku):
+    product = make_product(qty=0)
+    number = sku()
+    assert _post(client, _nfe(number, [(product["sku"], 1, 1)])).status_code == 201
+    assert _post(client, _nfe(number, [(product["sku"], 1, 1)], series="2")).status_code == 201
+    assert _post(client, _nfe(number, [(product["sku"], 1, 1)], supplier="98765432000110")).status_code == 201
+    with engine.connect() as conn:
+        assert conn.execute(
+            select(func.count()).select_from(PurchaseInvoice).where(PurchaseInvoice.number == number)
+        ).scalar_one() == 3
+    assert _quantity(product["id"]) == 3
+
+
+def test_invalid_xml_is_400_and_rolls_back(client, sku):
+    assert _post(client, b"<nfeProc><NFe>").status_code == 400
+    assert _post(client, b"<?xml version='1.0'?><outro/>").status_code == 400
+    number = sku()
+    # o 1º item é válido; o erro no 2º desfaz a nota inteira
+    broken = _nfe(number, [("X", 1, 1), ("Y", 2, 1)]).replace(b"<qCom>2.0000</qCom>", b"<qCom>dois</qCom>")
+    r = _post(client, broken)
+    assert r.status_code == 400
+    assert "qCom" in r.json()["detail"]
+    with engine.connect() as conn:
+        assert conn.execute(select(PurchaseInvoice.id).where(PurchaseInvoice.number == number)).first() is None
+
+
+def test_invoice_without_series_is_deduplicated(client, make_product, sku):
+    product = make_product(qty=0)
+    content = _nfe(sku(), [(product["sku"], 2, 1)], series=None)
+    first = _post(client, content)
+    assert first.status_code == 201, first.text
+
+    again = _post(client, content)
+    assert (again.status_code, again.json()["invoice_id"]) == (200, first.json()["invoice_id"])
+    assert _quantity(product["id"]) == 2
+
+
+def test_unique_key_treats_missing_series_and_document_as_values(sku):
+    number = sku()
+    row = {"supplier_name": "Sem CNPJ", "supplier_document": None, "number": number, "series": None,
+           "total_amount": 0}
+    with engine.begin() as conn:
+        conn.execute(insert(PurchaseInvoice.__table__).values(**row))
+        # outro emitente sem documento pode repetir número e série
+        conn.execute(insert(PurchaseInvoice.__table__).values(**row).values(supplier_name="Outro"))
+    with pytest.raises(IntegrityError):
+        with engine.begin() as conn:
+            conn.execute(insert(PurchaseInvoice.__table__).values(**row))
@@ -0,0 +1,53 @@
+import pytest
+
+from app.normalizers import NormalizationError, get_normalizer
+
+
+def test_generic_fallbacks_and_zero_price():
+    order = get_normalizer(None).normalize({
+        "orderId": 77,
+        "customer": {"name": "Ana"},
+        "orderItems": [
+            {"code": "A", "description": "Pão", "quantity": "2", "unit_price": 0, "price": 9},
+            {"sku": "B", "name": "", "qty": 3.0, "unitPrice": 1.5},
+        ],
+    })
+    assert order["external_code"] == "77"
+    assert order["customer_name"] == "Ana"
+    assert order["items"] == [
+        {"sku": "A", "name": "Pão", "qty": 2, "unit_price": 0.0},  # 0 é preço válido: não cai em "price"
+        {"sku": "B", "name": "Item", "qty": 3, "unit_price": 1.5},
+    ]
+    assert order["total"] == 4.5
+
+
+def test_ifood_mapping():
+    order = get_normalizer("iFood").normalize({
+        "id": "abc", "customer": {"name": "Bia"}, "extraInfo": "sem cebola",
+        "items": [{"externalCode": "X1", "id": "uuid", "name": "Lanche", "quantity": 1, "unitPrice": 20}],
+    })
+    assert (order["external_code"], order["note"]) == ("abc", "sem cebola")
+    assert order["items"][0]["sku"] == "X1"
+
+
+@pytest.mark.parametrize("item", [
+    {"sku": "A", "qty": 2.7},
+    {"sku": "A", "qty": "2.5"},
+    {"sku": "A", "qty": ""},
+    {"sku": "A", "qty": 0},
+    {"sku": "A", "qty": 1, "unit_price": "grátis"},
+    {"sku": "", "qty": 1},
+    {"qty": 1},
+    "A",
+])
+def test_invalid_item_is_422(item):
+    with pytest.raises(NormalizationError) as exc:
+        get_normalizer("generic").normalize({"items": [item]})
+    assert exc.value.status_code == 422
+
+
+@pytest.mark.parametrize("payload", [[], {"items": []}, {"items": {"sku": "A"}}])
+def test_payload_without_items_is_400(payload):
+    with pytest.raises(NormalizationError) as exc:
+        get_normalizer("generic").normalize(payload)
+    assert exc.value.status_code == 400
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+from app.controller import orders_controller
+from app.controller.orders_controller import _sse_format
+from app.order_events import OrderEventBus
+
+
+def test_subscriber_receives_events_published_from_other_threads():
+    bus = OrderEventBus()
+
+    async def scenario():
+        sub = bus.subscribe()
+        worker = threading.Thread(target=bus.publish, args=("order.created", {"order_id": 1}))
+        worker.start()
+        event = await asyncio.wait_for(sub.queue.get(), timeout=2)
+        worker.join()
+        bus.unsubscribe(sub)
+        return event
+
+    assert asyncio.run(scenario()) == {"id": 1, "event": "order.created", "data": {"order_id": 1}}
+    assert bus.metrics()["subscribers"] == 0
+
+
+def test_resume_from_last_event_id_and_reset_outside_history():
+    bus = OrderEventBus(history=3)
+    for n in range(5):
+        bus.publish("order.status_changed", {"order_id": n})  # histórico: ids 3, 4, 5
+
+    async def backlog(last_event_id):
+        sub = bus.subscribe(last_event_id)
+        bus.unsubscribe(sub)
+        return [(e["id"], e["event"]) for e in sub.backlog]
+
+    assert asyncio.run(backlog(3)) == [(4, "order.status_changed"), (5, "order.status_changed")]
+    assert asyncio.run(backlog(5)) == []
+    assert asyncio.run(backlog(1))[0] == (1, "reset")      # anteriores ao histórico se perderam
+    assert asyncio.run(backlog(99)) == [(99, "reset")]     # processo reiniciado
+
+
+def test_slow_client_is_dropped_with_sentinel():
+    bus = OrderEventBus(client_buffer=2)
+
+    async def scenario():
+        sub = bus.subscribe()
+        for n in range(3):
+            bus.publish("order.created", {"order_id": n})
+        return sub
+
+    sub = asyncio.run(scenario())
+    assert sub.dropped
+    assert sub.queue.get_nowait() is None
+    assert bus.metrics() == {"subscribers": 0, "published": 3, "dropped_clients": 1, "last_event_id": 3}
+
+
+def test_order_endpoints_publish_created_and_status_changed(client):
+    bus = orders_controller.order_events
+    since = bus.metrics()["last_event_id"]
+    r = client.post("/orders/manual", json={
+        "customer_name": "Tela da cozinha", "items": [{"sku": "FORA-DO-CATALOGO", "name": "x", "qty": 2, "unit_price": 3}],
+    })
+    order_id = r.json()["id"]
+    assert client.patch(f"/orders/{order_id}/status", json={"status": "CONFIRMED"}).status_code == 200
+
+    async def backlog():
+        sub = bus.subscribe(since)
+        bus.unsubscribe(sub)
+        return [e for e in sub.backlog if e["data"].get("order_id") == order_id]
+
+    created, changed = asyncio.run(backlog())
+    assert created["event"] == "order.created"
+    assert (created["data"]["total_amount"], created["data"]["items_count"]) == (6, 1)
+    assert changed["data"] == {"order_id": order_id, "from": "CREATED", "to": "CONFIRMED"}
+    assert _sse_format(changed) == (
+        f"id: {changed['id']}\nevent: order.status_changed\n"
+        f'data: {{"order_id": {order_id}, "from": "CREATED", "to": "CONFIRMED"}}\n\n'
+    )
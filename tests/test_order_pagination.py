@@ -0,0 +1,55 @@
+from fastapi.testclient import TestClient
+
+
+def _create(client, n: int) -> list:
+    ids = []
+    for i in range(n):
+        r = client.post("/orders/manual", json={
+            "customer_name": f"Página {i}", "items": [{"sku": "FORA-DO-CATALOGO", "name": "x", "qty": 1, "unit_price": 1}],
+        })
+        assert r.status_code == 201, r.text
+        ids.append(r.json()["id"])
+    return ids
+
+
+def test_keyset_cursor_walks_every_order_once(client):
+    created = _create(client, 5)
+    seen, after_id, pages = [], None, 0
+    while True:
+        params = {"limit": 2, "include_items": "false"}
+        if after_id is not None:
+            params["after_id"] = after_id
+        r = client.get("/orders", params=params)
+        assert r.status_code == 200
+        page = [o["id"] for o in r.json()]
+        seen += page
+        pages += 1
+        after_id = r.headers.get("X-Next-After-Id")
+        if after_id is None:
+            assert len(page) < 2  # última página: incompleta (ou vazia)
+            break
+        assert int(after_id) == page[-1]
+
+    assert seen == sorted(seen, reverse=True)  # mais recente primeiro, sem repetição
+    assert len(seen) == len(set(seen))
+    assert set(created) <= set(seen)
+    assert pages >= 3
+
+
+def test_page_with_items_and_status_filter(client):
+    [order_id] = _create(client, 1)
+    r = client.get("/orders", params={"limit": 1, "status_eq": "CREATED"})
+    [order] = r.json()
+    assert order["id"] == order_id
+    assert order["items"][0]["sku"] == "FORA-DO-CATALOGO"
+    assert r.headers["X-Next-After-Id"] == str(order_id)
+
+
+def test_cursor_header_is_exposed_to_the_frontend_origin():
+    import main
+
+    origin = main.ALLOWED_ORIGINS[0]
+    r = TestClient(main.app).get("/health", headers={"Origin": origin})
+    assert r.headers["access-control-allow-origin"] == origin
+    exposed = {h.strip().lower() for h in r.headers["access-control-expose-headers"].split(",")}
+    assert {"x-next-after-id", "etag"} <= exposed
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from app.order_queue import OrderIngestQueue, QueueNotRunning
+
+
+class Sink:
+    def __init__(self, fail: int = 0, lost: int = 0):
+        self.batches = []
+        self.fail = fail  # quantas chamadas levantam exceção antes de gravar
+        self.lost = lost
+
+    def __call__(self, batch):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("banco fora do ar")
+        self.batches.append([o["n"] for o in batch])
+        return self.lost
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_batches_by_size_and_drains_on_stop():
+    sink = Sink()
+
+    async def scenario():
+        queue = OrderIngestQueue(sink, batch_size=2, flush_interval=5)
+        await queue.start()
+        for n in range(5):
+            queue.enqueue({"n": n})
+        await queue.stop()
+        return queue.metrics()
+
+    metrics = _run(scenario())
+    assert sink.batches == [[0, 1], [2, 3], [4]]
+    assert (metrics["accepted"], metrics["committed"], metrics["batches"], metrics["depth"]) == (5, 5, 3, 0)
+
+
+def test_flushes_after_interval_without_waiting_for_a_full_batch():
+    sink = Sink()
+
+    async def scenario():
+        queue = OrderIngestQueue(sink, batch_size=50, flush_interval=0.05)
+        await queue.start()
+        queue.enqueue({"n": 1})
+        await asyncio.sleep(0.3)
+        flushed = list(sink.batches)
+        await queue.stop()
+        return flushed
+
+    assert _run(scenario()) == [[1]]
+
+
+def test_full_queue_and_stopped_queue_reject():
+    async def scenario():
+        queue = OrderIngestQueue(Sink(), maxsize=1, batch_size=1, flush_interval=5)
+        with pytest.raises(QueueNotRunning):
+            queue.enqueue({"n": 0})
+        await queue.start()
+        queue.enqueue({"n": 1})
+        with pytest.raises(asyncio.QueueFull):
+            queue.enqueue({"n": 2})  # o gravador ainda não rodou: a fila (1) está cheia
+        await queue.stop()
+        return queue.metrics()
+
+    metrics = _run(scenario())
+    assert (metrics["accepted"], metrics["rejected"], metrics["committed"]) == (1, 1, 1)
+
+
+def test_lost_orders_reported_by_sink_count_as_failed():
+    async def scenario():
+        queue = OrderIngestQueue(Sink(lost=1), batch_size=3, flush_interval=5)
+        await queue.start()
+        for n in range(3):
+            queue.enqueue({"n": n})
+        await queue.stop()
+        return queue.metrics()
+
+    metrics = _run(scenario())
+    assert (metrics["committed"], metrics["failed"]) == (2, 1)
+
+
+def test_sink_error_is_retried_with_backoff():
+    sink = Sink(fail=2)
+    dropped = []
+
+    async def scenario():
+        queue = OrderIngestQueue(sink, batch_size=2, flush_interval=5, retries=3, retry_backoff=0.01,
+                                 on_drop=dropped.append)
+        await queue.start()
+        queue.enqueue({"n": 1})
+        queue.enqueue({"n": 2})
+        await queue.stop()
+        return queue.metrics()
+
+    metrics = _run(scenario())
+    assert sink.batches == [[1, 2]]
+    assert (metrics["committed"], metrics["retried"], metrics["dropped"]) == (2, 2, 0)
+    assert dropped == []
+
+
+def test_batch_is_handed_to_on_drop_after_last_retry():
+    dropped = []
+
+    async def scenario():
+        queue = OrderIngestQueue(Sink(fail=10), batch_size=2, flush_interval=5, retries=1, retry_backoff=0.01,
+                                 on_drop=dropped.append)
+        await queue.start()
+        queue.enqueue({"n": 1})
+        queue.enqueue({"n": 2})
+        await queue.stop()
+        return queue.metrics()
+
+    metrics = _run(scenario())
+    assert dropped == [[{"n": 1}, {"n": 2}]]
+    assert (metrics["committed"], metrics["failed"], metrics["dropped"], metrics["retried"]) == (0, 2, 2, 1)
+
+
+def test_dropped_webhook_batch_releases_pending_codes():
+    from app.controller.orders_controller import _release_dropped, order_index
+
+    assert order_index.mark_pending("FILA-DESCARTADA")
+    assert not order_index.mark_pending("FILA-DESCARTADA")  # em voo: reentrega vira 202 duplicate
+    _release_dropped([{"external_code": "FILA-DESCARTADA"}, {"external_code": None}])
+    assert order_index.mark_pending("FILA-DESCARTADA")  # a reentrega volta a ser aceita
+    order_index.release_pending("FILA-DESCARTADA")
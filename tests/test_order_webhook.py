@@ -0,0 +1,71 @@
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.controller import orders_controller
+from app.controller.orders_controller import order_index, webhook_queue
+
+
+@pytest.fixture
+def queued_client(monkeypatch):
+    """API com ORDERS_WEBHOOK_MODE=queue e a fila rodando no loop do TestClient."""
+    monkeypatch.setattr(orders_controller, "WEBHOOK_MODE", "queue")
+    monkeypatch.setattr(webhook_queue, "flush_interval", 0.05)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await webhook_queue.start()
+        yield
+        await webhook_queue.stop()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(orders_controller.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def _payload(code: str, sku: str) -> dict:
+    return {"orderId": code, "customer": {"name": "Cliente"},
+            "items": [{"sku": sku, "name": "Lanche", "qty": 1, "unit_price": 10}]}
+
+
+def _wait_saved(code: str) -> int:
+    for _ in range(100):
+        order_id = order_index.cached(code)
+        if order_id is not None:
+            return order_id
+        time.sleep(0.02)
+    raise AssertionError(f"pedido {code} não foi gravado pela fila")
+
+
+def test_queued_webhook_acks_and_dedups_after_restart(queued_client, make_product):
+    product = make_product(qty=5)
+    code = f"FILA-{product['sku']}"
+
+    r = queued_client.post("/orders/webhook", json=_payload(code, product["sku"]))
+    assert r.status_code == 202
+    assert r.json()["queued"] is True
+    order_id = _wait_saved(code)
+
+    # LRU vazio (restart): a reentrega acha o pedido no banco e não volta para a fila
+    order_index.clear()
+    accepted = webhook_queue.accepted
+    r = queued_client.post("/orders/webhook", json=_payload(code, product["sku"]))
+    assert r.status_code == 200
+    assert r.json() == {"ok": True, "order_id": order_id, "duplicate": True}
+    assert webhook_queue.accepted == accepted
+
+
+def test_redelivery_while_pending_is_202_duplicate(queued_client, make_product):
+    product = make_product(qty=5)
+    code = f"PENDENTE-{product['sku']}"
+    assert order_index.mark_pending(code)  # primeira entrega ainda na fila
+    try:
+        r = queued_client.post("/orders/webhook", json=_payload(code, product["sku"]))
+        assert r.status_code == 202
+        assert r.json()["duplicate"] is True
+    finally:
+        order_index.release_pending(code)
@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import event, update
+
+from app.models import Order, SessionLocal, StockItem, engine
+
+
+def _stock(product_id: int) -> tuple:
+    with engine.connect() as conn:
+        return conn.execute(
+            StockItem.__table__.select().with_only_columns(StockItem.quantity, StockItem.reserved)
+            .where(StockItem.product_id == product_id)
+        ).one()
+
+
+def _order(client, product: dict, qty: int) -> dict:
+    r = client.post("/orders/manual", json={
+        "customer_name": "Cliente",
+        "items": [{"sku": product["sku"], "name": product["name"], "qty": qty, "unit_price": product["price"]}],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def _patch(client, order_id: int, status: str):
+    return client.patch(f"/orders/{order_id}/status", json={"status": status})
+
+
+def test_confirm_consumes_reservation_and_deducts_stock(client, make_product):
+    product = make_product(qty=10)
+    order = _order(client, product, 3)
+    assert _stock(product["id"]) == (10, 3)
+
+    r = _patch(client, order["id"], "CONFIRMED")
+    assert r.status_code == 200, r.text
+    assert r.json()["status"] == "CONFIRMED"
+    assert r.json()["missing_skus"] == []
+    assert _stock(product["id"]) == (7, 0)
+
+
+@pytest.mark.parametrize("path, target", [
+    ((), "READY"),
+    ((), "FULFILLED"),
+    (("CONFIRMED",), "CONFIRMED"),
+    (("CONFIRMED", "IN_PREPARATION", "READY"), "CANCELLED"),
+    (("CANCELLED",), "CONFIRMED"),
+])
+def test_invalid_transition_is_409(client, make_product, path, target):
+    order = _order(client, make_product(qty=5), 1)
+    for status in path:
+        assert _patch(client, order["id"], status).status_code == 200
+    r = _patch(client, order["id"], target)
+    assert r.status_code == 409
+    assert "Transição inválida" in r.json()["detail"]
+
+
+def test_full_lifecycle(client, make_product):
+    order = _order(client, make_product(qty=5), 1)
+    for status in ("CONFIRMED", "IN_PREPARATION", "READY", "FULFILLED"):
+        r = _patch(client, order["id"], status)
+        assert r.status_code == 200, r.text
+        assert r.json()["status"] == status
+
+
+def test_unknown_order_is_404(client):
+    assert _patch(client, 10 ** 9, "CONFIRMED").status_code == 404
+
+
+def test_concurrent_status_change_is_409_and_stock_untouched(client, make_product):
+    product = make_product(qty=10)
+    order = _order(client, product, 4)
+
+    # outra requisição cancela o pedido entre a leitura do status e o UPDATE com compare-and-set
+    def cancel_first(state):
+        if state.is_update:
+            with engine.begin() as conn:
+                conn.execute(update(Order.__table__).where(Order.__table__.c.id == order["id"])
+                             .values(status="CANCELLED"))
+
+    event.listen(SessionLocal, "do_orm_execute", cancel_first)
+    try:
+        r = _patch(client, order["id"], "CONFIRMED")
+    finally:
+        event.remove(SessionLocal, "do_orm_execute", cancel_first)
+
+    assert r.status_code == 409
+    assert "outra requisição" in r.json()["detail"]
+    assert _stock(product["id"])[0] == 10  # sem baixa
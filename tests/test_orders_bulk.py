@@ -0,0 +1,51 @@
+from app.controller import orders_controller
+
+
+def _order(code=None, sku="FORA-DO-CATALOGO", qty=1) -> dict:
+    return {"external_code": code, "customer_name": "Lote",
+            "items": [{"sku": sku, "name": "x", "qty": qty, "unit_price": 2}]}
+
+
+def test_bulk_reports_created_duplicate_and_invalid(client, sku):
+    code, other = f"LOTE-{sku()}", f"LOTE-{sku()}"
+    r = client.post("/orders/bulk", params={"chunk_size": 2}, json=[
+        _order(code), _order(other), _order(code), {"customer_name": "sem itens"}, _order(other),
+    ])
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert (body["created"], body["duplicate"], body["invalid"]) == (2, 2, 1)
+    first, second, repeated, invalid, across_chunks = body["results"]
+    assert [x["index"] for x in body["results"]] == [0, 1, 2, 3, 4]
+    assert repeated["status"] == "duplicate" and repeated["order_id"] == first["order_id"]
+    assert across_chunks["status"] == "duplicate" and across_chunks["order_id"] == second["order_id"]
+    assert invalid["status"] == "invalid" and invalid["error"]
+
+    again = client.post("/orders/bulk", json=[_order(code)]).json()
+    assert again["results"][0] == {**first, "status": "duplicate"}
+
+
+def test_repeat_of_an_unsaved_order_is_not_a_duplicate(client, sku, monkeypatch):
+    code = f"LOTE-{sku()}"
+    assert client.post("/orders/bulk", json=[_order(code)]).json()["created"] == 1
+
+    # o SELECT prévio não vê o código (corrida) e a releitura após a violação também não
+    monkeypatch.setattr(orders_controller.order_index, "existing", lambda db, codes: {})
+    monkeypatch.setattr(orders_controller.order_index, "lookup", lambda db, c: None)
+    body = client.post("/orders/bulk", json=[_order(code), _order(code)]).json()
+    first, repeated = body["results"]
+    assert first["status"] == "invalid"
+    assert repeated["status"] == "invalid" and repeated["order_id"] is None
+    assert "não foi gravado" in repeated["error"]
+
+
+def test_oversized_bulk_is_413(client, monkeypatch):
+    monkeypatch.setattr(orders_controller, "BULK_MAX_ORDERS", 2)
+    assert client.post("/orders/bulk", json=[_order()] * 3).status_code == 413
+
+    monkeypatch.setattr(orders_controller, "BULK_MAX_BYTES", 64)
+    assert client.post("/orders/bulk", json=[_order()]).status_code == 413
+
+
+def test_bulk_body_must_be_a_json_list(client):
+    assert client.post("/orders/bulk", content=b"{", headers={"Content-Type": "application/json"}).status_code == 400
+    assert client.post("/orders/bulk", json={"orders": []}).status_code == 422
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert
+
+from app.controller import invoices_controller, orders_controller
+from app.models import PurchaseInvoice, PurchaseInvoiceItem, engine
+from app.pdf_render import PdfRenderer
+
+
+@pytest.fixture(scope="module")
+def renderer(tmp_path_factory):
+    pdf = PdfRenderer(str(tmp_path_factory.mktemp("pdf-cache")), workers=1, max_concurrent=2)
+    yield pdf
+    pdf.stop()
+
+
+@pytest.fixture
+def pdfs(renderer, monkeypatch):
+    for module in (orders_controller, invoices_controller):
+        monkeypatch.setattr(module, "pdf_renderer", renderer)
+    return renderer
+
+
+def _order(client, note: str = "") -> int:
+    r = client.post("/orders/manual", json={
+        "customer_name": "Comanda", "note": note,
+        "items": [{"sku": "FORA-DO-CATALOGO", "name": "X-Salada", "qty": 2, "unit_price": 18}],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def test_ticket_is_rendered_once_and_revalidated_with_etag(client, pdfs):
+    order_id = _order(client, note="sem cebola")
+    url = f"/orders/{order_id}/ticket.pdf"
+
+    r = client.get(url)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/pdf"
+    assert r.content.startswith(b"%PDF")
+    etag = r.headers["ETag"]
+    renders = pdfs.renders
+
+    for header in (etag, f'"outro", {etag}', f"W/{etag}", "*"):
+        again = client.get(url, headers={"If-None-Match": header})
+        assert again.status_code == 304, header
+        assert again.headers["ETag"] == etag
+        assert again.content == b""
+    assert client.get(url, headers={"If-None-Match": '"outro"'}).status_code == 200
+
+    # status não é impresso: reimpressão após mudar o status sai do mesmo arquivo
+    assert client.patch(f"/orders/{order_id}/status", json={"status": "CANCELLED"}).status_code == 200
+    assert client.get(url).headers["ETag"] == etag
+    assert pdfs.renders == renders
+
+
+def test_different_orders_have_different_etags(client, pdfs):
+    first = client.get(f"/orders/{_order(client)}/ticket.pdf").headers["ETag"]
+    second = client.get(f"/orders/{_order(client)}/ticket.pdf").headers["ETag"]
+    assert first != second
+
+
+def test_concurrent_requests_share_one_render(pdfs):
+    doc = {"id": 10 ** 6, "external_code": None, "customer_name": "Simultâneo", "note": None,
+           "total_amount": 1.0, "created_at": None, "items": [{"sku": "A", "name": "Café", "qty": 1}]}
+
+    async def scenario():
+        return await asyncio.gather(*[pdfs.get("order-ticket", doc) for _ in range(5)])
+
+    renders = pdfs.renders
+    results = asyncio.run(scenario())
+    assert len({key for _, key in results}) == 1
+    assert pdfs.renders == renders + 1
+
+
+def test_invoice_pdf_etag(client, pdfs, sku):
+    with engine.begin() as conn:
+        invoice_id = conn.execute(insert(PurchaseInvoice).values(
+            supplier_name="Laticínios SA", supplier_document="12345678000190", number=sku(), series="1",
+            total_amount=21.0,
+        ).returning(PurchaseInvoice.id)).scalar_one()
+        conn.execute(insert(PurchaseInvoiceItem).values(
+            invoice_id=invoice_id, sku="QJ-1", name="Queijo", qty=3, unit="KG", unit_price=7, total=21,
+        ))
+
+    r = client.get(f"/invoices/{invoice_id}/pdf")
+    assert r.status_code == 200
+    assert r.content.startswith(b"%PDF")
+    assert client.get(f"/invoices/{invoice_id}/pdf", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+
+def test_unknown_documents_are_404(client, pdfs):
+    assert client.get(f"/orders/{10 ** 9}/ticket.pdf").status_code == 404
+    assert client.get(f"/invoices/{10 ** 9}/pdf").status_code == 404
@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import event
+
+from app.models import SessionLocal, engine
+from app.product_matcher import ProductMatcher, normalize_code, supplier_key
+
+
+@pytest.fixture
+def matcher():
+    m = ProductMatcher(SessionLocal, refresh=3600)
+    m.watch(engine)
+    yield m
+    for name, fn in (("after_execute", m._after_execute), ("commit", m._after_commit),
+                     ("rollback", m._after_rollback)):
+        event.remove(engine, name, fn)
+
+
+def _match(matcher, code, name, ean=None, supplier="12345678000190"):
+    [result] = matcher.match(supplier, [(code, name, ean)])
+    return result
+
+
+def test_normalizers():
+    assert normalize_code(" ab-12.3/x ") == "AB123X"
+    assert normalize_code(None) == ""
+    assert supplier_key("12345678000190", "Qualquer") == "12345678000190"
+    assert supplier_key(None, "Distribuidora  São João LTDA") == supplier_key(None, "distribuidora sao joao ltda")
+
+
+def test_sku_and_ean_match_ignore_punctuation_and_case(matcher, make_product, sku):
+    product = make_product()
+    by_sku = _match(matcher, product["sku"].lower(), "descrição qualquer")
+    assert (by_sku["product_id"], by_sku["method"], by_sku["score"]) == (product["id"], "sku", 1.0)
+
+    ean = make_product(sku=f"789{sku()[1:]:0>10}")  # produto cadastrado pelo EAN
+    by_ean = _match(matcher, "COD-FORNECEDOR-X", "descrição qualquer", ean=f"{ean['sku'][:3]}.{ean['sku'][3:]}")
+    assert (by_ean["product_id"], by_ean["method"]) == (ean["id"], "ean")
+
+
+def test_learned_alias_is_per_supplier(matcher, make_product):
+    product = make_product()
+    matcher.sync()  # a carga inicial recarrega os apelidos do banco; learn entra por cima dela
+    matcher.learn("11111111000111", "forn-77", product["id"])
+    alias = _match(matcher, "FORN77", "descrição qualquer", supplier="11111111000111")
+    assert (alias["product_id"], alias["method"]) == (product["id"], "alias")
+    other = _match(matcher, "FORN77", "descrição qualquer", supplier="22222222000122")
+    assert other["product_id"] is None
+
+
+def test_name_match_only_suggests_candidates(matcher, make_product):
+    target = make_product(name="Queijo Minas Frescal Tirolez 500g")
+    make_product(name="Queijo Prato Fatiado Tirolez 150g")
+    result = _match(matcher, "SEM-CADASTRO-1", "QUEIJO MINAS FRESC. TIROLEZ 500G")
+    assert result["product_id"] is None
+    assert result["method"] == "name"
+    assert result["candidates"][0]["product_id"] == target["id"]
+    assert result["score"] == result["candidates"][0]["score"] < 1.0
+    assert len(result["candidates"]) <= 3
+
+    nothing = _match(matcher, "SEM-CADASTRO-2", "xqzw vkjh")
+    assert (nothing["method"], nothing["candidates"]) == (None, [])
+
+
+def test_committed_product_changes_reindex_only_what_changed(client, matcher, make_product):
+    product = make_product(name="Goiabada Cascão Predilecta")
+    matcher.match("x", [("SEM-CADASTRO", "goiabada cascao", None)])  # primeira carga completa
+    assert not matcher.metrics()["dirty"]
+    reindexed = matcher.reindexed
+
+    r = client.patch(f"/products/{product['id']}", json={"sku": product["sku"], "name": "Marmelada Predilecta",
+                                                         "price": product["price"]})
+    assert r.status_code == 200, r.text
+    assert matcher.metrics()["dirty"]
+
+    result = _match(matcher, "SEM-CADASTRO", "MARMELADA PREDILECTA")
+    assert result["candidates"][0]["product_id"] == product["id"]
+    assert matcher.reindexed - reindexed == 2  # sai a versão antiga, entra a nova
+    assert not matcher.metrics()["dirty"]
+
+
+def test_match_endpoint(client, matcher, make_product, monkeypatch):
+    from app.controller import invoices_controller
+
+    monkeypatch.setattr(invoices_controller, "product_matcher", matcher)  # o do módulo não observa o engine aqui
+    product = make_product()
+    r = client.post("/invoices/match", json={
+        "supplier_name": "Fornecedor Teste",
+        "lines": [{"code": product["sku"], "name": "x"}, {"code": "NAO-EXISTE", "name": "xqzw vkjh"}],
+    })
+    assert r.status_code == 200, r.text
+    found, missing = r.json()
+    assert (found["code"], found["product_id"], found["method"]) == (product["sku"], product["id"], "sku")
+    assert (missing["product_id"], missing["method"], missing["candidates"]) == (None, None, [])
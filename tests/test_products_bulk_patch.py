@@ -0,0 +1,38 @@
+from app.controller import catalog_controller
+
+
+def _get(client, product_id: int) -> dict:
+    return client.get(f"/products/{product_id}").json()
+
+
+def test_patches_only_the_fields_sent(client, make_product, sku):
+    a, b = make_product(price=10, cost=4), make_product(price=20, cost=8)
+    missing = sku()
+    r = client.patch("/products/bulk", json=[
+        {"sku": a["sku"], "price": 12.5},
+        {"sku": b["sku"], "active": False, "cost": None},  # null explícito limpa o custo
+        {"sku": missing, "price": 1},
+    ])
+    assert r.status_code == 200, r.text
+    assert r.json() == {"updated": 2, "not_found": [missing]}
+
+    a, b = _get(client, a["id"]), _get(client, b["id"])
+    assert (a["price"], a["cost"], a["active"]) == (12.5, 4, True)
+    assert (b["price"], b["cost"], b["active"]) == (20, None, False)
+
+
+def test_last_occurrence_wins_and_chunks_are_split(client, make_product, monkeypatch):
+    monkeypatch.setattr(catalog_controller, "BULK_PATCH_CHUNK", 2)
+    products = [make_product(price=1) for _ in range(5)]
+    items = [{"sku": p["sku"], "price": 2 + i} for i, p in enumerate(products)]
+    items.append({"sku": products[0]["sku"], "price": 99})
+    assert client.patch("/products/bulk", json=items).json()["updated"] == 5
+    assert [_get(client, p["id"])["price"] for p in products] == [99, 3, 4, 5, 6]
+
+
+def test_null_price_or_active_is_422(client, make_product):
+    product = make_product(price=3)
+    for item in ({"sku": product["sku"], "price": None}, {"sku": product["sku"], "active": None}):
+        assert client.patch("/products/bulk", json=[item]).status_code == 422
+    assert client.patch("/products/bulk", json=[]).status_code == 422
+    assert _get(client, product["id"])["price"] == 3
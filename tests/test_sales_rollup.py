@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import sales_rollup
+from app.controller import reports_controller
+
+
+@pytest.fixture(scope="module")
+def reports():
+    app = FastAPI()
+    app.include_router(reports_controller.router)
+    return TestClient(app)
+
+
+def _order(client, *items) -> int:
+    r = client.post("/orders/manual", json={
+        "customer_name": "Relatório",
+        "items": [{"sku": s, "name": "x", "qty": q, "unit_price": p} for s, q, p in items],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def _status(client, order_id: int, *statuses) -> None:
+    for s in statuses:
+        assert client.patch(f"/orders/{order_id}/status", json={"status": s}).status_code == 200
+
+
+def _totals(reports, **params) -> tuple:
+    body = reports.get("/reports/sales", params=params).json()
+    return body["total_qty"], body["total_revenue"], body["total_orders"]
+
+
+def test_bucket_start_is_utc():
+    ts = datetime(2024, 1, 10, 23, 30, tzinfo=timezone(timedelta(hours=-3)))
+    assert sales_rollup.bucket_start(ts, "day") == datetime(2024, 1, 11)
+    assert sales_rollup.bucket_start(ts, "hour") == datetime(2024, 1, 11, 2)
+
+
+def test_accumulate_counts_each_order_once_in_the_total_row():
+    acc = {}
+    created = datetime(2024, 1, 1, 12, 15)
+    sales_rollup._accumulate(acc, created, [("A", 2, 10.0), ("B", 1, 4.0), ("A", 1, 5.0)], +1)
+    day = ("day", datetime(2024, 1, 1))
+    assert acc[day + ("A",)] == [3.0, 15.0, 1]
+    assert acc[day + (sales_rollup.TOTAL_SKU,)] == [4.0, 19.0, 1]
+    assert acc[("hour", datetime(2024, 1, 1, 12), "B")] == [1.0, 4.0, 1]
+
+
+def test_confirm_adds_and_cancel_removes(client, reports, sku):
+    a, b = sku(), sku()
+    order_id = _order(client, (a, 2, 5), (b, 1, 3))
+    assert _totals(reports, sku=a) == (0, 0, 0)  # CREATED ainda não é venda
+
+    _status(client, order_id, "CONFIRMED", "IN_PREPARATION")
+    assert _totals(reports, sku=a) == (2, 10, 1)
+    assert _totals(reports, sku=b, granularity="hour") == (1, 3, 1)
+    rows = reports.get("/reports/sales", params={"group_by": "sku", "sku": a}).json()["rows"]
+    assert [(r["sku"], r["qty"]) for r in rows] == [(a, 2)]
+
+    _status(client, order_id, "CANCELLED")
+    assert _totals(reports, sku=a) == (0, 0, 0)
+
+
+def test_rebuild_matches_incremental_rollups(client, reports, sku):
+    a = sku()
+    _status(client, _order(client, (a, 1, 7)), "CONFIRMED")
+    _status(client, _order(client, (a, 3, 7)), "CONFIRMED", "CANCELLED")
+    before = reports.get("/reports/sales", params={"group_by": "period_sku"}).json()
+
+    r = reports.post("/reports/sales/rebuild")
+    assert r.status_code == 200 and r.json()["orders"] >= 1
+    assert reports.get("/reports/sales", params={"group_by": "period_sku"}).json() == before
+    assert _totals(reports, sku=a) == (1, 7, 1)
+
+
+def test_period_filter(reports):
+    r = reports.get("/reports/sales", params={"start": "2024-02-01T00:00:00", "end": "2024-01-01T00:00:00Z"})
+    assert r.status_code == 400
+    assert _totals(reports, start="2099-01-01T00:00:00") == (0, 0, 0)
@@ -0,0 +1,59 @@
+import pytest
+
+from app import search
+from app.models import engine
+
+
+def _found(client, term: str) -> list:
+    r = client.get("/products", params={"search": term})
+    assert r.status_code == 200
+    return [p["id"] for p in r.json()]
+
+
+def test_words_match_word_starts_without_accents(client, make_product, sku):
+    code = sku()
+    product = make_product(sku=code, name=f"Pão de Queijo Mineiro {code}")
+    for term in (f"pao {code}", f"PÃO queij {code}", f"{code} min", code.lower()):
+        assert product["id"] in _found(client, term), term
+    assert product["id"] not in _found(client, f"ueijo {code}")      # meio de palavra: não casa
+    assert product["id"] not in _found(client, f"pao doce {code}")   # todas as palavras precisam casar
+
+
+def test_index_follows_updates(client, make_product, sku):
+    code = sku()
+    product = make_product(sku=code, name=f"Bolo de Fubá {code}")
+    r = client.patch(f"/products/{product['id']}", json={
+        "sku": code, "name": f"Torta Salgada {code}", "price": product["price"],
+    })
+    assert r.status_code == 200, r.text
+    assert product["id"] in _found(client, f"torta {code}")
+    assert product["id"] not in _found(client, f"bolo {code}")
+
+
+def test_customers_by_email_and_name(client):
+    r = client.post("/customers", json={"name": "Joana Buscável", "email": "joana.fts@mail.com"})
+    created = r.json()["id"]
+    for term in ("joana buscavel", "joana.fts"):
+        ids = [c["id"] for c in client.get("/customers", params={"search": term}).json()]
+        assert created in ids, term
+
+
+@pytest.fixture
+def without_fts(monkeypatch):
+    """Simula o startup sem as tabelas FTS (ensure_search_indexes falhou)."""
+    monkeypatch.setitem(search._fts_ready, (str(engine.url), "products"), False)
+
+
+def test_missing_fts_table_falls_back_to_ilike(client, make_product, sku, without_fts):
+    code = sku()
+    product = make_product(sku=code, name=f"Café Torrado {code}")
+    assert product["id"] in _found(client, f"orrado {code}")  # ilike: substring do nome
+    assert product["id"] not in _found(client, f"cafe {code}")  # ilike não ignora acentos
+
+
+def test_missing_table_is_detected_once(monkeypatch):
+    key = (str(engine.url), "no_such_table")
+    monkeypatch.delitem(search._fts_ready, key, raising=False)
+    assert search._fts_available(engine, "no_such_table") is False
+    assert search._fts_ready[key] is False
+    assert search._fts_available(engine, "products") is True
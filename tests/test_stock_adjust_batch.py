@@ -0,0 +1,77 @@
+from sqlalchemy import select
+
+from app.models import StockItem, StockMovement, engine
+
+
+def _quantity(product_id: int) -> float:
+    with engine.connect() as conn:
+        return conn.execute(select(StockItem.quantity).where(StockItem.product_id == product_id)).scalar_one()
+
+
+def _movements(reference: str) -> list:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(StockMovement.product_id, StockMovement.movement_type, StockMovement.quantity,
+                   StockMovement.unit_price, StockMovement.reason)
+            .where(StockMovement.reference == reference)
+            .order_by(StockMovement.id)
+        ).all()
+    return [(pid, mt.value, qty, price, reason) for pid, mt, qty, price, reason in rows]
+
+
+def test_batch_sums_deltas_per_item_and_writes_one_movement_per_entry(client, make_product):
+    a, b = make_product(qty=10), make_product(qty=2)
+    r = client.post("/stock/adjust/batch", json=[
+        {"sku": a["sku"], "movement_type": "IN", "quantity": 5, "unit_price": 4.5, "reference": "INV-LOTE-1"},
+        {"sku": b["sku"], "movement_type": "ADJUST", "quantity": -2, "reason": "contagem", "reference": "INV-LOTE-1"},
+        {"sku": a["sku"], "movement_type": "OUT", "quantity": 3, "reference": "INV-LOTE-1"},
+        {"sku": a["sku"], "movement_type": "ADJUST", "quantity": 0.5, "reference": "INV-LOTE-1"},
+    ])
+    assert r.status_code == 201, r.text
+    body = r.json()
+    assert body["movements"] == 4
+    assert body["items"] == sorted([
+        {"product_id": a["id"], "sku": a["sku"], "quantity": 12.5},
+        {"product_id": b["id"], "sku": b["sku"], "quantity": 0.0},
+    ], key=lambda item: item["product_id"])
+    assert (_quantity(a["id"]), _quantity(b["id"])) == (12.5, 0.0)
+    assert _movements("INV-LOTE-1") == [
+        (a["id"], "IN", 5.0, 4.5, None),
+        (b["id"], "ADJUST", -2.0, None, "contagem"),
+        (a["id"], "OUT", 3.0, None, None),
+        (a["id"], "ADJUST", 0.5, None, None),
+    ]
+
+
+def test_any_invalid_entry_rejects_the_whole_batch(client, make_product):
+    product = make_product(qty=10)
+    r = client.post("/stock/adjust/batch", json=[
+        {"sku": product["sku"], "movement_type": "IN", "quantity": 5, "reference": "INV-LOTE-2"},
+        {"sku": "SKU-QUE-NAO-EXISTE", "movement_type": "IN", "quantity": 1, "reference": "INV-LOTE-2"},
+        {"sku": product["sku"], "movement_type": "OUT", "quantity": 0, "reference": "INV-LOTE-2"},
+        {"sku": product["sku"], "movement_type": "ADJUST", "quantity": 0, "reference": "INV-LOTE-2"},
+    ])
+    assert r.status_code == 422
+    detail = r.json()["detail"]
+    assert detail["message"] == "Lote rejeitado"
+    assert [(e["index"], e["sku"]) for e in detail["errors"]] == [
+        (1, "SKU-QUE-NAO-EXISTE"), (2, product["sku"]), (3, product["sku"]),
+    ]
+    assert detail["errors"][0]["error"] == "Produto não encontrado pelo SKU"
+    assert "maior que zero" in detail["errors"][1]["error"]
+    assert "diferente de zero" in detail["errors"][2]["error"]
+    # tudo ou nada: a entrada válida também não foi aplicada
+    assert _quantity(product["id"]) == 10
+    assert _movements("INV-LOTE-2") == []
+
+
+def test_payload_validation(client, make_product):
+    product = make_product(qty=1)
+    assert client.post("/stock/adjust/batch", json=[]).status_code == 422
+    assert client.post("/stock/adjust/batch", json=[
+        {"sku": product["sku"], "movement_type": "TRANSFER", "quantity": 1},
+    ]).status_code == 422
+    assert client.post("/stock/adjust/batch", json=[
+        {"sku": "", "movement_type": "IN", "quantity": 1},
+    ]).status_code == 422
+    assert _quantity(product["id"]) == 1
@@ -0,0 +1,89 @@
+import pytest
+
+from app.models import MovementType
+from app.stock_cost import CostBook, order_id_from_reference
+
+
+def test_weighted_average_and_fifo_exit():
+    book = CostBook(1)
+    book.apply(MovementType.IN_, 10, 4.0)
+    book.apply(MovementType.IN_, 20, 5.0)
+
+    cost_avg, cost_fifo = book.apply(MovementType.OUT, 15, None)
+
+    assert cost_avg == pytest.approx(15 * 140 / 30)   # 70: custo médio 4,666...
+    assert cost_fifo == pytest.approx(10 * 4 + 5 * 5)  # 65: camada de 4 inteira + 5 da de 5
+    assert book.quantity == pytest.approx(15)
+    assert book.fifo_value == pytest.approx(15 * 5)
+    assert [layer[1:] for layer in book.layers] == [[pytest.approx(15), 5.0]]
+
+
+def test_entry_without_price_uses_current_average():
+    book = CostBook(1, fallback=2.0)
+    assert book.apply(MovementType.IN_, 10, None) == (20.0, 20.0)  # sem custo apurado: Product.cost
+    book.apply(MovementType.IN_, 10, 4.0)
+    value, _ = book.apply(MovementType.ADJUST, 5, None)
+    assert value == pytest.approx(5 * 3.0)
+
+
+def test_negative_adjust_exits_like_out():
+    book = CostBook(1)
+    book.apply(MovementType.IN_, 4, 2.0)
+    book.apply(MovementType.IN_, 4, 6.0)
+    assert book.apply(MovementType.ADJUST, -6, None) == (pytest.approx(24.0), pytest.approx(8 + 12))
+
+
+def test_exit_below_zero_is_covered_by_next_entry():
+    book = CostBook(1)
+    book.apply(MovementType.IN_, 2, 3.0)
+    cost_avg, cost_fifo = book.apply(MovementType.OUT, 5, None)
+    assert (cost_avg, cost_fifo) == (pytest.approx(15.0), pytest.approx(6 + 3 * 3.0))  # déficit ao custo médio
+    assert book.quantity == pytest.approx(-3)
+
+    book.apply(MovementType.IN_, 10, 7.0)
+    assert book.quantity == pytest.approx(7)
+    assert [layer[1:] for layer in book.layers] == [[pytest.approx(7), 7.0]]  # 3 cobrem o déficit
+    assert book.fifo_value == pytest.approx(49.0)
+
+
+@pytest.mark.parametrize("reference, expected", [
+    ("ORDER 42", 42), ("ORDER x", None), ("NF 1/1", None), (None, None),
+])
+def test_order_id_from_reference(reference, expected):
+    assert order_id_from_reference(reference) == expected
+
+
+def _buy(client, sku: str, qty: float, unit_price: float) -> dict:
+    r = client.post("/stock/adjust", json={"sku": sku, "movement_type": "IN", "quantity": qty,
+                                          "unit_price": unit_price})
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def test_order_cost_recorded_on_confirmation_and_kept_by_rebuild(client, make_product):
+    product = make_product(qty=0, price=10.0)
+    assert _buy(client, product["sku"], 10, 4.0)["cost_fifo"] == pytest.approx(40.0)
+    _buy(client, product["sku"], 20, 5.0)
+
+    r = client.post("/orders/manual", json={
+        "customer_name": "Cliente",
+        "items": [{"sku": product["sku"], "name": "x", "qty": 15, "unit_price": 10.0}],
+    })
+    order_id = r.json()["id"]
+    assert client.patch(f"/orders/{order_id}/status", json={"status": "CONFIRMED"}).status_code == 200
+
+    cost = client.get(f"/orders/{order_id}/cost").json()
+    assert cost["cost_avg"] == pytest.approx(70.0)
+    assert cost["cost_fifo"] == pytest.approx(65.0)
+    assert cost["margin_fifo"] == pytest.approx(150.0 - 65.0)
+
+    [row] = client.get("/stock/costs", params={"sku": product["sku"]}).json()
+    assert row["quantity"] == pytest.approx(15)
+    assert row["avg_cost"] == pytest.approx(140 / 30)
+    assert row["fifo_cost"] == pytest.approx(5.0)
+
+    # o rebuild a partir do histórico chega no mesmo estado que o custeio incremental
+    assert client.post("/stock/costs/rebuild").status_code == 200
+    assert client.get(f"/orders/{order_id}/cost").json()["cost_fifo"] == pytest.approx(65.0)
+    [rebuilt] = client.get("/stock/costs", params={"sku": product["sku"]}).json()
+    assert rebuilt == {k: pytest.approx(v) if isinstance(v, float) else v for k, v in row.items()}
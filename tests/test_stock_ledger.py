@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import stock_ledger
+from app.models import MovementType, SessionLocal, StockMovement, engine
+
+
+def _movements(product_id: int, *moves) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(StockMovement.__table__), [
+            {"product_id": product_id, "movement_type": kind, "quantity": qty, "created_at": at}
+            for kind, qty, at in moves
+        ])
+
+
+def _balance(client, sku: str, at: str) -> dict:
+    r = client.get("/stock/balance", params={"at": at, "sku": sku})
+    assert r.status_code == 200, r.text
+    [row] = r.json()
+    return row
+
+
+def test_point_in_time_balance_with_and_without_snapshot(client, make_product):
+    product = make_product(qty=0)
+    _movements(
+        product["id"],
+        (MovementType.IN_, 10, datetime(2020, 1, 1, 10)),
+        (MovementType.OUT, 3, datetime(2020, 1, 1, 11)),
+        (MovementType.ADJUST, -2, datetime(2020, 1, 2, 9)),
+        (MovementType.IN_, 4, datetime(2020, 1, 3, 9)),
+    )
+    sku = product["sku"]
+    assert _balance(client, sku, "2019-12-31T00:00:00")["quantity"] == 0
+    assert _balance(client, sku, "2020-01-01T10:30:00")["quantity"] == 10
+    assert _balance(client, sku, "2020-01-01T08:30:00-03:00")["quantity"] == 7  # 11:30 UTC
+
+    # snapshot consolidado até 2020-01-02 12:00 (now - SNAPSHOT_LAG)
+    db = SessionLocal()
+    try:
+        assert stock_ledger.take_snapshots(db, now=datetime(2020, 1, 2, 12) + stock_ledger.SNAPSHOT_LAG) >= 1
+        db.commit()
+    finally:
+        db.close()
+
+    row = _balance(client, sku, "2020-01-05T00:00:00")
+    assert (row["quantity"], row["movements"]) == (9, 1)  # snapshot (5) + 1 movimento depois dele
+    assert row["snapshot_at"].startswith("2020-01-02T12:00:00")
+    row = _balance(client, sku, "2020-01-02T10:00:00")  # antes do snapshot: soma desde o início
+    assert (row["quantity"], row["snapshot_at"]) == (5, None)
+
+
+def test_verify_reports_counter_drift(client, make_product):
+    product = make_product(qty=6)
+    assert client.get("/stock/verify", params={"sku": product["sku"]}).json()["mismatches"] == []
+
+    _movements(product["id"], (MovementType.OUT, 1, datetime(2020, 1, 1)))  # movimento sem baixa no contador
+    [mismatch] = client.get("/stock/verify", params={"sku": product["sku"]}).json()["mismatches"]
+    assert (mismatch["counter"], mismatch["ledger"], mismatch["difference"]) == (6, 5, 1)
+    assert client.get("/stock/verify", params={"sku": "NAO-EXISTE"}).status_code == 404
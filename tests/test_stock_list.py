@@ -0,0 +1,58 @@
+from sqlalchemy import event
+
+from app.models import engine
+
+
+def _walk(client, **params) -> list:
+    seen, after_id = [], None
+    while True:
+        query = dict(params, limit=3)
+        if after_id is not None:
+            query["after_id"] = after_id
+        r = client.get("/stock", params=query)
+        assert r.status_code == 200
+        seen += r.json()
+        after_id = r.headers.get("X-Next-After-Id")
+        if after_id is None:
+            return seen
+
+
+def test_keyset_pages_cover_every_item_once(client, make_product):
+    created = {make_product(qty=n)["id"] for n in range(1, 5)}
+    ids = [row["product_id"] for row in _walk(client)]
+    assert ids == sorted(set(ids))
+    assert created <= set(ids)
+
+
+def test_below_min_and_available(client, make_product, sku):
+    low = make_product(qty=1, min_quantity=5)
+    ok = make_product(qty=9, min_quantity=5)
+    ids = {row["product_id"] for row in _walk(client, below_min="true")}
+    assert low["id"] in ids and ok["id"] not in ids
+
+    r = client.post("/orders/manual", json={
+        "customer_name": "Reserva", "items": [{"sku": ok["sku"], "name": "x", "qty": 4, "unit_price": 1}],
+    })
+    assert r.status_code == 201
+    row = next(row for row in _walk(client) if row["product_id"] == ok["id"])
+    assert (row["quantity"], row["reserved"], row["available"]) == (9, 4, 5)
+
+
+def test_search_is_a_single_query(client, make_product, sku):
+    code = sku()
+    product = make_product(qty=2, sku=code, name=f"Farinha de Mandioca {code}")
+    client.get("/stock", params={"search": code})  # a primeira busca verifica uma vez se o FTS existe
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        r = client.get("/stock", params={"search": f"mandioca {code}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert [row["product_id"] for row in r.json()] == [product["id"]]
+    assert r.json()[0]["sku"] == code
+    assert "X-Next-After-Id" not in r.headers
+    assert len(statements) == 1
@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event, select
+
+from app.models import StockItem, engine
+
+
+@contextmanager
+def _stock_updates():
+    """Ids de StockItem na ordem em que cada UPDATE executemany de stock_items os recebeu."""
+    batches = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if executemany and statement.startswith("UPDATE stock_items"):
+            batches.append([p[-1] for p in parameters])  # b_id é o último parâmetro (WHERE)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield batches
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def _stock_item_ids(*products) -> list:
+    with engine.connect() as conn:
+        return [conn.execute(select(StockItem.id).where(StockItem.product_id == p["id"])).scalar_one()
+                for p in products]
+
+
+def _order(client, *products) -> int:
+    r = client.post("/orders/manual", json={
+        "customer_name": "Cliente",
+        "items": [{"sku": p["sku"], "name": "x", "qty": 1, "unit_price": 1} for p in products],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["id"]
+
+
+def test_stock_rows_are_updated_in_id_order(client, make_product):
+    first, second, third = make_product(qty=5), make_product(qty=5), make_product(qty=5)
+    expected = sorted(_stock_item_ids(first, second, third))
+
+    # itens do pedido em ordem inversa de id: baixa e soltura da reserva continuam em ordem de id
+    confirmed = _order(client, third, first, second)
+    cancelled = _order(client, second, third, first)
+    with _stock_updates() as batches:
+        assert client.patch(f"/orders/{confirmed}/status", json={"status": "CONFIRMED"}).status_code == 200
+        assert client.patch(f"/orders/{cancelled}/status", json={"status": "CANCELLED"}).status_code == 200
+        r = client.post("/stock/adjust/batch", json=[
+            {"sku": p["sku"], "movement_type": "IN", "quantity": 1} for p in (third, second, first)
+        ])
+        assert r.status_code == 201, r.text
+
+    assert len(batches) == 4  # consumo da reserva, baixa, soltura da reserva, lote de ajuste
+    assert all(batch == expected for batch in batches)
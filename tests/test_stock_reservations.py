@@ -0,0 +1,62 @@
+from app.controller import orders_controller
+from app.models import Order, SessionLocal, StockItem, engine
+from app.stock_reservations import ReservationConflict
+
+
+def _stock(product_id: int) -> tuple:
+    with engine.connect() as conn:
+        return conn.execute(
+            StockItem.__table__.select().with_only_columns(StockItem.quantity, StockItem.reserved)
+            .where(StockItem.product_id == product_id)
+        ).one()
+
+
+def _order(client, product: dict, qty: int) -> dict:
+    r = client.post("/orders/manual", json={
+        "customer_name": "Cliente",
+        "items": [{"sku": product["sku"], "name": product["name"], "qty": qty, "unit_price": product["price"]}],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+def _patch(client, order_id: int, status: str):
+    return client.patch(f"/orders/{order_id}/status", json={"status": status})
+
+
+def test_cancel_releases_reservation(client, make_product):
+    product = make_product(qty=5)
+    order = _order(client, product, 2)
+    assert _patch(client, order["id"], "CANCELLED").status_code == 200
+    assert _stock(product["id"]) == (5, 0)
+
+
+def test_order_without_stock_is_409(client, make_product):
+    product = make_product(qty=1)
+    r = client.post("/orders/manual", json={
+        "customer_name": "Cliente",
+        "items": [{"sku": product["sku"], "name": "x", "qty": 2, "unit_price": 1}],
+    })
+    assert r.status_code == 409
+    assert r.json()["detail"]["items"][0]["sku"] == product["sku"]
+
+
+def test_queued_order_is_saved_without_reservation_on_conflict(make_product, sku, monkeypatch):
+    product = make_product(qty=10)
+
+    def contested(*args, **kwargs):
+        raise ReservationConflict("disputa")
+
+    monkeypatch.setattr(orders_controller, "reserve_items", contested)
+    code = sku()
+    data = {"external_code": code, "customer_name": "Fila", "note": None, "total": 10.0,
+            "items": [{"sku": product["sku"], "name": "x", "qty": 1, "unit_price": 10.0}]}
+
+    assert orders_controller._save_webhook_batch([data]) == 0
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.external_code == code).one()
+        assert order.status == "CREATED"
+        assert "Sem reserva" in order.note
+    finally:
+        db.close()